@@ -1,44 +1,94 @@
+import os
+import threading
+
 from flask import Flask
 from flask_cors import CORS
 import src.api.mqtt_api
 import src.api.socket_api
 from src.model.oauth_manager import OAuthManager
-from src.utils.secrets import (MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, HOST, PORT, SECRET_KEY)
+from src.utils.secrets import (MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_CLIENT_ID, HOST, PORT,
+                               DEBUG, USE_RELOADER, SECRET_KEY, PRELOAD_MODELS, METRICS_ENABLED, INFERENCE_WORKERS)
 from src.config.protocol import socketio, mqtt, oauth
 from src.api.auth_api import auth_blueprint
 from src.api.device_api import device_blueprint
+from src.api.metrics_api import metrics_blueprint
 from src.middleware.error_handle import error_handle_blueprint
 from src.api.user_api import user_blueprint
 from src.config.scheduler import start_scheduler
+from src.service.mqtt_service import shared_topic, subscribe_device_topics
+from src.service.record_service import ensure_indexes
+from src.service.rollup_service import ensure_rollup_indexes
+from src.service.user_service import disease_inference
+from src.service.water_service import ensure_water_indexes
+from src.utils.predict import models
 
 
-app = Flask(__name__)
+def create_app() -> Flask:
+    """
+    Creates the Flask app, registers the blueprints and binds the Socket.IO and MQTT extensions to it.
 
-CORS(app)
-app.secret_key = SECRET_KEY
-app.config['MQTT_BROKER_URL'] = MQTT_BROKER
-app.config['MQTT_BROKER_PORT'] = MQTT_PORT
-app.config['MQTT_USERNAME'] = MQTT_USERNAME
-app.config['MQTT_PASSWORD'] = MQTT_PASSWORD
-app.config['MQTT_REFRESH_TIME'] = 1.0
-app.config['MQTT_TLS_ENABLED'] = False
+    :return: Flask: The app.
+    """
+    app = Flask(__name__)
 
-oauth_manager = OAuthManager(app)
-app.oauth_manager = oauth_manager
+    CORS(app)
+    app.secret_key = SECRET_KEY
+    app.config['MQTT_BROKER_URL'] = MQTT_BROKER
+    app.config['MQTT_BROKER_PORT'] = MQTT_PORT
+    app.config['MQTT_USERNAME'] = MQTT_USERNAME
+    app.config['MQTT_PASSWORD'] = MQTT_PASSWORD
+    # Each worker needs its own client ID, the broker disconnects a client when another one connects with the same ID
+    app.config['MQTT_CLIENT_ID'] = f'{MQTT_CLIENT_ID}-{os.getpid()}' if MQTT_CLIENT_ID else ''
+    app.config['MQTT_REFRESH_TIME'] = 1.0
+    app.config['MQTT_TLS_ENABLED'] = False
 
-app.register_blueprint(error_handle_blueprint)
-app.register_blueprint(auth_blueprint)
-app.register_blueprint(device_blueprint)
-app.register_blueprint(user_blueprint)
+    oauth_manager = OAuthManager(app)
+    app.oauth_manager = oauth_manager
 
-# Bind socketio to the app
-socketio.init_app(app)
-mqtt.init_app(app)
+    app.register_blueprint(error_handle_blueprint)
+    app.register_blueprint(auth_blueprint)
+    app.register_blueprint(device_blueprint)
+    app.register_blueprint(user_blueprint)
+    if METRICS_ENABLED:
+        app.register_blueprint(metrics_blueprint)
 
-mqtt.subscribe('register')
-start_scheduler()
+    # Bind socketio to the app
+    socketio.init_app(app)
+    mqtt.init_app(app)
+    return app
 
-# Run the app
-if __name__ == '__main__':
+
+def start_services() -> None:
+    """
+    Creates the indexes, subscribes to the device topics, starts the scheduler and the inference workers.
+
+    :return: None
+    """
+    ensure_indexes()
+    ensure_rollup_indexes()
+    ensure_water_indexes()
+    mqtt.subscribe(shared_topic('register'))
+    subscribe_device_topics()
+    start_scheduler()
+
+    if PRELOAD_MODELS:
+        # Warm the models in the background so the first prediction does not pay the load time.
+        # The disease model is loaded by the inference workers, unless predictions run in this process
+        preload = ['irrigation'] if INFERENCE_WORKERS > 0 else None
+        threading.Thread(target=models.preload, args=(preload,), name='model_preload', daemon=True).start()
+        disease_inference.start()
+
+
+def main():
+    app = create_app()
+    # The reloader serves the app from a child process, the parent only watches the files and starts nothing
+    if not USE_RELOADER or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
     # app.run(debug=True, host=HOST, port=PORT)
-    socketio.run(app, host=HOST, port=PORT, use_reloader=True, debug=True)
+    socketio.run(app, host=HOST, port=PORT, use_reloader=USE_RELOADER, debug=DEBUG)
+
+
+# The inference and report workers are spawned processes that import this module again as __mp_main__,
+# the server is only started when the file is run
+if __name__ == '__main__':
+    main()
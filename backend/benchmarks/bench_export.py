@@ -0,0 +1,22 @@
+from src.utils.excel_manager import export_to_excel, export_to_excel_devices
+
+
+def test_export_to_excel(benchmark, stores):
+    # Writing the whole history of a device to a workbook
+    water_usage = [{'date': f'2024/{month:02d}', 'water_used': float(month)} for month in range(1, 13)]
+
+    benchmark.pedantic(export_to_excel, args=({'record': stores['records'], 'water_usage': water_usage},),
+                       rounds=3, iterations=1)
+
+
+def test_export_to_excel_devices(benchmark):
+    # Writing the monthly report of a user with two devices from their rollups
+    stats = {'min': 20.0, 'max': 30.0, 'mean': 25.0, 'count': 1440}
+    summary = {'count': 31 * 1440, 'water_used': 31.0, 'temperature': stats, 'humidity': stats, 'moisture': stats}
+    daily = [{**summary, 'key': f'2024/01/{day:02d}', 'count': 1440, 'water_used': 1.0} for day in range(1, 32)]
+    devices = [
+        {'name': name, 'summary': {**summary, 'key': '2024/01'}, 'daily': daily, 'water_totals': {'2024/01': 31.0}}
+        for name in ('first', 'second')
+    ]
+
+    benchmark.pedantic(export_to_excel_devices, args=(devices,), rounds=3, iterations=1)
@@ -0,0 +1,92 @@
+import itertools
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.conftest import make_records
+from src.service.mqtt_service import (record_sensor_data, flush_sensor_records, record_water_used, predict,
+                                      predict_batch)
+from src.service.socket_service import remap_redis
+from src.utils.batch_queue import BatchQueue
+from src.utils.predict import models
+from src.utils.secrets import INGEST_BATCH_SIZE
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    # The queues and Socket.IO server are not running, their calls are collected instead
+    monkeypatch.setattr('src.service.mqtt_service.sensor_ingest', SimpleNamespace(put=[].append))
+    monkeypatch.setattr('src.service.mqtt_service.prediction_batcher', SimpleNamespace(put=[].append))
+    monkeypatch.setattr('src.service.mqtt_service.socketio', SimpleNamespace(emit=lambda *args, **kwargs: None))
+    monkeypatch.setattr('src.service.mqtt_service.mqtt', SimpleNamespace(publish=lambda *args, **kwargs: None))
+    monkeypatch.setattr('src.service.socket_service.join_room', lambda *args, **kwargs: None)
+    monkeypatch.setattr('builtins.print', lambda *args, **kwargs: None)
+
+
+def test_sensor_ingest(benchmark, stores, monkeypatch):
+    # A full batch of messages going through the ingest queue, from the MQTT thread to the bucket and rollup
+    # writes of the worker, next to the existing history
+    topic = f"{stores['device_id']}/record/sensor_data"
+    rounds = itertools.count()
+
+    def setup():
+        start = datetime(2031, 1, 1) + timedelta(minutes=INGEST_BATCH_SIZE * next(rounds))
+        payloads = [json.dumps(record) for record in make_records(INGEST_BATCH_SIZE, start)]
+        ingest = BatchQueue('bench_ingest', flush_sensor_records, max_batch_size=INGEST_BATCH_SIZE,
+                            max_queue_size=INGEST_BATCH_SIZE)
+        monkeypatch.setattr('src.service.mqtt_service.sensor_ingest', ingest)
+        return (payloads, ingest), {}
+
+    def ingest_batch(payloads, ingest):
+        for payload in payloads:
+            record_sensor_data(payload, topic)
+        # Stopping the queue waits for the worker to flush the batch
+        ingest.stop()
+        assert ingest.flushed == len(payloads)
+
+    benchmark.pedantic(ingest_batch, setup=setup, rounds=10)
+
+
+def test_flush_sensor_records(benchmark, stores):
+    # Persisting a batch of 100 new records and their rollups next to the existing history
+    rounds = itertools.count()
+
+    def flush():
+        start = datetime(2030, 1, 1) + timedelta(minutes=100 * next(rounds))
+        flush_sensor_records([(stores['device_id'], record) for record in make_records(100, start)])
+
+    benchmark(flush)
+
+
+def test_record_water_used(benchmark, stores):
+    # Adding water usage to the counters of a device with a long usage history
+    payload = json.dumps({'water_used': 1.5, 'date': '2030/05'})
+    topic = f"{stores['device_id']}/record/water_used"
+
+    benchmark(record_water_used, payload, topic)
+
+
+def test_predict(benchmark, stores):
+    # Validating and queueing a prediction request
+    payload = json.dumps({'sensor_data': {'moisture': 30.0, 'temperature': 25.0, 'humidity': 50.0}})
+    topic = f"{stores['device_id']}/predict"
+
+    benchmark(predict, payload, topic)
+
+
+def test_predict_batch(benchmark, stores):
+    # Running the irrigation model over a full batch of queued requests
+    try:
+        models.get('irrigation')
+    except FileNotFoundError:
+        pytest.skip("The irrigation model is not available")
+    batch = [(stores['device_id'], (30.0 + i % 20, 25.0, 50.0)) for i in range(64)]
+
+    benchmark(predict_batch, batch)
+
+
+def test_remap_redis(benchmark, stores):
+    # Joining a connection to the rooms of a registered device, its metadata is cached after the first call
+    benchmark(remap_redis, stores['device_id'], 'bench_user', 'bench_socket')
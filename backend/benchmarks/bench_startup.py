@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+# Modules a REST or MQTT worker imports before it serves anything, as app.py does without starting the app
+WORKER_MODULES = (
+    'src.api.auth_api',
+    'src.api.device_api',
+    'src.api.user_api',
+    'src.api.mqtt_api',
+    'src.api.socket_api',
+    'src.api.metrics_api',
+    'src.config.scheduler',
+)
+
+# Libraries loaded on first use only, a worker must boot without them
+LAZY_MODULES = ('tensorflow', 'keras', 'cv2', 'pandas', 'openpyxl', 'pyarrow', 'matplotlib', 'sklearn', 'lightgbm')
+
+# Number of modules listed in the import time report
+REPORT_SIZE = 20
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Redis is pinged when its module is imported, the ping is skipped so the probe needs no running instance
+IMPORT_SCRIPT = f"""
+import sys
+import redis
+redis.Redis.ping = lambda self, **kwargs: True
+import {', '.join(WORKER_MODULES)}
+print('LOADED:' + ','.join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+"""
+
+
+def import_workers(importtime: bool = False) -> subprocess.CompletedProcess:
+    """
+    Imports the worker modules in a fresh interpreter.
+
+    :param importtime: bool: Whether the interpreter reports the import time of every module on stderr.
+    :return: subprocess.CompletedProcess: The finished process.
+    """
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', IMPORT_SCRIPT]
+    return subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+
+
+def loaded_lazy_modules(result: subprocess.CompletedProcess) -> list[str]:
+    """
+    Returns the libraries meant to be loaded lazily that the worker modules imported anyway.
+
+    :param result: subprocess.CompletedProcess: The finished import process.
+    :return: list[str]: The module names.
+    """
+    line = next(line for line in reversed(result.stdout.splitlines()) if line.startswith('LOADED:'))
+    return [name for name in line[len('LOADED:'):].split(',') if name]
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """
+    Parses the report written by `python -X importtime`.
+
+    :param stderr: str: The standard error of the process.
+    :return: list[tuple[str, int, int]]: The module, its own and its cumulative import time in microseconds,
+        slowest cumulative time first.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((module.strip(), int(own), int(cumulative)))
+    return sorted(imports, key=lambda entry: entry[2], reverse=True)
+
+
+def test_worker_startup(benchmark):
+    # Cold start of a worker up to the point where its routes and MQTT handlers are defined
+    result = benchmark.pedantic(import_workers, rounds=5, iterations=1)
+    assert loaded_lazy_modules(result) == []
+
+    report = parse_importtime(import_workers(importtime=True).stderr)
+    benchmark.extra_info['total_import_us'] = sum(own for _, own, _ in report)
+    benchmark.extra_info['slowest_imports'] = [
+        {'module': module, 'own_us': own, 'cumulative_us': cumulative}
+        for module, own, cumulative in report[:REPORT_SIZE]
+    ]
+    print(f"\nSlowest imports of a worker (cumulative / own, in ms), {len(report)} modules in total:")
+    for module, own, cumulative in report[:REPORT_SIZE]:
+        print(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {module}")
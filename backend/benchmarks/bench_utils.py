@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.utils.crypt import encrypt, decrypt
+from src.utils.predict import prepare_image, prepare_images
+from src.utils.tokenizer import generate_token, decode_token
+
+
+def test_encrypt(benchmark):
+    benchmark(encrypt, 'correct horse battery staple')
+
+
+def test_decrypt(benchmark):
+    benchmark(decrypt, encrypt('correct horse battery staple'))
+
+
+def test_decode_token(benchmark):
+    benchmark(decode_token, generate_token('bench@terraflow.test', '681785b2abcafa0ae18c75f9'))
+
+
+def test_prepare_image(benchmark):
+    # A camera frame scaled down to the input size of the disease model
+    image = np.random.default_rng(0).integers(0, 256, size=(1080, 1920, 3), dtype=np.uint8)
+
+    benchmark(prepare_image, image)
+
+
+@pytest.fixture(scope='module')
+def leaf_photos():
+    # A dozen phone photos of one plant, as uploaded to the batch prediction endpoint
+    rng = np.random.default_rng(0)
+    return [
+        cv2.imencode('.jpg', rng.integers(0, 256, size=(1536, 2048, 3), dtype=np.uint8))[1].tobytes()
+        for _ in range(12)
+    ]
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_prepare_images(benchmark, leaf_photos, threads):
+    benchmark(prepare_images, leaf_photos, threads)
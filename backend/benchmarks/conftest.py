@@ -0,0 +1,120 @@
+import os
+from datetime import datetime, timedelta
+
+import fakeredis
+import mongomock
+import pymongo
+import pytest
+import redis
+from bson import ObjectId
+
+from src.service.device_meta_service import device_cache
+from src.service.record_service import append_sensor_records, ensure_indexes
+from src.service.rollup_service import ensure_rollup_indexes
+from src.service.water_service import ensure_water_indexes
+
+# History sizes every size-dependent benchmark runs at, e.g. BENCH_SIZES=1000,100000,1000000
+BENCH_SIZES = [int(size) for size in os.getenv("BENCH_SIZES", "1000,100000").split(",") if size]
+
+# Local instances to run against instead of mongomock and fakeredis, whose queries ignore indexes
+BENCH_MONGO_URI = os.getenv("BENCH_MONGO_URI")
+BENCH_REDIS_URL = os.getenv("BENCH_REDIS_URL")
+
+# One reading per minute, so a history of N records spans N / 1440 daily buckets
+RECORD_INTERVAL = timedelta(minutes=1)
+HISTORY_START = datetime(2024, 1, 1)
+
+# Modules holding their own reference to the database or Redis client
+MONGO_MODULES = (
+    'src.service.record_service',
+    'src.service.rollup_service',
+    'src.service.water_service',
+    'src.service.mqtt_service',
+    'src.service.device_service',
+    'src.service.device_meta_service',
+)
+REDIS_MODULES = (
+    'src.service.subscription_service',
+)
+
+
+_mongomock_add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+
+def _add_update(self, selector, doc, multi=False, upsert=False, collation=None, array_filters=None, hint=None,
+                sort=None):
+    # pymongo 4.11+ passes the 'sort' of UpdateOne, which mongomock's bulk builder does not know yet.
+    # The updates used here match a single document, so the sort has no effect and is dropped.
+    return _mongomock_add_update(self, selector, doc, multi, upsert, collation, array_filters, hint)
+
+
+def pytest_collect_file(file_path, parent):
+    # Benchmarks are named bench_*.py so the regular test run never collects them
+    if file_path.suffix == '.py' and file_path.name.startswith('bench_'):
+        return pytest.Module.from_parent(parent, path=file_path)
+
+
+def pytest_generate_tests(metafunc):
+    if 'history_size' in metafunc.fixturenames:
+        metafunc.parametrize('history_size', BENCH_SIZES, scope='module')
+
+
+def make_records(size: int, start: datetime = HISTORY_START) -> list[dict]:
+    """
+    Generates sensor records one minute apart.
+
+    :param size: int: The number of records.
+    :param start: datetime: The timestamp of the first record.
+    :return: list[dict]: The sensor records.
+    """
+    return [
+        {
+            'sensor_data': {'temperature': 20 + i % 15, 'humidity': 40 + i % 25, 'moisture': 15 + i % 40},
+            'timestamp': (start + i * RECORD_INTERVAL).strftime('%Y/%m/%d %H:%M:%S'),
+        }
+        for i in range(size)
+    ]
+
+
+@pytest.fixture(scope='module')
+def stores(history_size):
+    """
+    Local stand-ins for MongoDB and Redis, seeded with one device holding history_size sensor records,
+    and as many water usage periods. Shared by the benchmarks of a module for one size.
+    The database, Redis and mongomock patches are undone once the module is done.
+    """
+    patches = pytest.MonkeyPatch()
+    if BENCH_MONGO_URI:
+        client = pymongo.MongoClient(BENCH_MONGO_URI)
+    else:
+        patches.setattr(mongomock.collection.BulkOperationBuilder, 'add_update', _add_update)
+        client = mongomock.MongoClient()
+    client.drop_database('terraflow_bench')
+    db = client['terraflow_bench']
+    r = redis.Redis.from_url(BENCH_REDIS_URL, decode_responses=True) if BENCH_REDIS_URL \
+        else fakeredis.FakeRedis(decode_responses=True)
+    r.flushdb()
+    for module in MONGO_MODULES:
+        patches.setattr(f'{module}.mongo_db', db)
+    for module in REDIS_MODULES:
+        patches.setattr(f'{module}.r', r)
+    device_cache.clear()
+    ensure_indexes()
+    ensure_rollup_indexes()
+    ensure_water_indexes()
+
+    device_id = '681785b2abcafa0ae18c75f9'
+    db['devices'].insert_one({'_id': ObjectId(device_id), 'name': 'bench'})
+    records = make_records(history_size)
+    for offset in range(0, history_size, 10000):
+        append_sensor_records([(device_id, record) for record in records[offset:offset + 10000]])
+    db['water_usage'].insert_many([
+        {'device_id': device_id, 'date': f'{1000 + i // 12:04d}/{i % 12 + 1:02d}', 'water_used': 1.0}
+        for i in range(history_size)
+    ])
+
+    yield {'db': db, 'r': r, 'device_id': device_id, 'records': records}
+
+    patches.undo()
+    device_cache.clear()
+    client.drop_database('terraflow_bench')
@@ -1,8 +1,12 @@
 from http import HTTPStatus
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, send_file
 
-from src.service.device_service import handle_get_device_data, handle_update_watering_type, handle_update_device
+from src.service.device_service import (handle_get_device_data, handle_get_device_rollups, handle_update_watering_type,
+                                        handle_update_device, DOWNSAMPLE_MODES)
+from src.service.record_service import parse_cursor
+from src.service.rollup_service import ROLLUP_PERIODS
+from src.service.export_service import get_export
 from src.service.user_service import handle_get_user_devices
 from src.utils.tokenizer import decode_token, validate_header
 
@@ -14,6 +18,8 @@ def get_device_data(device_id):
     """
     Endpoint to get device data by device ID.
     The user must be authenticated via a token in the Authorization header.
+    Optional query parameters: 'start' and 'end' timestamps, 'limit' and 'cursor' for pagination,
+    'downsample' ('lttb', 'avg', 'min', 'max' or 'none'), 'points' and 'field'.
 
     :param device_id: str: The ID of the device to fetch data for.
     """
@@ -24,13 +30,56 @@ def get_device_data(device_id):
     user_devices = handle_get_user_devices(user_id)
     if device_id not in [user_device['id'] for user_device in user_devices]:
         return jsonify({"error": "Device not found"}), HTTPStatus.NOT_FOUND
-    device = handle_get_device_data(device_id)
+
+    limit = request.args.get('limit', type=int)
+    points = request.args.get('points', type=int)
+    downsample = request.args.get('downsample', 'lttb')
+    cursor = request.args.get('cursor')
+    if downsample not in DOWNSAMPLE_MODES or (limit is not None and limit <= 0) or \
+            (points is not None and points <= 0) or (cursor and not parse_cursor(cursor)):
+        return jsonify({"error": "Invalid query parameters"}), HTTPStatus.BAD_REQUEST
+
+    device = handle_get_device_data(
+        device_id,
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        limit=limit,
+        cursor=cursor,
+        downsample=downsample,
+        points=points,
+        field=request.args.get('field', 'moisture'),
+    )
 
     if not device:
         return jsonify({"error": "Device not found"}), HTTPStatus.NOT_FOUND
     return jsonify(device), HTTPStatus.OK
 
 
+@device_blueprint.route('/<device_id>/rollups', methods=['GET'])
+def get_device_rollups(device_id):
+    """
+    Endpoint to get the daily or monthly aggregates of a device.
+    The user must be authenticated via a token in the Authorization header.
+    Optional query parameters: 'period' ('day' or 'month'), 'start' and 'end' timestamps.
+
+    :param device_id: str: The ID of the device to fetch the aggregates for.
+    """
+    user_id = validate_header(request.headers)
+
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), HTTPStatus.UNAUTHORIZED
+    user_devices = handle_get_user_devices(user_id)
+    if device_id not in [user_device['id'] for user_device in user_devices]:
+        return jsonify({"error": "Device not found"}), HTTPStatus.NOT_FOUND
+
+    period = request.args.get('period', 'day')
+    if period not in ROLLUP_PERIODS:
+        return jsonify({"error": "Invalid query parameters"}), HTTPStatus.BAD_REQUEST
+
+    rollups = handle_get_device_rollups(device_id, period, request.args.get('start'), request.args.get('end'))
+    return jsonify(rollups), HTTPStatus.OK
+
+
 @device_blueprint.route('/<device_id>/watering_type', methods=['PUT'])
 def update_watering_type(device_id):
     """
@@ -79,3 +128,18 @@ def update_device(device_id):
         return jsonify(msg), HTTPStatus.BAD_REQUEST
 
     return jsonify(msg), HTTPStatus.OK
+
+
+@device_blueprint.route('/export/<export_id>', methods=['GET'])
+def download_export(export_id):
+    """
+    Endpoint to download an export file that was too large to be sent over the socket.
+    The export ID is only handed to the client that requested the export and expires after EXPORT_TTL.
+
+    :param export_id: str: The ID of the export.
+    """
+    export = get_export(export_id)
+    if not export:
+        return jsonify({"error": "Export not found"}), HTTPStatus.NOT_FOUND
+    file, filename = export
+    return send_file(file, as_attachment=True, download_name=filename)
@@ -0,0 +1,14 @@
+from flask import Blueprint, Response
+
+from src.utils.metrics import metrics
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Endpoint scraped by Prometheus, returning the metrics of this backend process in the text exposition format.
+    It is not authenticated, it is meant to be reachable from the monitoring network only.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -1,7 +1,12 @@
 import typing
 import paho.mqtt.client
-from src.service.mqtt_service import register_device, predict, record_sensor_data, record_water_used
+from src.service.mqtt_service import dispatch_message
 from src.config.protocol import mqtt
+from src.utils.logger import get_logger
+
+log = get_logger('mqtt')
+# Logs written for every message, sampled so they stay cheap under load
+message_log = get_logger('mqtt.messages', sampled=True)
 
 
 @mqtt.on_connect()
@@ -14,7 +19,7 @@ def handle_connect(client: paho.mqtt.client.Client, userdata: typing.Any, flags:
     :param flags: dict: Response flags from the MQTT broker.
     :param rc: int: The connection result code, indicating success or failure.
     """
-    print(f"Connected with result code {rc}, client: {client}")
+    log.info("Connected with result code %s, client: %s", rc, client)
 
 
 @mqtt.on_message()
@@ -28,27 +33,13 @@ def handle_mqtt_message(client: paho.mqtt.client.Client, userdata: typing.Any, m
     """
     try:
         # Decode the received message payload and log the topic and QoS.
-        print(f"Received message '{message.payload.decode()}' on topic '{message.topic}' with QoS {message.qos}")
         topic = message.topic
         payload = message.payload.decode()
+        message_log.debug("Received %d bytes on topic '%s' with QoS %s", len(payload), topic, message.qos)
     except Exception as e:
         # Log decoding errors and return early.
-        print(f"Error: {e}")
+        log.error("Failed to decode message: %s", e)
         return
 
     # Process messages based on the topic.
-    if topic.endswith('/record/sensor_data'):
-        print('Recording sensor data')
-        record_sensor_data(payload, topic)
-    elif topic.endswith('/predict'):
-        print('Processing prediction request')
-        predict(payload, topic)
-    elif topic.endswith('/record/water_used'):
-        print('Recording water usage data')
-        record_water_used(payload, topic)
-    elif topic == 'register':
-        print('Processing registration')
-        register_device(payload)
-    else:
-        # Log unsupported or unrecognized topics.
-        print('Unknown topic received')
+    dispatch_message(topic, payload)
@@ -4,19 +4,20 @@ from src.service.socket_service import (
     remap_redis, handle_export,
 )
 from src.config.protocol import socketio
+from src.utils.logger import get_logger
 from src.utils.tokenizer import decode_token
 
+# Logs written for every event, sampled so they stay cheap under load. The init payload holds the user's token,
+# it is never logged.
+log = get_logger('socket', sampled=True)
+
 
 @socketio.on('connect')
 def connet_event() -> None:
     """
     Handles client connection.
     """
-    print('Client connected')
-    print('Request:', request)
-    socket_id = request.sid
-    print('Socket ID:', socket_id)
-    handle_connect(socket_id)
+    handle_connect(request.sid)
 
 
 @socketio.on('init')
@@ -26,19 +27,19 @@ def init_event(data: dict) -> None:
 
     :param data: dict: JSON payload containing 'token' and 'devices'.
     """
-    print('Init:', data)
     socket_id = request.sid
     if 'token' not in data or 'devices' not in data:
-        print('User ID not found, found:', data)
+        log.warning("Init of %s without token or devices, keys: %s", socket_id, sorted(data))
         return
     if not data['devices']:
-        print('No devices found, found:', data)
+        log.debug("Init of %s without devices", socket_id)
         return
     token = data['token']
     payload = decode_token(token)
     if 'error' in payload:
-        print('Invalid token:', payload)
+        log.warning("Init of %s with an invalid token: %s", socket_id, payload['error'])
         return
+    log.debug("Init of %s for %d devices", socket_id, len(data['devices']))
     user_id = payload['user_id']
     for device in data['devices']:
         remap_redis(device, user_id, socket_id)
@@ -51,8 +52,7 @@ def disconnect_event(data: dict) -> None:
 
     :param data: dict: JSON payload containing disconnection data.
     """
-    print('Client disconnected')
-    handle_disconnect(data)
+    handle_disconnect(request.sid)
 
 
 @socketio.on('trigger_irrigation')
@@ -63,27 +63,29 @@ def irrigate_event(data: dict) -> None:
     :param data: dict: JSON payload containing 'device_id'.
     """
     if 'device_id' not in data:
-        print('device ID not found, found:', data)
+        log.warning("Irrigation request without device ID, keys: %s", sorted(data))
         return
     device_id = data['device_id']
-    print('Irrigating:', device_id)
+    log.debug("Irrigating: %s", device_id)
     handle_irrigate(device_id)
 
 
 @socketio.on('export')
-def export_event(data: dict) -> None:
+def export_event(data: dict) -> dict or None:
     """
     Handles export requests for device data.
+    The export runs in the background, the job ID is returned to the client as the event acknowledgement.
 
-    :param data: dict: JSON payload containing 'device_id'.
+    :param data: dict: JSON payload containing 'device_id' and optionally the 'format' ('xlsx' by default,
+        'csv', 'parquet' or 'arrow').
     """
     if 'device_id' not in data:
-        print('device ID or type not found, found:', data)
+        log.warning("Export request without device ID, keys: %s", sorted(data))
         return
     device_id = data['device_id']
     socket_id = request.sid
-    print('Exporting:', device_id)
-    handle_export(device_id, socket_id)
+    log.debug("Exporting: %s", device_id)
+    return handle_export(device_id, socket_id, data.get('format', 'xlsx'))
 
 
 @socketio.on('irrigation_type')
@@ -94,12 +96,12 @@ def irrigation_type_event(data: dict) -> None:
     :param data: dict: JSON payload with keys 'device_id', 'irrigation_type', and optional 'schedule'.
     """
     if 'device_id' not in data or 'irrigation_type' not in data:
-        print('device ID or irrigation type not found, found:', data)
+        log.warning("Irrigation type request without device ID or irrigation type, keys: %s", sorted(data))
         return
     device_id = data['device_id']
     irrigation_type = data['irrigation_type']
     schedule = data.get('schedule', {})
-    print('Irrigation Type:', irrigation_type)
+    log.debug("Irrigation type of %s: %s", device_id, irrigation_type)
     handle_irrigation_type(device_id, irrigation_type, schedule)
 
 
@@ -110,4 +112,4 @@ def message_event(data: dict) -> None:
 
     :param data: dict: JSON payload containing the message data.
     """
-    print('Message:', data)
+    log.debug("Message from %s", request.sid)
@@ -3,7 +3,9 @@ from flask import Blueprint, request, jsonify
 
 from src.service.auth_service import handle_logout
 from src.service.user_service import (handle_get_user_devices, handle_add_device, handle_delete_device,
-                                      handle_predict_disease)
+                                      handle_predict_disease, handle_predict_disease_batch)
+from src.utils.inference_pool import InferenceBusy, InferenceTimeout
+from src.utils.secrets import PREDICT_MAX_IMAGES
 from src.utils.tokenizer import decode_token, validate_header
 
 user_blueprint = Blueprint('user', __name__, url_prefix='/user')
@@ -88,9 +90,40 @@ def predict_disease():
     if not image_file:
         return jsonify({"error": "Invalid image file"}), HTTPStatus.BAD_REQUEST
 
+    return prediction_response(handle_predict_disease, image_file)
+
+
+@user_blueprint.route('/predict-disease/batch', methods=['POST'])
+def predict_disease_batch():
+    """
+    Endpoint to predict disease from several photos of the same plant.
+    The images should be sent as files of the 'images' field of a multipart request, at most PREDICT_MAX_IMAGES.
+    The response holds the prediction of every image and the prediction of the plant.
+    """
+    image_files = [image_file for image_file in request.files.getlist('images') if image_file]
+    if not image_files:
+        return jsonify({"error": "No image file provided"}), HTTPStatus.BAD_REQUEST
+    if len(image_files) > PREDICT_MAX_IMAGES:
+        return jsonify({"error": f"At most {PREDICT_MAX_IMAGES} images can be sent at once"}), HTTPStatus.BAD_REQUEST
+
+    return prediction_response(handle_predict_disease_batch, image_files)
+
+
+def prediction_response(handler, *args):
+    """
+    Runs a disease prediction handler and converts its result or failure to a response.
+
+    :param handler: Callable: The prediction handler.
+    :param args: The arguments of the handler.
+    :return: tuple[Response, HTTPStatus]: The prediction, or the error and its status.
+    """
     try:
-        prediction = handle_predict_disease(image_file)
+        prediction = handler(*args)
         return jsonify(prediction), HTTPStatus.OK
+    except InferenceBusy:
+        return jsonify({"error": "Too many predictions in progress, try again later"}), HTTPStatus.SERVICE_UNAVAILABLE
+    except InferenceTimeout:
+        return jsonify({"error": "Prediction timed out"}), HTTPStatus.GATEWAY_TIMEOUT
     except Exception as e:
         print(f"Error during prediction: {e}")
         return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
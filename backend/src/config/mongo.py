@@ -1,16 +1,44 @@
 import pymongo
+from pymongo import monitoring
 from pymongoose.methods import set_schemas
 
 from src.model.device_model import Device
+from src.model.sensor_bucket_model import SensorBucket
+from src.model.sensor_rollup_model import SensorRollup
 from src.model.user_model import User
+from src.model.water_usage_model import WaterUsage
+from src.utils.metrics import metrics
 from src.utils.secrets import MONGO_URI, MONGO_DB
 
+MONGO_COMMAND_SECONDS = metrics.histogram('terraflow_mongo_command_seconds',
+                                          'Duration of the MongoDB commands, by command and outcome',
+                                          ('command', 'status'))
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records the duration of every command sent to MongoDB, as measured by the driver.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, status='ok')
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, status='error')
+
+
 try:
-    mongo_client = pymongo.MongoClient(MONGO_URI)
+    mongo_client = pymongo.MongoClient(MONGO_URI, event_listeners=[CommandMetrics()])
     mongo_db = mongo_client[MONGO_DB]
     schemas = {
         'users': User,
-        'devices': Device
+        'devices': Device,
+        'sensor_buckets': SensorBucket,
+        'sensor_rollups': SensorRollup,
+        'water_usage': WaterUsage,
     }
     set_schemas(mongo_db, schemas)
 
@@ -20,3 +48,6 @@ except Exception as e:
 
 DEVICE_COLLECTION = 'devices'
 USER_COLLECTION = 'users'
+SENSOR_COLLECTION = 'sensor_buckets'
+ROLLUP_COLLECTION = 'sensor_rollups'
+WATER_COLLECTION = 'water_usage'
@@ -1,9 +1,11 @@
 from flask_socketio import SocketIO
 from flask_mqtt import Mqtt
 from authlib.integrations.flask_client import OAuth
-from src.utils.secrets import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET
+from src.utils.secrets import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, SOCKETIO_MESSAGE_QUEUE
 
-socketio = SocketIO(cors_allowed_origins='*', logger=False, engineio_logger=False)
+# With a message queue, events emitted by any backend process reach the clients connected to the others
+socketio = SocketIO(cors_allowed_origins='*', logger=False, engineio_logger=False,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE or None)
 mqtt = Mqtt()
 
 oauth = OAuth()
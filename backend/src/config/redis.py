@@ -1,8 +1,35 @@
 import redis
+from src.utils.metrics import metrics
 from src.utils.secrets import REDIS_HOST, REDIS_PORT
 
+REDIS_COMMAND_SECONDS = metrics.histogram('terraflow_redis_command_seconds', 'Duration of the Redis commands, by command',
+                                          ('command',))
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client recording the duration of every command it sends.
+    Commands queued on a pipeline are timed as a single 'pipeline' command when it is executed.
+    """
+
+    def execute_command(self, *args, **options):
+        with REDIS_COMMAND_SECONDS.time(command=str(args[0]).lower()):
+            return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        def timed_execute(raise_on_error: bool = True):
+            with REDIS_COMMAND_SECONDS.time(command='pipeline'):
+                return execute(raise_on_error)
+
+        pipe.execute = timed_execute
+        return pipe
+
+
 try:
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    r = InstrumentedRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
     r.ping()
 except redis.ConnectionError as e:
     print(f"Error connecting to Redis: {e}")
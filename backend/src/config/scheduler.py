@@ -1,18 +1,65 @@
+from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
+from src.config.redis import r
 from src.service.mail_service import send_monthly_report
+from src.utils.metrics import metrics
+from src.utils.secrets import SCHEDULER_ENABLED
 import atexit
+import os
+import socket
+import time
+
+MONTHLY_REPORT_LOCK_TTL = 24 * 60 * 60
+
+SCHEDULER_JOB_SECONDS = metrics.histogram('terraflow_scheduler_job_seconds', 'Duration of the scheduled jobs, by job',
+                                          ('job',))
+SCHEDULER_JOB_LAST_SUCCESS = metrics.gauge('terraflow_scheduler_job_last_success_timestamp_seconds',
+                                           'Unix time of the last successful run of the scheduled jobs, by job',
+                                           ('job',))
+
+
+def acquire_job_lock(job: str, ttl: int) -> bool:
+    """
+    Claims a run of a scheduled job, so that only one of several backend instances executes it.
+
+    :param job: str: Key identifying the job run (e.g., "monthly_report:2025/05").
+    :param ttl: int: Time in seconds the claim is held, it must outlast the clock skew between instances.
+    :return: bool: True if this instance claimed the run.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    return bool(r.set(f"scheduler:lock:{job}", owner, nx=True, ex=ttl))
+
+
+def run_monthly_report():
+    """
+    Sends the monthly reports unless another instance already did it for the current month.
+
+    :return: None
+    """
+    month = datetime.now().strftime('%Y/%m')
+    if not acquire_job_lock(f"monthly_report:{month}", MONTHLY_REPORT_LOCK_TTL):
+        print(f"Monthly report for {month} already handled by another instance")
+        return
+    with SCHEDULER_JOB_SECONDS.time(job='monthly_report'):
+        send_monthly_report()
+    SCHEDULER_JOB_LAST_SUCCESS.set(time.time(), job='monthly_report')
 
 
 def start_scheduler():
     """
     Start the background scheduler to send monthly reports.
     This function sets up a job that runs on the last day of each month at midnight.
+    Instances started with SCHEDULER_ENABLED=false do not schedule anything.
 
     :return: None
     """
+    if not SCHEDULER_ENABLED:
+        print("Scheduler disabled")
+        return
+
     scheduler = BackgroundScheduler()
     scheduler.add_job(
-        func=lambda: send_monthly_report(),
+        func=run_monthly_report,
         trigger='cron',
         day='last',  # Run on the last day of the month
         hour=0,  # At midnight
@@ -0,0 +1,67 @@
+from pymongoose.mongo_types import Types, Schema
+
+
+class SensorBucket(Schema):
+    """
+    Sensor bucket model holding one day of sensor records for a single device.
+    """
+
+    schema_name = "sensor_buckets"  # Name of the schema that mongo uses
+
+    # Attributes
+    id = None
+    device_id = None
+    day = None
+    count = None
+    first = None
+    last = None
+    records = None
+
+    def __init__(self, **kwargs):
+        self.schema = {
+            "device_id": {
+                "type": Types.String,
+                "required": True,
+            },
+            "day": {
+                "type": Types.String,
+                "required": True,
+            },
+            "count": {
+                "type": Types.Number,
+                "default": 0,
+            },
+            "first": {
+                "type": Types.String,
+                "default": None,
+            },
+            "last": {
+                "type": Types.String,
+                "default": None,
+            },
+            "records": [{
+                "sensor_data": {
+                    "temperature": {
+                        "type": Types.Number,
+                        "default": 0.0,
+                    },
+                    "humidity": {
+                        "type": Types.Number,
+                        "default": 0.0,
+                    },
+                    "moisture": {
+                        "type": Types.Number,
+                        "default": 0.0,
+                    },
+                },
+                "timestamp": {
+                    "type": Types.Date,
+                    "default": None,
+                },
+            }],
+        }
+
+        super().__init__(self.schema_name, self.schema, kwargs)
+
+    def __str__(self):
+        return f"SensorBucket(device_id={self.device_id}, day={self.day}, count={self.count})"
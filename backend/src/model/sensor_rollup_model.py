@@ -0,0 +1,67 @@
+from pymongoose.mongo_types import Types, Schema
+
+
+class SensorRollup(Schema):
+    """
+    Sensor rollup model holding the aggregated readings and water usage of one device over a day or a month.
+    """
+
+    schema_name = "sensor_rollups"  # Name of the schema that mongo uses
+
+    # Attributes
+    id = None
+    device_id = None
+    period = None
+    key = None
+    count = None
+    stats = None
+    water_used = None
+
+    def __init__(self, **kwargs):
+        self.schema = {
+            "device_id": {
+                "type": Types.String,
+                "required": True,
+            },
+            "period": {
+                "type": Types.String,
+                "required": True,
+            },
+            "key": {
+                "type": Types.String,
+                "required": True,
+            },
+            "count": {
+                "type": Types.Number,
+                "default": 0,
+            },
+            "stats": {
+                "temperature": {
+                    "min": {"type": Types.Number, "default": None},
+                    "max": {"type": Types.Number, "default": None},
+                    "sum": {"type": Types.Number, "default": 0.0},
+                    "count": {"type": Types.Number, "default": 0},
+                },
+                "humidity": {
+                    "min": {"type": Types.Number, "default": None},
+                    "max": {"type": Types.Number, "default": None},
+                    "sum": {"type": Types.Number, "default": 0.0},
+                    "count": {"type": Types.Number, "default": 0},
+                },
+                "moisture": {
+                    "min": {"type": Types.Number, "default": None},
+                    "max": {"type": Types.Number, "default": None},
+                    "sum": {"type": Types.Number, "default": 0.0},
+                    "count": {"type": Types.Number, "default": 0},
+                },
+            },
+            "water_used": {
+                "type": Types.Number,
+                "default": 0.0,
+            },
+        }
+
+        super().__init__(self.schema_name, self.schema, kwargs)
+
+    def __str__(self):
+        return f"SensorRollup(device_id={self.device_id}, period={self.period}, key={self.key})"
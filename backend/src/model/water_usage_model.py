@@ -0,0 +1,36 @@
+from pymongoose.mongo_types import Types, Schema
+
+
+class WaterUsage(Schema):
+    """
+    Water usage model holding the water used by a single device over one reported period.
+    """
+
+    schema_name = "water_usage"  # Name of the schema that mongo uses
+
+    # Attributes
+    id = None
+    device_id = None
+    date = None
+    water_used = None
+
+    def __init__(self, **kwargs):
+        self.schema = {
+            "device_id": {
+                "type": Types.String,
+                "required": True,
+            },
+            "date": {
+                "type": Types.String,
+                "required": True,
+            },
+            "water_used": {
+                "type": Types.Number,
+                "default": 0.0,
+            },
+        }
+
+        super().__init__(self.schema_name, self.schema, kwargs)
+
+    def __str__(self):
+        return f"WaterUsage(device_id={self.device_id}, date={self.date}, water_used={self.water_used})"
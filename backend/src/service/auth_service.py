@@ -1,13 +1,13 @@
-import json
-from google.auth.transport import (requests as google_requests, Request)
+from google.auth.transport import Request
 from src.utils.secrets import GOOGLE_CLIENT_ID
 from bson import ObjectId
 import string
 import secrets
 import regex as re
 
-from src.config.mongo import mongo_db, USER_COLLECTION, DEVICE_COLLECTION
-from src.config.redis import r
+from src.config.mongo import mongo_db, USER_COLLECTION
+from src.service.device_meta_service import get_devices_meta
+from src.service.socket_service import leave_device_rooms
 from src.utils.crypt import encrypt, decrypt
 from src.utils.tokenizer import generate_token
 
@@ -33,18 +33,9 @@ def handle_form_login(email: str, password: str) -> dict:
         encrypted_password = user['password']
         decrypted_password = decrypt(encrypted_password)
 
-        devices = user.get('devices', [])
-        device_data = []
-        for device_id in devices:
-            device = mongo_db[DEVICE_COLLECTION].find_one({"_id": ObjectId(device_id)})
-            if device:
-                device_data.append({
-                    'id': str(device['_id']),
-                    'name': device.get('name', 'Unknown Device'),
-                })
-
         if decrypted_password == password:
             token = generate_token(email, str(user['_id']))
+            device_data = get_devices_meta(user.get('devices', []), default_name='Unknown Device')
             return {'token': token, 'devices': device_data}
         else:
             return {'error': 'Invalid email or password'}
@@ -78,6 +69,9 @@ def google_auth(request: Request) -> dict:
     :param request: Request: The request object.
     :return: dict: A dictionary containing the token if the user exists, or creates a new user and returns the token.
     """
+    # The transport pulls in requests and the crypto backends, only Google logins need it
+    from google.auth.transport import requests as google_requests
+
     id_token_str = request.form.get('id_token')
     if not id_token_str:
         return {'error': 'No ID token provided'}
@@ -133,18 +127,7 @@ def handle_logout(user_id: str, deviceIds: list) -> dict:
         if not user:
             return {'error': 'User not found'}
 
-        for device_id in deviceIds:
-            device_key = f"device:{device_id}"
-            if r.exists(device_key):
-                user_list = json.loads(r.get(device_key))
-                user_list = [user for user in user_list if user != user_id]
-                json_data = json.dumps(user_list)
-                if json_data != '[]':
-                    r.set(device_key, json_data)
-                else:
-                    r.delete(device_key)
-            else:
-                print(f"Device with ID {device_id} not found.")
+        leave_device_rooms(user_id, deviceIds)
 
         return {'success': True}
     except Exception as e:
@@ -0,0 +1,104 @@
+from bson import ObjectId
+
+from src.config.mongo import mongo_db, DEVICE_COLLECTION
+from src.utils.cache import TTLCache
+from src.utils.metrics import metrics
+from src.utils.secrets import DEVICE_CACHE_SIZE, DEVICE_CACHE_TTL, DEVICE_MISS_TTL
+
+# Metadata of the registered devices. Each backend process has its own copy, the TTL bounds how long
+# a change made through another process stays invisible.
+device_cache = TTLCache(max_size=DEVICE_CACHE_SIZE, ttl=DEVICE_CACHE_TTL)
+metrics.register_stats('terraflow_device_cache', 'Counters of the device metadata cache', device_cache.stats)
+
+# Only the metadata fields are read, never the water usage history
+META_PROJECTION = {'name': 1}
+
+# Cached for IDs that are not registered, for DEVICE_MISS_TTL seconds, so that messages of unknown devices
+# do not query the database every time
+MISSING = {}
+
+
+def get_device_meta(device_id: str) -> dict or None:
+    """
+    Returns the metadata of a registered device, reading the database only when it is not cached.
+    Unregistered devices are cached too, for DEVICE_MISS_TTL seconds.
+
+    :param device_id: str: The ID of the device.
+    :return: dict or None: The device ID and name (None if unnamed), or None if the device is not registered.
+    """
+    meta = device_cache.get(device_id)
+    if meta is not None:
+        return meta if meta is not MISSING else None
+
+    if not ObjectId.is_valid(device_id):
+        return None
+    device = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)}, META_PROJECTION)
+    if not device:
+        device_cache.set(device_id, MISSING, ttl=DEVICE_MISS_TTL)
+        return None
+    return _cache_device(device)
+
+
+def get_devices_meta(device_ids: list[str], default_name: str = '') -> list[dict]:
+    """
+    Returns the metadata of several devices, fetching the ones that are not cached with a single query.
+
+    :param device_ids: list[str]: The IDs of the devices.
+    :param default_name: str: Name reported for devices without one.
+    :return: list[dict]: The ID and name of every registered device, in the order of device_ids.
+    """
+    metas = {}
+    missing = []
+    for device_id in device_ids:
+        meta = device_cache.get(device_id)
+        if meta is not None:
+            if meta is not MISSING:
+                metas[device_id] = meta
+        elif ObjectId.is_valid(device_id):
+            missing.append(ObjectId(device_id))
+
+    if missing:
+        for device in mongo_db[DEVICE_COLLECTION].find({'_id': {'$in': missing}}, META_PROJECTION):
+            meta = _cache_device(device)
+            metas[meta['id']] = meta
+        for device_id in missing:
+            if str(device_id) not in metas:
+                device_cache.set(str(device_id), MISSING, ttl=DEVICE_MISS_TTL)
+
+    return [
+        {'id': device_id, 'name': metas[device_id]['name'] if metas[device_id]['name'] is not None else default_name}
+        for device_id in device_ids if device_id in metas
+    ]
+
+
+def _cache_device(device: dict) -> dict:
+    """
+    Caches the metadata of a device document read from the database.
+
+    :param device: dict: The device document, restricted to META_PROJECTION.
+    :return: dict: The cached metadata.
+    """
+    meta = {'id': str(device['_id']), 'name': device.get('name')}
+    device_cache.set(meta['id'], meta)
+    return meta
+
+
+def remember_device(device_id: str, name: str) -> None:
+    """
+    Caches the metadata of a device that was just registered.
+
+    :param device_id: str: The ID of the device.
+    :param name: str: The name of the device.
+    :return: None
+    """
+    device_cache.set(device_id, {'id': device_id, 'name': name})
+
+
+def invalidate_device(device_id: str) -> None:
+    """
+    Drops the cached metadata of a device after it changed in the database.
+
+    :param device_id: str: The ID of the device.
+    :return: None
+    """
+    device_cache.invalidate(device_id)
@@ -1,26 +1,92 @@
 import json
+from itertools import islice
 
 from bson import ObjectId
 
 from src.config.mongo import mongo_db, DEVICE_COLLECTION
 from src.config.protocol import mqtt
+from src.service.device_meta_service import invalidate_device
+from src.service.record_service import (iter_sensor_records, iter_sensor_positions, count_sensor_records, format_cursor,
+                                        parse_cursor)
+from src.service.rollup_service import get_rollups
+from src.service.water_service import get_water_usage
+from src.utils.downsample import lttb, aggregate
+from src.utils.logger import get_logger
+from src.utils.secrets import HISTORY_MAX_POINTS, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
 
+DOWNSAMPLE_MODES = ('lttb', 'avg', 'min', 'max', 'none')
 
-def handle_get_device_data(device_id: str) -> dict or None:
+# Logs written for every request, sampled so they stay cheap under load
+log = get_logger('devices', sampled=True)
+
+
+def handle_get_device_data(device_id: str, start: str = None, end: str = None, limit: int = None,
+                           cursor: str = None, downsample: str = 'lttb', points: int = None,
+                           field: str = 'moisture') -> dict or None:
     """
     fetches the irrigation data for a specific device.
+    The sensor records are either returned page by page, when a limit or a cursor is given or downsampling is
+    disabled, or downsampled to at most HISTORY_MAX_POINTS records, so the response size does not grow with
+    the stored history.
 
     :param device_id: str: The ID of the device whose data is to be fetched.
-    :return: dict or None: A dictionary containing the device's irrigation record and water usage data.
+    :param start: str: Optional timestamp, records before it are skipped (inclusive).
+    :param end: str: Optional timestamp, records from it onwards are skipped (exclusive).
+    :param limit: int: Optional page size, capped to HISTORY_MAX_PAGE_SIZE.
+    :param cursor: str: Optional 'next_cursor' of the previous page, the page starts after it. The other
+        parameters must be the ones of the previous page.
+    :param downsample: str: One of 'lttb', 'avg', 'min', 'max' or 'none'.
+    :param points: int: Number of records to downsample to, capped to HISTORY_MAX_POINTS.
+    :param field: str: The sensor reading LTTB preserves the shape of.
+    :return: dict or None: A dictionary containing the device's irrigation record, water usage data and
+        the cursor of the next page (None on the last page).
     """
-    device = mongo_db[DEVICE_COLLECTION].find_one({"_id": ObjectId(device_id)})
-    print(f"Fetching data for device: {device_id}")
+    device = mongo_db[DEVICE_COLLECTION].find_one({"_id": ObjectId(device_id)}, {'_id': 1})
+    log.debug("Fetching data for device: %s", device_id)
     if not device:
         return None
 
+    next_cursor = None
+    if limit or cursor or downsample == 'none':
+        page_size = min(limit or HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE)
+        # The cursor is the position of the last record of the previous page, records sharing its timestamp follow
+        after = parse_cursor(cursor) if cursor else None
+        page = list(islice(iter_sensor_positions(device_id, start, end, after), page_size + 1))
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = format_cursor(*page[-1][:2])
+        records = [record for _, _, record in page]
+    else:
+        points = min(points or HISTORY_MAX_POINTS, HISTORY_MAX_POINTS)
+        # The records are streamed into the downsampling, sized from the bucket counters
+        records = iter_sensor_records(device_id, start, end)
+        count = count_sensor_records(device_id, start, end)
+        if downsample == 'lttb':
+            records = lttb(records, points, field, count)
+        else:
+            records = aggregate(records, points, downsample, count)
+
     return {
-        'record': device.get('record', []),
-        'water_usage': device.get('water_usage', []),
+        'record': records,
+        'water_usage': get_water_usage(device_id),
+        'next_cursor': next_cursor,
+    }
+
+
+def handle_get_device_rollups(device_id: str, period: str = 'day', start: str = None, end: str = None) -> dict:
+    """
+    fetches the daily or monthly aggregates of a device, for charts spanning long ranges.
+    The response holds one entry per period, whatever the number of samples recorded in it.
+
+    :param device_id: str: The ID of the device.
+    :param period: str: 'day' or 'month'.
+    :param start: str: Optional timestamp, periods before the one containing it are skipped.
+    :param end: str: Optional timestamp, periods after the one containing it are skipped.
+    :return: dict: A dictionary containing the 'period' and its 'rollups'.
+    """
+    return {
+        'period': period,
+        'rollups': get_rollups(device_id, period, start, end),
     }
 
 
@@ -55,4 +121,6 @@ def handle_update_device(device_id: str, device_name: str) -> dict:
     if result.modified_count == 0:
         return {"error": "Device not found or name is the same"}
 
+    invalidate_device(device_id)
+
     return {"message": f"Device {device_id} updated to {device_name}"}
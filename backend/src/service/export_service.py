@@ -0,0 +1,269 @@
+import os
+import secrets
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from gridfs import GridFSBucket, NoFile
+
+from src.config.mongo import mongo_db, DEVICE_COLLECTION
+from src.config.protocol import socketio
+from src.config.redis import r
+from src.service.record_service import iter_sensor_records, count_sensor_records
+from src.service.rollup_service import get_monthly_water_totals
+from src.service.water_service import get_water_usage
+from src.utils.cache import TTLCache
+from src.utils.export_formats import save_export, FILE_SUFFIXES
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+from src.utils.secrets import (EXPORT_DIR, EXPORT_INLINE_MAX_BYTES, EXPORT_TTL, EXPORT_WORKERS, EXPORT_MAX_JOBS,
+                               EXPORT_PROGRESS_EVERY, EXPORT_CACHE_SIZE, EXPORT_CACHE_TTL, EXPORT_ROW_GROUP_PERIOD)
+
+log = get_logger('exports')
+
+EXPORT_NAME = 'exported_data'
+
+# Exports run in the background so a large one never blocks the Socket.IO handlers
+export_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+
+# Exports too large to be sent over the socket, kept in MongoDB so any worker can serve the download
+export_files = GridFSBucket(mongo_db, bucket_name='exports')
+
+# Results of the recent exports, keyed by device ID and format
+export_results = TTLCache(max_size=EXPORT_CACHE_SIZE, ttl=EXPORT_CACHE_TTL)
+
+# Exports queued or running, keyed by device ID and format, so concurrent requests for a device share one job
+export_jobs = {}
+export_jobs_lock = threading.Lock()
+
+EXPORT_SECONDS = metrics.histogram('terraflow_export_seconds', 'Duration of the export jobs, by format and outcome',
+                                   ('format', 'status'))
+SOCKETIO_EMITS = metrics.counter('terraflow_socketio_emits_total', 'Socket.IO events emitted, by event type',
+                                 ('event',))
+metrics.register_stats('terraflow_export_cache', 'Counters of the export result cache', export_results.stats)
+metrics.register_stats('terraflow_export', 'Export jobs in progress', lambda: {'jobs': len(export_jobs)})
+
+
+def export_key(export_id: str) -> str:
+    """
+    Returns the key of the Redis entry of a downloadable export.
+
+    :param export_id: str: The ID of the export.
+    :return: str: The Redis key.
+    """
+    return f"export:{export_id}"
+
+
+def export_filename(export_format: str) -> str:
+    """
+    Returns the name the client saves an export under.
+
+    :param export_format: str: The format of the export.
+    :return: str: The file name.
+    """
+    return f"{EXPORT_NAME}.{FILE_SUFFIXES[export_format]}"
+
+
+def submit_export(device_id: str, socket_id: str, export_format: str = 'xlsx') -> dict:
+    """
+    Queues the export of a device and returns without waiting for it.
+    The client receives 'export_progress' events, then 'export_response' with the result or an error.
+    A request for a device that is already being exported joins the running job, and a result
+    produced less than EXPORT_CACHE_TTL seconds ago is sent again right away.
+
+    :param device_id: str: The ID of the device.
+    :param socket_id: str: The sid of the socket connection to notify.
+    :param export_format: str: One of 'xlsx', 'csv', 'parquet' or 'arrow'.
+    :return: dict: The 'job_id' and 'status' of the export, or an 'error'.
+    """
+    key = (device_id, export_format)
+    cached = export_results.get(key)
+    if cached is not None:
+        socketio.emit('export_response', cached, room=socket_id)
+        SOCKETIO_EMITS.inc(event='export_response')
+        return {'job_id': cached['job_id'], 'status': 'done'}
+
+    with export_jobs_lock:
+        job = export_jobs.get(key)
+        if job is not None:
+            job['sockets'].add(socket_id)
+            return {'job_id': job['job_id'], 'status': 'running'}
+        if len(export_jobs) >= EXPORT_MAX_JOBS:
+            return {'error': 'Too many exports in progress, try again later'}
+        job = {'job_id': secrets.token_urlsafe(12), 'device_id': device_id, 'format': export_format,
+               'sockets': {socket_id}}
+        export_jobs[key] = job
+
+    socketio.emit('export_progress', {'job_id': job['job_id'], 'device_id': device_id, 'status': 'queued'},
+                  room=socket_id)
+    SOCKETIO_EMITS.inc(event='export_progress')
+    export_pool.submit(run_export_job, job)
+    return {'job_id': job['job_id'], 'status': 'queued'}
+
+
+def run_export_job(job: dict) -> None:
+    """
+    Runs a queued export and sends the result to every client waiting for it.
+
+    :param job: dict: The job, containing 'job_id', 'device_id', 'format' and the 'sockets' to notify.
+    :return: None
+    """
+    device_id = job['device_id']
+    key = (device_id, job['format'])
+
+    def emit_progress(rows: int, total: int) -> None:
+        progress = {
+            'job_id': job['job_id'],
+            'device_id': device_id,
+            'status': 'running',
+            'rows': rows,
+            'total': total,
+            'percent': round(100 * rows / total, 1) if total else 100.0,
+        }
+        for socket_id in list(job['sockets']):
+            socketio.emit('export_progress', progress, room=socket_id)
+            SOCKETIO_EMITS.inc(event='export_progress')
+
+    start = time.perf_counter()
+    try:
+        response = create_export(device_id, emit_progress, job['format'])
+        if response is None:
+            response = {'job_id': job['job_id'], 'error': 'Device not found'}
+            status = 'not_found'
+        else:
+            response['job_id'] = job['job_id']
+            export_results.set(key, response)
+            status = 'ok'
+    except Exception as e:
+        log.error("Export of device %s failed: %s", device_id, e)
+        response = {'job_id': job['job_id'], 'error': 'Export failed'}
+        status = 'error'
+    EXPORT_SECONDS.observe(time.perf_counter() - start, format=job['format'], status=status)
+
+    with export_jobs_lock:
+        export_jobs.pop(key, None)
+        sockets = list(job['sockets'])
+
+    for socket_id in sockets:
+        socketio.emit('export_response', response, room=socket_id)
+        SOCKETIO_EMITS.inc(event='export_response')
+
+
+def track_progress(records: typing.Iterable[dict], total: int,
+                   progress: typing.Callable[[int, int], None]) -> typing.Iterator[dict]:
+    """
+    Passes records through, reporting every EXPORT_PROGRESS_EVERY records how many went by.
+
+    :param records: Iterable[dict]: The records to pass through.
+    :param total: int: The expected number of records.
+    :param progress: Callable[[int, int], None]: Called with the number of records so far and the total.
+    :return: Iterator[dict]: The records.
+    """
+    progress(0, total)
+    count = 0
+    for count, record in enumerate(records, 1):
+        yield record
+        if count % EXPORT_PROGRESS_EVERY == 0:
+            progress(count, total)
+    if count % EXPORT_PROGRESS_EVERY:
+        progress(count, total)
+
+
+def create_export(device_id: str, progress: typing.Callable[[int, int], None] = None,
+                  export_format: str = 'xlsx') -> dict or None:
+    """
+    Writes the history of a device to a file, streaming the sensor records from the database.
+    Small files are returned inline, larger ones are stored in GridFS for EXPORT_TTL seconds and
+    returned as a download URL any worker can serve.
+
+    :param device_id: str: The ID of the device.
+    :param progress: Callable[[int, int], None]: Optional callback receiving the number of records
+        written so far and the total.
+    :param export_format: str: One of 'xlsx', 'csv', 'parquet' or 'arrow'.
+    :return: dict or None: The 'file' bytes, or the 'url' and 'size' of the download, with the 'filename'.
+        None if the device does not exist.
+    """
+    device = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)}, {'_id': 1})
+    if not device:
+        return None
+
+    records = iter_sensor_records(device_id)
+    if progress is not None:
+        records = track_progress(records, count_sensor_records(device_id), progress)
+
+    cleanup_exports()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    export_id = secrets.token_urlsafe(24)
+    path = os.path.join(EXPORT_DIR, f"{export_id}.{FILE_SUFFIXES[export_format]}")
+
+    try:
+        save_export({
+            'record': records,
+            'water_usage': get_water_usage(device_id),
+            'water_totals': get_monthly_water_totals(device_id),
+        }, path, export_format, EXPORT_ROW_GROUP_PERIOD)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    filename = export_filename(export_format)
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if size <= EXPORT_INLINE_MAX_BYTES:
+                return {'file': f.read(), 'filename': filename}
+            export_files.upload_from_stream_with_id(export_id, filename, f,
+                                                    metadata={'device_id': device_id, 'format': export_format})
+    finally:
+        os.remove(path)
+
+    r.set(export_key(export_id), filename, ex=EXPORT_TTL)
+    return {'url': f"/device/export/{export_id}", 'filename': filename, 'size': size}
+
+
+def get_export(export_id: str) -> tuple[typing.BinaryIO, str] or None:
+    """
+    Opens the export file of a download ID.
+
+    :param export_id: str: The ID of the export.
+    :return: tuple[BinaryIO, str] or None: The file, to be read and closed by the caller, and the name to download
+        it as, or None if the export is unknown or expired.
+    """
+    filename = r.get(export_key(export_id))
+    if not filename:
+        return None
+    try:
+        return export_files.open_download_stream(export_id), filename
+    except NoFile:
+        return None
+
+
+def cleanup_exports() -> None:
+    """
+    Deletes the exports older than EXPORT_TTL, along with the files left in EXPORT_DIR by interrupted exports.
+
+    :return: None
+    """
+    expired_at = datetime.now(timezone.utc) - timedelta(seconds=EXPORT_TTL)
+    for grid_file in export_files.find({'uploadDate': {'$lt': expired_at}}):
+        try:
+            export_files.delete(grid_file._id)
+        except NoFile:
+            # Deleted by another worker in the meantime
+            pass
+
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    expired = time.time() - EXPORT_TTL
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+        except OSError:
+            # Removed by another worker in the meantime
+            pass
@@ -1,131 +1,215 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
+import multiprocessing
 
 from src.config.mongo import mongo_db, DEVICE_COLLECTION, USER_COLLECTION
-from src.utils.excel_manager import export_to_excel_devices
-import smtplib
+from src.config.redis import r
+from src.service.record_service import month_bounds
+from src.service.rollup_service import get_rollups, get_monthly_water_totals
+from src.utils.mailer import SMTPSession
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import formatdate
 from email import encoders
 from email.mime.base import MIMEBase
-from src.utils.secrets import SENDER_EMAIL, SENDER_PASSWORD, SMTP_SERVER
+from src.utils.secrets import SENDER_EMAIL, SENDER_PASSWORD, SMTP_SERVER, REPORT_WORKERS
 from bson import ObjectId
 
+# The checkpoint of a month is kept until well after the next month's run
+REPORT_CHECKPOINT_TTL = 40 * 24 * 60 * 60
 
-def send_monthly_report() -> None:
+
+def report_month(now: datetime) -> tuple[int, int]:
     """
-    Send a monthly report via email.
-    This function should be implemented to gather the necessary data and send the email.
+    Returns the month a report run covers.
 
-    :return: None
+    :param now: datetime: The time of the run.
+    :return: tuple[int, int]: The year and month of the report.
     """
-    users = mongo_db[USER_COLLECTION].find()
+    if now.day == 1:
+        # If today is the first day of the month, fetch data for the previous month
+        if now.month == 1:
+            return now.year - 1, 12
+        return now.year, now.month - 1
+    # If today is not the first day of the month, fetch data for the current month
+    return now.year, now.month
+
+
+def report_checkpoint_key(year: int, month: int) -> str:
+    """
+    Returns the key of the Redis set holding the users whose report of a month was sent.
+
+    :param year: int: The year of the report.
+    :param month: int: The month of the report.
+    :return: str: The Redis key.
+    """
+    return f"report:{year:04d}/{month:02d}:sent"
+
+
+def build_user_report(user_id: str, device_ids: list[str], year: int, month: int) -> bytes or None:
+    """
+    Builds the report workbook of a user from the monthly and daily rollups of the devices. Runs in a worker
+    process, it reads its own data so that only the device IDs and the finished workbook cross the process boundary.
+
+    :param user_id: str: The ID of the user.
+    :param device_ids: list[str]: The IDs of the user's devices.
+    :param year: int: The year of the report.
+    :param month: int: The month of the report.
+    :return: bytes or None: The workbook, or None if no device has records for the month.
+    """
+    object_ids = [ObjectId(device_id) for device_id in device_ids if device_id and ObjectId.is_valid(device_id)]
+    devices = {
+        str(device['_id']): device
+        for device in mongo_db[DEVICE_COLLECTION].find({'_id': {'$in': object_ids}}, {"name": 1})
+    }
+
+    start, _ = month_bounds(year, month)
+    report_data = []
+    for device_id in device_ids:
+        device_data = devices.get(str(device_id))
+        if not device_data:
+            print(f"No records found for device {device_id} of user {user_id}")
+            continue
+
+        # The report reads one rollup per day of the month, the raw records are left to the explicit export
+        rollups = get_rollups(str(device_id), 'month', start, start)
+        summary = rollups[0] if rollups else None
+        if summary is None or not summary['count']:
+            print(f"No records found for device {device_id} in the last month")
+            continue
+
+        # Water used per month of the report's year, up to the report month
+        water_totals = {
+            key: water_used for key, water_used in get_monthly_water_totals(str(device_id)).items()
+            if key[:4] == start[:4] and key <= start[:7]
+        }
+
+        report_data.append({
+            "device_id": str(device_id),
+            "name": device_data.get("name", "Unknown Device"),
+            "summary": summary,
+            # Day keys are compared as strings, "/31" closes every month
+            "daily": get_rollups(str(device_id), 'day', start, f"{start[:7]}/31"),
+            "water_totals": water_totals,
+        })
+
+    if not report_data:
+        return None
+
+    # Export to Excel
+    # Imported here, the report workers load pandas and openpyxl, the process scheduling the reports does not
+    from src.utils.excel_manager import export_to_excel_devices
+    return export_to_excel_devices(report_data).getvalue()
+
+
+def build_report_message(user_email: str, report: bytes) -> MIMEMultipart:
+    """
+    Builds the email carrying a monthly report.
+
+    :param user_email: str: The recipient.
+    :param report: bytes: The report workbook.
+    :return: MIMEMultipart: The message.
+    """
+    msg = MIMEMultipart()
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = user_email
+    msg['Subject'] = 'Monthly Report - Smart Irrigation System'
+    msg.attach(MIMEText("Please find attached the monthly report for your devices.", 'plain'))
+    msg['Date'] = formatdate(localtime=True)
+
+    part = MIMEBase('application', "octet-stream")
+    part.set_payload(report)
+    encoders.encode_base64(part)
+    part.add_header('Content-Disposition', 'attachment; filename="monthly_report.xlsx"')
+    msg.attach(part)
+    return msg
+
+
+def iter_report_users(sent: set):
+    """
+    Iterates over the users who should receive a report and did not get it yet.
+
+    :param sent: set: The IDs of the users whose report was already sent.
+    :return: Iterator[tuple[str, str, list[str]]]: The ID, email and device IDs of each user.
+    """
+    users = mongo_db[USER_COLLECTION].find({}, {"email": 1, "devices": 1})
 
     for user in users:
-        print(f"Processing user: {user}")
+        user_id = str(user['_id'])
         user_email = user.get("email")
+        if not user_email:
+            continue
         if "example.com" in user_email:
-            print(f"Skipping user {user['_id']} with example.com email: {user_email}")
+            print(f"Skipping user {user_id} with example.com email: {user_email}")
             continue
         if len(user_email) < 8:
-            print(f"Invalid email for user {user['_id']}: {user_email}")
+            print(f"Invalid email for user {user_id}: {user_email}")
             continue
-        if not user_email:
+        if user_id in sent:
             continue
 
-        # Fetch device data for the user
         devices = user.get("devices", [])
-
-        now = datetime.now()
-        # fetch records for the last month
-        current_month = now.month
-        current_day = now.day
-        current_year = now.year
-
-        if current_day == 1:
-            # If today is the first day of the month, fetch data for the previous month
-            if current_month == 1:
-                last_month = 12
-                year = now.year - 1
-            else:
-                last_month = current_month - 1
-                year = now.year
-        else:
-            # If today is not the first day of the month, fetch data for the current month
-            last_month = current_month
-            year = now.year
-
         if not devices:
-            print(f"No devices found for user {user['_id']}")
+            print(f"No devices found for user {user_id}")
             continue
 
-        report_data = []
-        for device_id in devices:
-            if not device_id:
-                print(f"Device ID not found for user {user['_id']}")
-                continue
-
-            # Fetch device records for the last month
-            device_data = mongo_db[DEVICE_COLLECTION].find_one(
-                {"_id": ObjectId(device_id)},
-            )
-
-            if not device_data:
-                print(f"No records found for device {device_id} of user {user['_id']}")
-                continue
-
-            # Filter records for the last month
-            filtered_records = [
-                record for record in device_data.get("record", [])
-                if record["timestamp"][:7] == f"{year}/{last_month:02d}"
-            ]
-
-            filtered_water_usage = [
-                record for record in device_data.get("water_usage", [])
-                if record["date"][:7] == f"{year}/{last_month:02d}"
-            ]
-
-            if not filtered_records:
-                print(f"No records found for device {device_id} in the last month")
-                continue
-
-            report_data.append({
-                "device_id": str(device_id),
-                "name": device_data.get("name", "Unknown Device"),
-                "record": filtered_records,
-                "water_usage": filtered_water_usage
-            })
-
-        # Export to Excel
-        excel_file = export_to_excel_devices(report_data)  # ByteIO object
-
-        if not excel_file:
-            print(f"Failed to generate report for user {user['_id']}")
-            continue
+        yield user_id, user_email, devices
+
+
+def send_monthly_report() -> None:
+    """
+    Send a monthly report via email.
+    The workbooks are built in a pool of REPORT_WORKERS processes and sent through a single SMTP session.
+    Every user whose report was sent is recorded in Redis, a run interrupted midway can be started again
+    and only the remaining users are processed.
 
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = user_email
-        msg['Subject'] = 'Monthly Report - Smart Irrigation System'
-        msg.attach(MIMEText("Please find attached the monthly report for your devices.", 'plain'))
-        msg['Date'] = formatdate(localtime=True)
-
-        part = MIMEBase('application', "octet-stream")
-        part.set_payload(excel_file.getvalue())
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', 'attachment; filename="monthly_report.xlsx"')
-        msg.attach(part)
-
-        print(f"Sending email to {user_email}...")
-
-        try:
-            srv = smtplib.SMTP(SMTP_SERVER, 587)
-            srv.starttls()  # Secure the connection
-            srv.login(SENDER_EMAIL, SENDER_PASSWORD)  # Log in with sender's credentials
-            srv.send_message(msg)  # Send the email
-            srv.quit()  # Terminate the connection
-        except Exception as e:
-            print(f"Failed to send email to {user_email}: {e}")
+    :return: None
+    """
+    year, month = report_month(datetime.now())
+    checkpoint = report_checkpoint_key(year, month)
+    sent = r.smembers(checkpoint)
+    if sent:
+        print(f"Resuming report run of {year}/{month:02d}, {len(sent)} reports already sent")
+
+    users = iter_report_users(sent)
+    pending = {}
+    # Spawned workers open their own database connections instead of sharing the parent's sockets
+    with ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool, \
+            SMTPSession(SMTP_SERVER, 587, SENDER_EMAIL, SENDER_PASSWORD) as smtp:
+        while True:
+            # Keep a bounded number of reports in flight so memory does not grow with the user count
+            while len(pending) < REPORT_WORKERS * 2:
+                user = next(users, None)
+                if user is None:
+                    break
+                user_id, user_email, devices = user
+                print(f"Processing user: {user_id}")
+                pending[pool.submit(build_user_report, user_id, devices, year, month)] = (user_id, user_email)
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                user_id, user_email = pending.pop(future)
+                try:
+                    report = future.result()
+                except Exception as e:
+                    print(f"Failed to generate report for user {user_id}: {e}")
+                    continue
+                if report is None:
+                    print(f"No data to report for user {user_id}")
+                    continue
+
+                print(f"Sending email to {user_email}...")
+                try:
+                    smtp.send(build_report_message(user_email, report))
+                except Exception as e:
+                    print(f"Failed to send email to {user_email}: {e}")
+                    continue
+
+                r.sadd(checkpoint, user_id)
+                r.expire(checkpoint, REPORT_CHECKPOINT_TTL)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,36 @@
 import json
-import pandas as pd
 from bson.objectid import ObjectId
 from pymongo.errors import DuplicateKeyError
-from redis import ResponseError
 from src.config.mongo import mongo_db, DEVICE_COLLECTION
-from src.config.redis import r
 from src.config.protocol import mqtt, socketio
+from src.service.device_meta_service import get_device_meta, remember_device
+from src.service.record_service import append_sensor_records
+from src.service.rollup_service import update_sensor_rollups, record_water_rollup
+from src.service.water_service import add_water_usage
+from src.service.socket_service import device_room
+from src.utils.batch_queue import BatchQueue
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
 from src.utils.predict import predict_water
+from src.utils.secrets import (MQTT_SHARED_GROUP, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_QUEUE_SIZE, INGEST_PUT_TIMEOUT,
+                               PREDICT_BATCH_SIZE, PREDICT_MAX_LATENCY_MS, PREDICT_QUEUE_SIZE)
+
+FEATURE_COLUMNS = ['Soil Moisture', 'Temperature', 'Air Humidity']
+
+# Topics published by every device, '+' matches the device ID
+DEVICE_TOPICS = ['+/record/sensor_data', '+/record/water_used', '+/predict']
+
+log = get_logger('mqtt')
+# Logs written for every message, sampled so they stay cheap under load
+message_log = get_logger('mqtt.messages', sampled=True)
+
+MQTT_MESSAGES = metrics.counter('terraflow_mqtt_messages_total', 'MQTT messages received, by topic type', ('topic',))
+MQTT_HANDLER_SECONDS = metrics.histogram('terraflow_mqtt_handler_seconds',
+                                         'Time spent handling an MQTT message, by topic type', ('topic',))
+MQTT_DISCARDED = metrics.counter('terraflow_mqtt_discarded_total', 'MQTT messages discarded, by reason', ('reason',))
+PREDICTION_SECONDS = metrics.histogram('terraflow_prediction_seconds', 'Time spent predicting a batch of requests')
+SOCKETIO_EMITS = metrics.counter('terraflow_socketio_emits_total', 'Socket.IO events emitted, by event type',
+                                 ('event',))
 
 
 def extract_device_id(topic: str) -> str:
@@ -19,55 +43,82 @@ def extract_device_id(topic: str) -> str:
     return topic.split('/')[0]
 
 
+def shared_topic(topic: str) -> str:
+    """
+    Returns the topic filter a backend worker subscribes with.
+    When a shared group is configured the broker hands each message to only one worker of the group,
+    which splits the device traffic between all running workers.
+
+    :param topic: str: The MQTT topic (e.g., "device_id/record/sensor_data").
+    :return: str: The topic filter to subscribe to.
+    """
+    if not MQTT_SHARED_GROUP:
+        return topic
+    return f'$share/{MQTT_SHARED_GROUP}/{topic}'
+
+
+def subscribe_device_topics() -> None:
+    """
+    Subscribes to the topics of all devices at once through wildcard topic filters.
+    The subscriptions are restored by the MQTT client when it reconnects.
+
+    :return: None
+    """
+    for topic in DEVICE_TOPICS:
+        mqtt.subscribe(shared_topic(topic))
+
+
+def is_known_device(device_id: str) -> bool:
+    """
+    Checks whether a device is registered. The check is served from the device cache,
+    so the database is only queried for devices not seen recently.
+
+    :param device_id: str: The ID of the device.
+    :return: bool: True if the device is registered.
+    """
+    return get_device_meta(device_id) is not None
+
+
 def register_device(payload: str) -> None:
     """
     Registers a new IoT device.
+    The device topics are covered by the wildcard subscriptions, nothing has to be subscribed per device.
 
     :param payload: str: JSON string containing the device ID.
     :return: None
     """
     try:
         json_data = json.loads(payload)
-        print('JSON data:', json_data)
+        log.debug("Registration request: %s", json_data)
 
         device_id = json_data['device_id']
 
-        device = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
-        if not device:
+        if get_device_meta(device_id) is None:
 
             ctrl_json = {
                 '_id': ObjectId(device_id),
                 'name': device_id,
-                'record': [],
-                'water_usage': []
             }
 
             try:
                 device = mongo_db[DEVICE_COLLECTION].insert_one(ctrl_json)
-                print('device registered:', device.inserted_id)
+                log.info("Device registered: %s", device.inserted_id)
+                remember_device(device_id, device_id)
             except DuplicateKeyError:
-                print(f"device with ID {device_id} is already registered. Skipping insertion.")
-
-        # Manage MQTT subscriptions
-        mqtt.unsubscribe(f'{device_id}/record/sensor_data')
-        mqtt.unsubscribe(f'{device_id}/record/water_used')
-        mqtt.unsubscribe(f'{device_id}/predict')
-
-        mqtt.subscribe(f'{device_id}/record/sensor_data')
-        mqtt.subscribe(f'{device_id}/record/water_used')
-        mqtt.subscribe(f'{device_id}/predict')
+                log.info("Device with ID %s is already registered. Skipping insertion.", device_id)
 
     except KeyError as e:
-        print(f"KeyError: Missing key in payload - {e}")
+        log.warning("Missing key in registration payload: %s", e)
     except json.JSONDecodeError as e:
-        print(f"JSONDecodeError: Invalid JSON payload - {e}")
+        log.warning("Invalid registration payload: %s", e)
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        log.error("Unexpected error while registering a device: %s", e)
 
 
 def predict(payload: str, topic: str) -> None:
     """
     handles prediction requests for a device.
+    The request is validated and queued, predictions are computed in batches by predict_batch.
 
     :param payload: str: JSON string containing sensor data.
     :param topic: str: MQTT topic string.
@@ -81,24 +132,51 @@ def predict(payload: str, topic: str) -> None:
     if not (isinstance(moisture, (int, float)) and
             isinstance(temperature, (int, float)) and
             isinstance(humidity, (int, float))):
-        print('Invalid sensor data:', sensor_data)
+        MQTT_DISCARDED.inc(reason='invalid')
+        message_log.warning("Invalid sensor data: %s", sensor_data)
         return
-    df = pd.DataFrame({
-        'Soil Moisture': [moisture],
-        'Temperature': [temperature],
-        'Air Humidity': [humidity]
-    })
     device_id = extract_device_id(topic)
-    prediction = predict_water(df)
-    verdict = 1 if prediction[0] == 1 else 0
-    print('Verdict:', verdict)
-    mqtt.publish(f'{device_id}/prediction',
-                 json.dumps({'prediction': verdict}))
+    prediction_batcher.put((device_id, (moisture, temperature, humidity)))
+
+
+def predict_batch(batch: list[tuple[str, tuple[float, float, float]]]) -> None:
+    """
+    Runs a single prediction over the queued requests of many devices and publishes each verdict.
+
+    :param batch: list[tuple[str, tuple[float, float, float]]]: Pairs of device ID and
+        (moisture, temperature, humidity) features.
+    :return: None
+    """
+    # Imported here so workers that never predict do not pay for loading NumPy and pandas
+    import numpy as np
+    import pandas as pd
+
+    features = np.array([row for _, row in batch], dtype=np.float64)
+    # The model was fitted on named columns, wrapping the matrix keeps it from warning on every call
+    with PREDICTION_SECONDS.time():
+        predictions = predict_water(pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False))
+
+    for (device_id, _), prediction in zip(batch, predictions):
+        verdict = 1 if prediction == 1 else 0
+        mqtt.publish(f'{device_id}/prediction',
+                     json.dumps({'prediction': verdict}))
+
+
+prediction_batcher = BatchQueue(
+    'prediction_batcher',
+    predict_batch,
+    max_batch_size=PREDICT_BATCH_SIZE,
+    max_latency=PREDICT_MAX_LATENCY_MS / 1000,
+    max_queue_size=PREDICT_QUEUE_SIZE,
+)
+metrics.register_stats('terraflow_batch_queue', 'Counters of the batch queues', prediction_batcher.stats,
+                       {'queue': prediction_batcher.name})
 
 
 def record_sensor_data(payload: str, topic: str) -> None:
     """
     records sensor data from MQTT messages.
+    The message is validated and queued, it is persisted and forwarded to users by flush_sensor_records.
 
     :param payload: str: JSON string containing sensor data and timestamp.
     :param topic: str: MQTT topic string.
@@ -107,54 +185,65 @@ def record_sensor_data(payload: str, topic: str) -> None:
     try:
         json_data = json.loads(payload)
         if 'sensor_data' not in json_data or 'timestamp' not in json_data:
-            print('Invalid payload: Missing sensor_data or timestamp:', json_data)
+            MQTT_DISCARDED.inc(reason='invalid')
+            message_log.warning("Invalid payload, missing sensor_data or timestamp: %s", json_data)
             return
 
         device_id = extract_device_id(topic)
-        res = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
+        sensor_ingest.put((device_id, json_data))
 
-        if not res:
-            print(f"device with ID {device_id} not found in database.")
-            return
+    except Exception as e:
+        log.error("Unexpected error while handling %s: %s", topic, e)
 
-        sensor_data = res.get('record', [])
-        if not isinstance(sensor_data, list):
-            print(f"Invalid data type for 'record'. Expected list, found {type(sensor_data)}.")
-            return
 
-        sensor_data.append(json_data)
-        mongo_db[DEVICE_COLLECTION].update_one({'_id': ObjectId(device_id)}, {'$set': {'record': sensor_data}})
+def flush_sensor_records(batch: list[tuple[str, dict]]) -> None:
+    """
+    Persists a batch of queued sensor records with one bulk write, folds them into the daily and monthly
+    rollups and forwards them to the subscribed users.
+    The devices were checked by dispatch_message before their records were queued.
 
-        try:
-            device_key = f"device:{device_id}"
-            user_list = json.loads(r.get(device_key)) if r.exists(device_key) else []
+    :param batch: list[tuple[str, dict]]: Pairs of device ID and sensor record.
+    :return: None
+    """
+    if not batch:
+        return
 
-            for user in user_list:
-                user_key = f"user:{user}"
-                socket_id = r.get(user_key) if r.exists(user_key) else None
+    # Only the records that were stored are folded into the rollups and forwarded
+    batch = append_sensor_records(batch)
+    update_sensor_rollups(batch)
 
-                if not socket_id:
-                    print(f"No socket_id found for user {user}. Skipping emit.")
-                    if r.exists(device_key):
-                        _user_list = json.loads(r.get(device_key))
-                        if user in _user_list:
-                            _user_list.remove(user)
-                            r.set(device_key, json.dumps(_user_list))
-                            print(f"Removed user {user} from device {device_id}.")
-                    continue
+    for device_id, json_data in batch:
+        emit_sensor_data(device_id, json_data)
 
-                socketio.emit(f"{device_id}/record", json_data, room=socket_id)
 
-        except ResponseError as redis_error:
-            print(f"Redis ResponseError: {redis_error}")
+def emit_sensor_data(device_id: str, json_data: dict) -> None:
+    """
+    Forwards a sensor record to the clients watching the device.
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+    :param device_id: str: The ID of the device.
+    :param json_data: dict: The sensor record.
+    :return: None
+    """
+    socketio.emit(f"{device_id}/record", json_data, to=device_room(device_id))
+    SOCKETIO_EMITS.inc(event='record')
+
+
+sensor_ingest = BatchQueue(
+    'sensor_ingest',
+    flush_sensor_records,
+    max_batch_size=INGEST_BATCH_SIZE,
+    max_latency=INGEST_FLUSH_INTERVAL,
+    max_queue_size=INGEST_QUEUE_SIZE,
+    put_timeout=INGEST_PUT_TIMEOUT,
+)
+metrics.register_stats('terraflow_batch_queue', 'Counters of the batch queues', sensor_ingest.stats,
+                       {'queue': sensor_ingest.name})
 
 
 def record_water_used(payload: str, topic: str) -> None:
     """
     records water usage data from MQTT messages.
+    The usage is added to the counters of the device with atomic upserts, nothing is read on the write path.
 
     :param payload: str: JSON string containing water usage data and timestamp.
     :param topic: str: MQTT topic string.
@@ -163,42 +252,68 @@ def record_water_used(payload: str, topic: str) -> None:
     try:
         json_data = json.loads(payload)
         if 'water_used' not in json_data or 'date' not in json_data:
-            print('Invalid payload: Missing water_used or date:', json_data)
+            MQTT_DISCARDED.inc(reason='invalid')
+            message_log.warning("Invalid payload, missing water_used or date: %s", json_data)
+            return
+        if not isinstance(json_data['water_used'], (int, float)):
+            MQTT_DISCARDED.inc(reason='invalid')
+            message_log.warning("Invalid water usage: %s", json_data)
             return
 
         device_id = extract_device_id(topic)
-        res = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
+        add_water_usage(device_id, json_data['date'], json_data['water_used'])
+        record_water_rollup(device_id, json_data['date'], json_data['water_used'])
 
-        if not res:
-            print(f"device with ID {device_id} not found in database.")
-            return
+        socketio.emit(f"{device_id}/water_usage", json_data, to=device_room(device_id))
+        SOCKETIO_EMITS.inc(event='water_usage')
 
-        water_used = res.get('water_usage', [])
-        if not isinstance(water_used, list):
-            print(f"Invalid data type for 'water_usage'. Expected list, found {type(water_used)}.")
-            return
+    except Exception as e:
+        log.error("Unexpected error while handling %s: %s", topic, e)
 
-        last_entry = water_used[-1] if water_used else None
 
-        if last_entry and last_entry['date'] == json_data['date']:
-            last_entry['water_used'] += json_data['water_used']
-            water_used[-1] = last_entry
-        else:
-            water_used.append(json_data)
+# Handlers of the device topics, keyed by the topic without the device ID
+DEVICE_TOPIC_HANDLERS = {
+    'record/sensor_data': record_sensor_data,
+    'record/water_used': record_water_used,
+    'predict': predict,
+}
 
-        mongo_db[DEVICE_COLLECTION].update_one({'_id': ObjectId(device_id)},
-                                               {'$set': {'water_usage': water_used}})
 
-        try:
-            device_key = f"device:{device_id}"
-            user_list = json.loads(r.get(device_key)) if r.exists(device_key) else []
-            for user in user_list:
-                user_key = f"user:{user}"
-                user_data = r.get(user_key) if r.exists(user_key) else ""
-                socketio.emit(f"{device_id}/water_usage", json_data, room=user_data)
-                print(f"Emitted data to user {user} with socket ID {user_data}")
-        except ResponseError as redis_error:
-            print(f"Redis ResponseError: {redis_error}")
+def dispatch_message(topic: str, payload: str) -> None:
+    """
+    Routes an MQTT message to the handler of its topic. Messages of unregistered devices, or of devices that
+    could not be looked up, are discarded.
+    Messages are counted and their handling timed per topic type, without the device ID.
 
+    :param topic: str: MQTT topic string.
+    :param payload: str: The decoded message payload.
+    :return: None
+    """
+    if topic == 'register':
+        MQTT_MESSAGES.inc(topic='register')
+        with MQTT_HANDLER_SECONDS.time(topic='register'):
+            register_device(payload)
+        return
+
+    device_id, _, action = topic.partition('/')
+    handler = DEVICE_TOPIC_HANDLERS.get(action)
+    if handler is None:
+        MQTT_MESSAGES.inc(topic='unknown')
+        MQTT_DISCARDED.inc(reason='unknown_topic')
+        message_log.warning("Unknown topic received: %s", topic)
+        return
+
+    MQTT_MESSAGES.inc(topic=action)
+    try:
+        known = is_known_device(device_id)
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        # The message is dropped rather than raising into the MQTT client loop, e.g. while MongoDB is unreachable
+        MQTT_DISCARDED.inc(reason='lookup_error')
+        message_log.error("Could not look up device %s: %s", device_id, e)
+        return
+    if not known:
+        MQTT_DISCARDED.inc(reason='unknown_device')
+        message_log.warning("Device with ID %s not found in database.", device_id)
+        return
+    with MQTT_HANDLER_SECONDS.time(topic=action):
+        handler(payload, topic)
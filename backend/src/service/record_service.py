@@ -0,0 +1,323 @@
+import json
+from collections import Counter
+from datetime import datetime
+from typing import Iterator
+
+import pymongo
+from pymongo import UpdateOne
+
+from src.config.mongo import mongo_db, DEVICE_COLLECTION, SENSOR_COLLECTION
+from src.utils.logger import get_logger
+
+log = get_logger('records', sampled=True)
+migration_log = get_logger('records.migration')
+
+# Form of the stored timestamps, they compare lexicographically in chronological order
+TIMESTAMP_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+
+def normalize_timestamp(timestamp: str) -> str:
+    """
+    Normalizes a device timestamp to the "YYYY/MM/DD HH:MM:SS" form so that timestamps compare lexicographically.
+
+    :param timestamp: str: The timestamp as sent by the device (e.g., "2025/05/05 05:17:35" or "2025-05-05T05:17:35Z").
+    :return: str: The normalized timestamp.
+    """
+    return str(timestamp).replace('-', '/').replace('T', ' ').rstrip('Z')
+
+
+def bucket_day(timestamp: str) -> str:
+    """
+    Returns the key of the daily bucket a timestamp belongs to.
+
+    :param timestamp: str: The timestamp of a sensor record.
+    :return: str: The day key in the "YYYY/MM/DD" format.
+    """
+    return normalize_timestamp(timestamp)[:10]
+
+
+def month_bounds(year: int, month: int) -> tuple[str, str]:
+    """
+    Returns the range covering a calendar month, usable as the start (inclusive) and end (exclusive) of a query.
+
+    :param year: int: The year of the month.
+    :param month: int: The month number (1-12).
+    :return: tuple[str, str]: The first timestamp of the month and the first timestamp of the next month.
+    """
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year:04d}/{month:02d}/01 00:00:00", f"{next_year:04d}/{next_month:02d}/01 00:00:00"
+
+
+def ensure_indexes() -> None:
+    """
+    Creates the indexes used by the sensor record queries.
+
+    :return: None
+    """
+    mongo_db[SENSOR_COLLECTION].create_index(
+        [('device_id', pymongo.ASCENDING), ('day', pymongo.ASCENDING)],
+        unique=True,
+    )
+
+
+def canonical_sensor_record(record: dict) -> dict or None:
+    """
+    Checks that a sensor record can be stored and returns it with its timestamp in the canonical
+    "YYYY/MM/DD HH:MM:SS" form, which the day buckets and the range and cursor queries compare lexicographically.
+    The record must be a dictionary with a 'sensor_data' dictionary, a timestamp in any form normalize_timestamp
+    accepts (fractions of a second are dropped) and no operator-like keys.
+
+    :param record: dict: The sensor record.
+    :return: dict or None: A copy of the record with the canonical timestamp, None if it cannot be stored.
+    """
+    if not isinstance(record, dict) or not isinstance(record.get('sensor_data'), dict):
+        return None
+    if any(str(key).startswith('$') for key in (*record, *record['sensor_data'])):
+        return None
+    try:
+        timestamp = datetime.strptime(normalize_timestamp(record.get('timestamp')).split('.')[0], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return {**record, 'timestamp': timestamp.strftime(TIMESTAMP_FORMAT)}
+
+
+def append_sensor_records(records: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    """
+    Appends many sensor records at once, issuing one bulk write with a single upsert per touched bucket.
+    Records are stored with their canonical timestamp, those that cannot be stored are skipped and logged, so that
+    they do not fail the write of the others.
+
+    :param records: list[tuple[str, dict]]: Pairs of device ID and sensor record.
+    :return: list[tuple[str, dict]]: The pairs that were stored, with the canonical timestamps.
+    """
+    stored = [(device_id, canonical_sensor_record(record)) for device_id, record in records]
+    stored = [(device_id, record) for device_id, record in stored if record is not None]
+    if len(stored) < len(records):
+        log.warning("Skipped %d invalid sensor records out of %d", len(records) - len(stored), len(records))
+
+    buckets = {}
+    for device_id, record in stored:
+        timestamp = record['timestamp']
+        bucket = buckets.setdefault((device_id, bucket_day(timestamp)), {'records': [], 'timestamps': []})
+        bucket['records'].append(record)
+        bucket['timestamps'].append(timestamp)
+
+    if not buckets:
+        return stored
+
+    operations = [
+        UpdateOne(
+            {'device_id': device_id, 'day': day},
+            {
+                '$push': {'records': {'$each': bucket['records']}},
+                '$inc': {'count': len(bucket['records'])},
+                '$min': {'first': min(bucket['timestamps'])},
+                '$max': {'last': max(bucket['timestamps'])},
+            },
+            upsert=True,
+        )
+        for (device_id, day), bucket in buckets.items()
+    ]
+    mongo_db[SENSOR_COLLECTION].bulk_write(operations, ordered=False)
+    return stored
+
+
+def _bucket_query(device_id: str, start: str = None, end: str = None) -> dict:
+    # Query of the daily buckets overlapping a range of normalized timestamps
+    query = {'device_id': device_id}
+    day_range = {}
+    if start:
+        day_range['$gte'] = start[:10]
+    if end:
+        day_range['$lte'] = end[:10]
+    if day_range:
+        query['day'] = day_range
+    return query
+
+
+def _bucket_inside(bucket: dict, start: str = None, end: str = None) -> bool:
+    # Whether every record of the bucket is within the range, from the bounds stored with the bucket
+    return (not start or bucket.get('first', '') >= start) and (not end or bucket.get('last', '') < end)
+
+
+def _in_range(record: dict, start: str = None, end: str = None) -> bool:
+    timestamp = normalize_timestamp(record.get('timestamp', ''))
+    return not ((start and timestamp < start) or (end and timestamp >= end))
+
+
+def parse_cursor(cursor: str) -> tuple[str, int] or None:
+    """
+    Reads a cursor returned by iter_sensor_positions.
+
+    :param cursor: str: The cursor, the day of a bucket and the position of a record in it (e.g., "2025/05/05:17").
+    :return: tuple[str, int] or None: The day and position, None if the cursor is malformed.
+    """
+    day, _, index = str(cursor).rpartition(':')
+    if len(day) != 10 or not index.isdigit():
+        return None
+    return day, int(index)
+
+
+def format_cursor(day: str, index: int) -> str:
+    """
+    Builds the cursor of a sensor record from its position.
+
+    :param day: str: The day of the bucket holding the record.
+    :param index: int: The position of the record in the bucket.
+    :return: str: The cursor.
+    """
+    return f"{day}:{index}"
+
+
+def iter_sensor_positions(device_id: str, start: str = None, end: str = None,
+                          after: tuple[str, int] = None) -> Iterator[tuple[str, int, dict]]:
+    """
+    Iterates over the sensor records of a device in chronological bucket order, with their position.
+    Records are only ever appended to a bucket, so a position identifies a record even when several records
+    share a timestamp, and iteration can resume right after it.
+
+    :param device_id: str: The ID of the device.
+    :param start: str: Optional timestamp, records before it are skipped (inclusive).
+    :param end: str: Optional timestamp, records from it onwards are skipped (exclusive).
+    :param after: tuple[str, int]: Optional position (bucket day, index), records up to it are skipped.
+    :return: Iterator[tuple[str, int, dict]]: The day of the bucket, the position in it and the sensor record.
+    """
+    start = normalize_timestamp(start) if start else None
+    end = normalize_timestamp(end) if end else None
+
+    query = _bucket_query(device_id, start, end)
+    if after:
+        day_range = query.setdefault('day', {})
+        day_range['$gte'] = max(after[0], day_range.get('$gte', ''))
+    buckets = mongo_db[SENSOR_COLLECTION].find(query, {'day': 1, 'records': 1, 'first': 1, 'last': 1}) \
+        .sort('day', pymongo.ASCENDING)
+
+    for bucket in buckets:
+        # Buckets fully inside the range need no per-record filtering
+        inside = _bucket_inside(bucket, start, end)
+        skip = after[1] + 1 if after and bucket.get('day') == after[0] else 0
+        for index, record in enumerate(bucket.get('records', [])[skip:], start=skip):
+            if inside or _in_range(record, start, end):
+                yield bucket.get('day'), index, record
+
+
+def iter_sensor_records(device_id: str, start: str = None, end: str = None) -> Iterator[dict]:
+    """
+    Iterates over the sensor records of a device in chronological bucket order.
+    Only the buckets overlapping the requested range are read from the database.
+
+    :param device_id: str: The ID of the device.
+    :param start: str: Optional timestamp, records before it are skipped (inclusive).
+    :param end: str: Optional timestamp, records from it onwards are skipped (exclusive).
+    :return: Iterator[dict]: The sensor records within the range.
+    """
+    for _, _, record in iter_sensor_positions(device_id, start, end):
+        yield record
+
+
+def count_sensor_records(device_id: str, start: str = None, end: str = None) -> int:
+    """
+    Counts the sensor records of a device from the bucket counters.
+    Within a time range, only the timestamps of the buckets at its edges are read.
+
+    :param device_id: str: The ID of the device.
+    :param start: str: Optional timestamp, records before it are not counted (inclusive).
+    :param end: str: Optional timestamp, records from it onwards are not counted (exclusive).
+    :return: int: The number of stored records within the range.
+    """
+    if not start and not end:
+        result = list(mongo_db[SENSOR_COLLECTION].aggregate([
+            {'$match': {'device_id': device_id}},
+            {'$group': {'_id': None, 'total': {'$sum': '$count'}}},
+        ]))
+        return result[0]['total'] if result else 0
+
+    start = normalize_timestamp(start) if start else None
+    end = normalize_timestamp(end) if end else None
+
+    total = 0
+    buckets = mongo_db[SENSOR_COLLECTION].find(_bucket_query(device_id, start, end),
+                                               {'count': 1, 'first': 1, 'last': 1})
+    for bucket in buckets:
+        if _bucket_inside(bucket, start, end):
+            total += bucket.get('count', 0)
+            continue
+        edge = mongo_db[SENSOR_COLLECTION].find_one({'_id': bucket['_id']}, {'records.timestamp': 1}) or {}
+        total += sum(1 for record in edge.get('records', []) if _in_range(record, start, end))
+    return total
+
+
+def find_sensor_records(device_id: str, start: str = None, end: str = None) -> list[dict]:
+    """
+    Fetches the sensor records of a device within an optional time range.
+
+    :param device_id: str: The ID of the device.
+    :param start: str: Optional timestamp, records before it are skipped (inclusive).
+    :param end: str: Optional timestamp, records from it onwards are skipped (exclusive).
+    :return: list[dict]: The sensor records within the range.
+    """
+    return list(iter_sensor_records(device_id, start, end))
+
+
+def migrate_legacy_records() -> None:
+    """
+    Moves the sensor records still embedded in device documents into daily buckets.
+    Records that cannot be stored are kept on the device, in 'legacy_invalid_records', for inspection.
+    Safe to run more than once: a device is marked before its records are copied, and when a run stopped after
+    copying them, the next one skips the records already in the buckets.
+
+    :return: None
+    """
+    ensure_indexes()
+    devices = mongo_db[DEVICE_COLLECTION].find({'record.0': {'$exists': True}}, {'record': 1, 'legacy_migration': 1})
+    for device in devices:
+        device_id = str(device['_id'])
+        records = device.get('record', [])
+        pairs = [(device_id, record) for record in records]
+        if device.get('legacy_migration') == 'copying':
+            pairs = _not_yet_copied(device_id, pairs)
+        else:
+            mongo_db[DEVICE_COLLECTION].update_one({'_id': device['_id']}, {'$set': {'legacy_migration': 'copying'}})
+        stored = append_sensor_records(pairs)
+
+        invalid = [record for record in records if canonical_sensor_record(record) is None]
+        update = {'$unset': {'record': '', 'legacy_migration': ''}}
+        if invalid:
+            update['$push'] = {'legacy_invalid_records': {'$each': invalid}}
+        mongo_db[DEVICE_COLLECTION].update_one({'_id': device['_id']}, update)
+        migration_log.info("Migrated %d records of device %s, kept %d invalid ones in legacy_invalid_records",
+                           len(stored), device_id, len(invalid))
+
+
+def _not_yet_copied(device_id: str, pairs: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+    """
+    Drops the legacy records of a device that an interrupted migration already copied into its buckets.
+    Identical records are matched one to one, so legitimate duplicates of the history are still copied.
+
+    :param device_id: str: The ID of the device.
+    :param pairs: list[tuple[str, dict]]: Pairs of device ID and legacy sensor record.
+    :return: list[tuple[str, dict]]: The pairs still to copy.
+    """
+    canonical = [canonical_sensor_record(record) for _, record in pairs]
+    days = sorted({bucket_day(record['timestamp']) for record in canonical if record is not None})
+    copied = Counter(
+        _record_key(record)
+        for bucket in mongo_db[SENSOR_COLLECTION].find({'device_id': device_id, 'day': {'$in': days}}, {'records': 1})
+        for record in bucket.get('records', [])
+    )
+    remaining = []
+    for pair, record in zip(pairs, canonical):
+        if record is not None and copied[_record_key(record)] > 0:
+            copied[_record_key(record)] -= 1
+            continue
+        remaining.append(pair)
+    return remaining
+
+
+def _record_key(record: dict) -> str:
+    # Hashable form of a stored record, independent of the order of its keys
+    return json.dumps(record, sort_keys=True, default=str)
+
+
+if __name__ == "__main__":
+    migrate_legacy_records()
@@ -0,0 +1,200 @@
+import numbers
+from typing import Iterable
+
+import pymongo
+from pymongo import UpdateOne
+
+from src.config.mongo import mongo_db, DEVICE_COLLECTION, SENSOR_COLLECTION, ROLLUP_COLLECTION
+from src.service.record_service import normalize_timestamp
+from src.service.water_service import get_water_usage
+
+# Readings aggregated by the rollups
+ROLLUP_FIELDS = ('temperature', 'humidity', 'moisture')
+
+# Length of the timestamp prefix identifying a rollup period
+ROLLUP_PERIODS = {
+    'day': len('YYYY/MM/DD'),
+    'month': len('YYYY/MM'),
+}
+
+
+def ensure_rollup_indexes() -> None:
+    """
+    Creates the index used by the rollup upserts and range queries.
+
+    :return: None
+    """
+    mongo_db[ROLLUP_COLLECTION].create_index(
+        [('device_id', pymongo.ASCENDING), ('period', pymongo.ASCENDING), ('key', pymongo.ASCENDING)],
+        unique=True,
+    )
+
+
+def rollup_updates(records: Iterable[tuple[str, dict]]) -> list[UpdateOne]:
+    """
+    Builds the upserts folding sensor records into the daily and monthly rollups of their devices.
+    The records are aggregated in memory first, so a batch issues one update per touched rollup.
+
+    :param records: Iterable[tuple[str, dict]]: Pairs of device ID and sensor record.
+    :return: list[UpdateOne]: The rollup upserts.
+    """
+    rollups = {}
+    for device_id, record in records:
+        timestamp = normalize_timestamp(record['timestamp'])
+        sensor_data = record.get('sensor_data') or {}
+        for period, length in ROLLUP_PERIODS.items():
+            rollup = rollups.setdefault((device_id, period, timestamp[:length]), {'count': 0, 'stats': {}})
+            rollup['count'] += 1
+            for field in ROLLUP_FIELDS:
+                value = sensor_data.get(field)
+                if not isinstance(value, numbers.Real) or isinstance(value, bool):
+                    continue
+                stats = rollup['stats'].get(field)
+                if stats is None:
+                    rollup['stats'][field] = {'min': value, 'max': value, 'sum': value, 'count': 1}
+                    continue
+                stats['min'] = min(stats['min'], value)
+                stats['max'] = max(stats['max'], value)
+                stats['sum'] += value
+                stats['count'] += 1
+
+    operations = []
+    for (device_id, period, key), rollup in rollups.items():
+        update = {'$inc': {'count': rollup['count']}}
+        for field, stats in rollup['stats'].items():
+            update['$inc'][f'stats.{field}.sum'] = stats['sum']
+            update['$inc'][f'stats.{field}.count'] = stats['count']
+            update.setdefault('$min', {})[f'stats.{field}.min'] = stats['min']
+            update.setdefault('$max', {})[f'stats.{field}.max'] = stats['max']
+        operations.append(UpdateOne({'device_id': device_id, 'period': period, 'key': key}, update, upsert=True))
+    return operations
+
+
+def update_sensor_rollups(records: list[tuple[str, dict]]) -> None:
+    """
+    Folds a batch of sensor records into the rollups of their devices with one bulk write.
+
+    :param records: list[tuple[str, dict]]: Pairs of device ID and sensor record.
+    :return: None
+    """
+    operations = rollup_updates(records)
+    if operations:
+        mongo_db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def record_water_rollup(device_id: str, date: str, water_used: float) -> None:
+    """
+    Adds water usage to the monthly rollup of a device, and to the daily one when the date has a day.
+
+    :param device_id: str: The ID of the device.
+    :param date: str: The date of the usage, "YYYY/MM" or "YYYY/MM/DD".
+    :param water_used: float: The amount of water used.
+    :return: None
+    """
+    date = normalize_timestamp(date)
+    operations = [
+        UpdateOne(
+            {'device_id': device_id, 'period': period, 'key': date[:length]},
+            {'$inc': {'water_used': water_used}},
+            upsert=True,
+        )
+        for period, length in ROLLUP_PERIODS.items()
+        if len(date) >= length
+    ]
+    if operations:
+        mongo_db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def rollup_summary(rollup: dict) -> dict:
+    """
+    Converts a stored rollup to its response form, with the mean of each reading.
+
+    :param rollup: dict: The rollup document.
+    :return: dict: The 'key', 'count' and 'water_used' of the rollup, and the 'min', 'max', 'mean'
+        and 'count' of each reading.
+    """
+    summary = {
+        'key': rollup['key'],
+        'count': rollup.get('count', 0),
+        'water_used': rollup.get('water_used', 0),
+    }
+    for field in ROLLUP_FIELDS:
+        stats = rollup.get('stats', {}).get(field)
+        if not stats or not stats.get('count'):
+            summary[field] = None
+            continue
+        summary[field] = {
+            'min': stats['min'],
+            'max': stats['max'],
+            'mean': stats['sum'] / stats['count'],
+            'count': stats['count'],
+        }
+    return summary
+
+
+def get_rollups(device_id: str, period: str, start: str = None, end: str = None) -> list[dict]:
+    """
+    Fetches the rollups of a device in chronological order. Only one document per period is read,
+    whatever the number of samples it covers.
+
+    :param device_id: str: The ID of the device.
+    :param period: str: 'day' or 'month'.
+    :param start: str: Optional timestamp, periods before the one containing it are skipped.
+    :param end: str: Optional timestamp, periods after the one containing it are skipped.
+    :return: list[dict]: The rollup summaries.
+    """
+    length = ROLLUP_PERIODS[period]
+    query = {'device_id': device_id, 'period': period}
+    key_range = {}
+    if start:
+        key_range['$gte'] = normalize_timestamp(start)[:length]
+    if end:
+        key_range['$lte'] = normalize_timestamp(end)[:length]
+    if key_range:
+        query['key'] = key_range
+
+    rollups = mongo_db[ROLLUP_COLLECTION].find(query, {'_id': 0}).sort('key', pymongo.ASCENDING)
+    return [rollup_summary(rollup) for rollup in rollups]
+
+
+def get_monthly_water_totals(device_id: str) -> dict[str, float]:
+    """
+    Returns the water used by a device per month.
+
+    :param device_id: str: The ID of the device.
+    :return: dict[str, float]: The water used, keyed by "YYYY/MM".
+    """
+    rollups = mongo_db[ROLLUP_COLLECTION].find({'device_id': device_id, 'period': 'month'},
+                                               {'key': 1, 'water_used': 1})
+    return {rollup['key']: rollup.get('water_used', 0) for rollup in rollups}
+
+
+def rebuild_rollups() -> None:
+    """
+    Recomputes the rollups of every device from the stored sensor records and water usage.
+    Used to backfill the rollups of the data stored before they existed, safe to run more than once.
+
+    :return: None
+    """
+    ensure_rollup_indexes()
+    devices = mongo_db[DEVICE_COLLECTION].find({}, {'_id': 1})
+    for device in devices:
+        device_id = str(device['_id'])
+        mongo_db[ROLLUP_COLLECTION].delete_many({'device_id': device_id})
+
+        buckets = mongo_db[SENSOR_COLLECTION].find({'device_id': device_id}, {'records': 1})
+        count = 0
+        for bucket in buckets:
+            records = [(device_id, record) for record in bucket.get('records', []) if 'timestamp' in record]
+            update_sensor_rollups(records)
+            count += len(records)
+
+        for usage in get_water_usage(device_id):
+            if isinstance(usage.get('water_used'), numbers.Real):
+                record_water_rollup(device_id, usage['date'], usage['water_used'])
+
+        print(f"Rebuilt rollups of device {device_id} from {count} records")
+
+
+if __name__ == "__main__":
+    rebuild_rollups()
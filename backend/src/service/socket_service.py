@@ -1,14 +1,21 @@
 import json
-import bson.errors
 import regex as re
 from bson.objectid import ObjectId
-from src.config.mongo import mongo_db, DEVICE_COLLECTION
+from flask_socketio import join_room
 from src.config.protocol import mqtt, socketio
-from src.config.redis import r
-from src.utils.excel_manager import export_to_excel
+from src.service.export_service import submit_export
+from src.service.device_meta_service import get_device_meta
+from src.service.subscription_service import add_user_socket, remove_user_socket, user_sockets
+from src.utils.export_formats import EXPORT_FORMATS
+from src.utils.logger import get_logger
 
 email_regex = re.compile(r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$')
 
+USER_ROOM_PREFIX = 'user:'
+
+# Logs written for every event, sampled so they stay cheap under load
+log = get_logger('socket', sampled=True)
+
 
 def handle_connect(data) -> None:
     """
@@ -17,17 +24,24 @@ def handle_connect(data) -> None:
     :param data: Data associated with the connection.
     :return: None
     """
-    print(data)
+    log.debug("Client connected: %s", data)
 
 
-def handle_disconnect(data) -> None:
+def handle_disconnect(socket_id: str) -> None:
     """
-    Handles the event when a client disconnects.
+    Handles the event when a client disconnects, forgetting the connection of its user.
 
-    :param data: Data associated with the disconnection.
+    :param socket_id: str: The socket ID of the closed connection.
     :return: None
     """
-    print(data)
+    log.debug("Client disconnected: %s", socket_id)
+    server = socketio.server
+    if server is None:
+        return
+    # The connection is still in its rooms while the disconnect event is handled
+    for room in server.manager.get_rooms(socket_id, '/'):
+        if room.startswith(USER_ROOM_PREFIX):
+            remove_user_socket(room[len(USER_ROOM_PREFIX):], socket_id)
 
 
 def handle_irrigate(device_id: str) -> None:
@@ -59,9 +73,29 @@ def handle_irrigation_type(device_id: str, irrigation_type: str, schedule: dict)
     mqtt.publish(f'{device_id}/irrigation_type', json.dumps(json_data))
 
 
+def device_room(device_id: str) -> str:
+    """
+    Returns the name of the Socket.IO room receiving the live data of a device.
+
+    :param device_id: str: The unique identifier of the device.
+    :return: str: The room name.
+    """
+    return f"device:{device_id}"
+
+
+def user_room(user_id: str) -> str:
+    """
+    Returns the name of the Socket.IO room grouping every connection of a user.
+
+    :param user_id: str: The unique identifier of the user.
+    :return: str: The room name.
+    """
+    return f"{USER_ROOM_PREFIX}{user_id}"
+
+
 def remap_redis(device_id: str, user_id: str, socket_id: str) -> None:
     """
-    Updates Redis with new user-device associations.
+    Joins the connection to the room of the device, which receives its live data, and to the room of the user.
 
     :param device_id: str: The unique identifier of the device.
     :param user_id: str: The unique identifier of the user.
@@ -69,56 +103,51 @@ def remap_redis(device_id: str, user_id: str, socket_id: str) -> None:
     :return: None
     """
     try:
-        device_key = f"device:{device_id}"
-        raw_data = r.get(device_key)
-
-        if raw_data is None:
-            device = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
-            if not device:
-                print(f"Device with ID {device_id} not found in database.")
-                return
-            user_list = [user_id]
-        else:
-            user_list = json.loads(raw_data)
+        if not get_device_meta(device_id):
+            log.warning("Device with ID %s not found in database.", device_id)
+            return
 
-        if user_id not in user_list:
-            user_list.append(user_id)
+        join_room(device_room(device_id), sid=socket_id, namespace='/')
+        join_room(user_room(user_id), sid=socket_id, namespace='/')
+        add_user_socket(user_id, socket_id)
 
-        json_data = json.dumps(user_list)
-        if json_data != '[]':
-            r.set(device_key, json_data)
-        else:
-            r.delete(device_key)
+    except Exception as e:
+        log.error("Unexpected error while joining the rooms of device %s: %s", device_id, e)
 
-        user_key = f"user:{user_id}"
-        r.set(user_key, socket_id)
 
-        print(f"Redis value for {device_key}: {r.get(device_key)}")
-        print(f"Redis value for {user_key}: {r.get(user_key)}")
+def leave_device_rooms(user_id: str, device_ids: list[str]) -> None:
+    """
+    Removes every connection of a user from the rooms of the given devices.
+    The connections are looked up in Redis, those handled by another process are removed by it through the
+    Socket.IO message queue.
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+    :param user_id: str: The unique identifier of the user.
+    :param device_ids: list[str]: The unique identifiers of the devices.
+    :return: None
+    """
+    server = socketio.server
+    if server is None:
+        return
+    for socket_id in user_sockets(user_id):
+        for device_id in device_ids:
+            server.leave_room(socket_id, device_room(device_id), namespace='/')
 
 
-def handle_export(device_id: str, socket_id: str) -> None:
+def handle_export(device_id: str, socket_id: str, export_format: str = 'xlsx') -> dict:
     """
     exports data from the device to a file.
+    The export runs in the background, the client is notified through 'export_progress' and 'export_response'.
 
     :param device_id: str: str: the unique identifier of the device.
     :param socket_id: str: the sid of the socket connection.
-    :return: None
+    :param export_format: str: the format of the file, one of 'xlsx', 'csv', 'parquet' or 'arrow'.
+    :return: dict: The 'job_id' and 'status' of the export, or an 'error'.
     """
-    try:
-        res = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
-        if not res:
-            print(f"device with ID {device_id} not found.")
-            return
-
-        buf = export_to_excel(res)
-
-        socketio.emit('export_response', {'file': buf.getvalue()}, room=socket_id)
-
-    except bson.errors.InvalidId as e:
-        print(f"Invalid device ID: {device_id}, error: {e}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
+    if not ObjectId.is_valid(device_id):
+        log.warning("Invalid device ID: %s", device_id)
+        return {'error': 'Invalid device ID'}
+    if export_format not in EXPORT_FORMATS:
+        log.warning("Unsupported export format: %s", export_format)
+        return {'error': 'Unsupported export format'}
+
+    return submit_export(device_id, socket_id, export_format)
@@ -0,0 +1,50 @@
+from src.config.redis import r
+
+# Time in seconds the socket IDs of a user are kept after their last connection, in case a process died without
+# removing the ones it handled
+USER_SOCKETS_TTL = 24 * 3600
+
+
+def user_sockets_key(user_id: str) -> str:
+    """
+    Returns the key of the Redis set holding the Socket.IO connections of a user, on every backend process.
+
+    :param user_id: str: The ID of the user.
+    :return: str: The Redis key.
+    """
+    return f"user:{user_id}:sockets"
+
+
+def add_user_socket(user_id: str, socket_id: str) -> None:
+    """
+    Records a Socket.IO connection of a user.
+
+    :param user_id: str: The ID of the user.
+    :param socket_id: str: The socket ID of the connection.
+    :return: None
+    """
+    pipe = r.pipeline()
+    pipe.sadd(user_sockets_key(user_id), socket_id)
+    pipe.expire(user_sockets_key(user_id), USER_SOCKETS_TTL)
+    pipe.execute()
+
+
+def remove_user_socket(user_id: str, socket_id: str) -> None:
+    """
+    Forgets a closed Socket.IO connection of a user.
+
+    :param user_id: str: The ID of the user.
+    :param socket_id: str: The socket ID of the connection.
+    :return: None
+    """
+    r.srem(user_sockets_key(user_id), socket_id)
+
+
+def user_sockets(user_id: str) -> set[str]:
+    """
+    Returns the Socket.IO connections of a user, whichever backend process handles them.
+
+    :param user_id: str: The ID of the user.
+    :return: set[str]: The socket IDs.
+    """
+    return r.smembers(user_sockets_key(user_id))
@@ -1,12 +1,25 @@
-import json
-
-import numpy as np
 from bson import ObjectId
 
-from src.config.mongo import mongo_db, DEVICE_COLLECTION, USER_COLLECTION
-from src.config.redis import r
-from src.utils.predict import predict_disease
-import cv2
+from src.config.mongo import mongo_db, USER_COLLECTION
+from src.service.device_meta_service import get_device_meta, get_devices_meta
+from src.service.socket_service import leave_device_rooms
+from src.utils.inference_pool import InferencePool
+from src.utils.metrics import metrics
+from src.utils.predict import predict_disease_image, predict_disease_images, init_inference_worker
+from src.utils.secrets import (INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_TIMEOUT, TF_INTRA_OP_THREADS,
+                               TF_INTER_OP_THREADS)
+
+# Worker processes holding the disease model, the request threads only hand them the image bytes
+disease_inference = InferencePool(
+    'disease',
+    workers=INFERENCE_WORKERS,
+    initializer=init_inference_worker,
+    initargs=(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS),
+    max_pending=INFERENCE_QUEUE_SIZE,
+    timeout=INFERENCE_TIMEOUT,
+)
+metrics.register_stats('terraflow_inference_pool', 'Counters of the inference pools', disease_inference.stats,
+                       {'pool': disease_inference.name})
 
 
 def handle_get_user_devices(user_id: str) -> list[dict[str, str]] or None:
@@ -17,21 +30,13 @@ def handle_get_user_devices(user_id: str) -> list[dict[str, str]] or None:
     :return: list[dict[str, str]] or None: A list of device IDs associated with the user.
     """
     # Check if the user exists in the database
-    user = mongo_db[USER_COLLECTION].find_one({"_id": ObjectId(user_id)})
+    user = mongo_db[USER_COLLECTION].find_one({"_id": ObjectId(user_id)}, {"devices": 1})
     if not user:
         return None
-    devices = user.get("devices", []) if user else []
-    res = []
-    for device_id in devices:
-        device = mongo_db[DEVICE_COLLECTION].find_one({"_id": ObjectId(device_id)})
-        if device:
-            res.append({
-                "id": str(device["_id"]),
-                "name": device.get("name", ""),
-            })
+    devices = user.get("devices", [])
 
     # Return the list of devices associated with the user
-    return res
+    return get_devices_meta(devices)
 
 
 def handle_add_device(device_id: str, user_id: str) -> dict:
@@ -51,7 +56,7 @@ def handle_add_device(device_id: str, user_id: str) -> dict:
     devices = user.get("devices", [])
 
     # Check if the device exists in the database
-    new_device = mongo_db[DEVICE_COLLECTION].find_one({'_id': ObjectId(device_id)})
+    new_device = get_device_meta(device_id)
     if not new_device:
         print("Device not found")
         return {"error": "Device not found"}
@@ -61,19 +66,7 @@ def handle_add_device(device_id: str, user_id: str) -> dict:
         devices.append(device_id)
         mongo_db[USER_COLLECTION].update_one({"_id": ObjectId(user_id)}, {"$set": {"devices": devices}})
 
-    device_key = f"device:{device_id}"
-
-    # Check if the device is already in Redis
-    if r.exists(device_key):
-        user_list = json.loads(r.get(device_key))
-    else:
-        user_list = []
-
-    if user_id not in user_list:
-        user_list.append(user_id)
-        r.set(device_key, json.dumps(user_list))
-
-    return {"id": device_id, "name": new_device.get("name", "")}
+    return {"id": device_id, "name": new_device["name"] or ""}
 
 
 def handle_delete_device(device_id: str, user_id: str) -> bool:
@@ -92,13 +85,7 @@ def handle_delete_device(device_id: str, user_id: str) -> bool:
         devices.remove(device_id)
         mongo_db[USER_COLLECTION].update_one({"_id": ObjectId(user_id)}, {"$set": {"devices": devices}})
 
-    device_key = f"device:{device_id}"
-
-    if r.exists(device_key):
-        user_list = json.loads(r.get(device_key))
-        if user_id in user_list:
-            user_list.remove(user_id)
-            r.set(device_key, json.dumps(user_list))
+    leave_device_rooms(user_id, [device_id])
 
     return True
 
@@ -106,15 +93,25 @@ def handle_delete_device(device_id: str, user_id: str) -> bool:
 def handle_predict_disease(image_file) -> dict:
     """
     Predicts disease from an image file.
+    The image is decoded and classified by an inference worker, the calling thread only waits for the result.
 
     :param image_file: The path to the image file.
     :return: dict: A dictionary containing the prediction result.
+    :raises InferenceBusy: If too many predictions are already pending.
+    :raises InferenceTimeout: If the prediction took longer than INFERENCE_TIMEOUT seconds.
+    """
+    return disease_inference.submit(predict_disease_image, image_file.read())
+
+
+def handle_predict_disease_batch(image_files: list) -> dict:
+    """
+    Predicts the disease of a plant from several photos in a single forward pass of the model.
+    The inference worker decodes the images with TF_INTRA_OP_THREADS threads.
+
+    :param image_files: list: The uploaded image files.
+    :return: dict: The aggregate prediction of the plant and the prediction of every image.
+    :raises InferenceBusy: If too many predictions are already pending.
+    :raises InferenceTimeout: If the prediction took longer than INFERENCE_TIMEOUT seconds.
     """
-    file_bytes = image_file.read()
-    np_arr = np.frombuffer(file_bytes, np.uint8)
-    image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    if image is None:
-        return {"error": "Invalid image file"}
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
-    prediction = predict_disease(image)
-    return prediction
+    images = [image_file.read() for image_file in image_files]
+    return disease_inference.submit(predict_disease_images, images, TF_INTRA_OP_THREADS)
@@ -0,0 +1,91 @@
+import numbers
+
+import pymongo
+from pymongo import UpdateOne
+from bson import ObjectId
+
+from src.config.mongo import mongo_db, DEVICE_COLLECTION, WATER_COLLECTION
+from src.service.record_service import normalize_timestamp
+
+
+def ensure_water_indexes() -> None:
+    """
+    Creates the index used by the water usage upserts and range queries.
+
+    :return: None
+    """
+    mongo_db[WATER_COLLECTION].create_index(
+        [('device_id', pymongo.ASCENDING), ('date', pymongo.ASCENDING)],
+        unique=True,
+    )
+
+
+def add_water_usage(device_id: str, date: str, water_used: float) -> None:
+    """
+    Adds water usage to the counter of a device for the reported period, creating the counter if needed.
+    The write is a single atomic upsert, concurrent reports of the same period are all counted.
+
+    :param device_id: str: The ID of the device.
+    :param date: str: The period of the usage as reported by the device (e.g., "2025/05" or "2025/05/05").
+    :param water_used: float: The amount of water used.
+    :return: None
+    """
+    mongo_db[WATER_COLLECTION].update_one(
+        {'device_id': device_id, 'date': normalize_timestamp(date)},
+        {'$inc': {'water_used': water_used}},
+        upsert=True,
+    )
+
+
+def get_water_usage(device_id: str, start: str = None, end: str = None) -> list[dict]:
+    """
+    Fetches the water usage of a device in chronological order.
+
+    :param device_id: str: The ID of the device.
+    :param start: str: Optional date or date prefix, periods before it are skipped (inclusive).
+    :param end: str: Optional date or date prefix, periods from it onwards are skipped (exclusive).
+    :return: list[dict]: The 'date' and 'water_used' of each period.
+    """
+    query = {'device_id': device_id}
+    date_range = {}
+    if start:
+        date_range['$gte'] = normalize_timestamp(start)
+    if end:
+        date_range['$lt'] = normalize_timestamp(end)
+    if date_range:
+        query['date'] = date_range
+
+    usage = mongo_db[WATER_COLLECTION].find(query, {'_id': 0, 'date': 1, 'water_used': 1}) \
+        .sort('date', pymongo.ASCENDING)
+    return list(usage)
+
+
+def migrate_water_usage() -> None:
+    """
+    Moves the water usage still embedded in device documents into the per-period counters.
+    Safe to run more than once, the embedded 'water_usage' array is removed once it was copied.
+
+    :return: None
+    """
+    ensure_water_indexes()
+    devices = mongo_db[DEVICE_COLLECTION].find({'water_usage': {'$exists': True}}, {'water_usage': 1})
+    for device in devices:
+        device_id = str(device['_id'])
+        operations = [
+            UpdateOne(
+                {'device_id': device_id, 'date': normalize_timestamp(usage['date'])},
+                {'$inc': {'water_used': usage['water_used']}},
+                upsert=True,
+            )
+            for usage in device.get('water_usage') or []
+            if usage.get('date') and isinstance(usage.get('water_used'), numbers.Real)
+        ]
+        if operations:
+            mongo_db[WATER_COLLECTION].bulk_write(operations, ordered=False)
+
+        mongo_db[DEVICE_COLLECTION].update_one({'_id': ObjectId(device_id)}, {'$unset': {'water_usage': ''}})
+        print(f"Migrated {len(operations)} water usage entries of device {device_id}")
+
+
+if __name__ == "__main__":
+    migrate_water_usage()
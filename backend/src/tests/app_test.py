@@ -0,0 +1,59 @@
+import os
+import runpy
+import unittest
+from unittest.mock import patch
+
+import app
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'app.py')
+
+
+class TestApp(unittest.TestCase):
+
+    @patch('src.service.user_service.disease_inference')
+    @patch('src.service.mqtt_service.subscribe_device_topics')
+    @patch('src.config.scheduler.start_scheduler')
+    @patch('src.config.protocol.mqtt')
+    @patch('src.config.protocol.socketio')
+    def test_spawned_worker_import(self, socketio_mock, mqtt_mock, scheduler_mock, subscribe_mock, inference_mock):
+        # Spawned inference and report workers import app.py as __mp_main__, which must not start anything
+        runpy.run_path(APP_PATH, run_name='__mp_main__')
+
+        socketio_mock.init_app.assert_not_called()
+        socketio_mock.run.assert_not_called()
+        mqtt_mock.init_app.assert_not_called()
+        mqtt_mock.subscribe.assert_not_called()
+        scheduler_mock.assert_not_called()
+        subscribe_mock.assert_not_called()
+        inference_mock.start.assert_not_called()
+
+    @patch('app.start_services')
+    @patch('app.create_app')
+    @patch('app.socketio')
+    @patch('app.DEBUG', False)
+    @patch('app.USE_RELOADER', False)
+    def test_main_without_reloader(self, socketio_mock, create_app_mock, start_services_mock):
+        # Without the reloader there is no child process, the server process starts the services itself
+        with patch.dict(os.environ, {}, clear=True):
+            app.main()
+
+        start_services_mock.assert_called_once()
+        socketio_mock.run.assert_called_once_with(create_app_mock.return_value, host=app.HOST, port=app.PORT,
+                                                  use_reloader=False, debug=False)
+
+    @patch('app.start_services')
+    @patch('app.create_app')
+    @patch('app.socketio')
+    @patch('app.USE_RELOADER', True)
+    def test_main_reloader_parent(self, socketio_mock, create_app_mock, start_services_mock):
+        # The reloader parent only watches the files, the services start in its child
+        with patch.dict(os.environ, {}, clear=True):
+            app.main()
+        start_services_mock.assert_not_called()
+
+        with patch.dict(os.environ, {'WERKZEUG_RUN_MAIN': 'true'}):
+            app.main()
+        start_services_mock.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,10 @@
-import json
 import unittest
 from unittest.mock import patch, MagicMock
 
 from bson import ObjectId
 
 from src.config.mongo import USER_COLLECTION, DEVICE_COLLECTION
+from src.service.device_meta_service import device_cache
 from src.service.auth_service import (
     handle_form_login,
     handle_token_login,
@@ -26,14 +26,18 @@ class TestAuthService(unittest.TestCase):
 
         # Patch the dependencies
         self.mongo_patcher = patch('src.service.auth_service.mongo_db', self.mongo_db_mock)
-        self.redis_patcher = patch('src.service.auth_service.r', self.redis_mock)
+        self.meta_mongo_patcher = patch('src.service.device_meta_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.subscription_service.r', self.redis_mock)
 
         self.mongo_patcher.start()
+        self.meta_mongo_patcher.start()
+        device_cache.clear()
         self.redis_patcher.start()
 
     def tearDown(self):
         # Stop all patches
         self.mongo_patcher.stop()
+        self.meta_mongo_patcher.stop()
         self.redis_patcher.stop()
 
     def test_handle_form_login_success(self):
@@ -50,15 +54,11 @@ class TestAuthService(unittest.TestCase):
         self.mongo_db_mock[USER_COLLECTION].find.return_value = [user_data]
         self.mongo_db_mock[USER_COLLECTION].find_one.return_value = user_data
 
-        # Mock find_one for device collection with side effect
-        def device_find_side_effect(query):
-            device_id = query["_id"]
-            return {
-                '_id': device_id,
-                'name': f'Device {device_id}'
-            }
+        # Mock the batched device query
+        def device_find_side_effect(query, projection):
+            return [{'_id': device_id, 'name': f'Device {device_id}'} for device_id in query['_id']['$in']]
 
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.side_effect = device_find_side_effect
+        self.mongo_db_mock[DEVICE_COLLECTION].find.side_effect = device_find_side_effect
 
         expected_device_data = [
             {'id': '507f1f77bcf86cd799439011', 'name': 'Device 507f1f77bcf86cd799439011'},
@@ -70,6 +70,8 @@ class TestAuthService(unittest.TestCase):
         self.assertIn('token', result)
         self.assertIn('devices', result)
         self.assertEqual(result['devices'], expected_device_data)
+        self.mongo_db_mock[DEVICE_COLLECTION].find.assert_called_once()
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
 
     def test_handle_form_login_invalid_email(self):
         # Test the handle_form_login function with invalid email
@@ -178,7 +180,8 @@ class TestAuthService(unittest.TestCase):
         self.assertIn('error_msg', result)
         self.assertEqual(result['error_msg'], 'An account with this email already exists')
 
-    def test_handle_logout_success(self):
+    @patch('src.service.auth_service.leave_device_rooms')
+    def test_handle_logout_success(self, leave_mock):
         # Test the handle_logout function
         user_id = "681785b2abcafa0ae18c75f9"
         device_ids = ["device1", "device2"]
@@ -188,12 +191,11 @@ class TestAuthService(unittest.TestCase):
         }
         self.mongo_db_mock[USER_COLLECTION].find_one.return_value = user_data
 
-        # Mock Redis
-        self.redis_mock.exists.return_value = True
-        self.redis_mock.get.return_value = json.dumps([user_id])
-
         # Call the function
         result = handle_logout(user_id, device_ids)
 
         # Assert that the result indicates success
         self.assertIn('success', result)
+
+        # Assert that the connections of the user left the rooms of every device
+        leave_mock.assert_called_once_with(user_id, device_ids)
@@ -0,0 +1,66 @@
+import threading
+import time
+import unittest
+
+from src.utils.batch_queue import BatchQueue
+
+
+class TestBatchQueue(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def handler(self, batch):
+        with self.lock:
+            self.batches.append(list(batch))
+
+    def test_flush_on_size(self):
+        # A full batch is flushed without waiting for the latency window
+        queue = BatchQueue('test', self.handler, max_batch_size=3, max_latency=10)
+        for i in range(3):
+            self.assertTrue(queue.put(i))
+
+        deadline = time.monotonic() + 2
+        while not self.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        queue.stop()
+
+        self.assertEqual(self.batches[0], [0, 1, 2])
+
+    def test_flush_on_latency(self):
+        # A partial batch is flushed once the latency window elapses
+        queue = BatchQueue('test', self.handler, max_batch_size=100, max_latency=0.05)
+        queue.put('a')
+        queue.put('b')
+
+        time.sleep(0.3)
+        self.assertEqual(self.batches, [['a', 'b']])
+        queue.stop()
+
+    def test_stop_flushes_pending_items(self):
+        # Stopping flushes everything that was queued and rejects new items
+        queue = BatchQueue('test', self.handler, max_batch_size=4, max_latency=10)
+        for i in range(10):
+            queue.put(i)
+        queue.stop()
+
+        self.assertEqual(sum(self.batches, []), list(range(10)))
+        self.assertFalse(queue.put(11))
+
+        stats = queue.stats()
+        self.assertEqual(stats['flushed'], 10)
+        self.assertEqual(stats['dropped'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertLessEqual(stats['max_batch_size'], 4)
+
+    def test_backpressure_drops_when_full(self):
+        # Producers give up after put_timeout when the worker cannot keep up
+        release = threading.Event()
+        queue = BatchQueue('test', lambda batch: release.wait(), max_batch_size=1, max_latency=0,
+                           max_queue_size=1, put_timeout=0.05)
+        results = [queue.put(i) for i in range(4)]
+        release.set()
+        queue.stop()
+
+        self.assertIn(False, results)
+        self.assertGreater(queue.stats()['dropped'], 0)
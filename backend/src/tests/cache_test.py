@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+
+from src.utils.cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = TTLCache(max_size=10, ttl=60)
+
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # Reading "a" makes "b" the least recently used entry
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entry(self):
+        cache = TTLCache(max_size=10, ttl=5)
+        with patch('src.utils.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with patch('src.utils.cache.time.monotonic', return_value=106.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_entry_ttl(self):
+        # An entry can expire sooner than the other entries of the cache
+        cache = TTLCache(max_size=10, ttl=60)
+        with patch('src.utils.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1, ttl=5)
+            cache.set("b", 2)
+        with patch('src.utils.cache.time.monotonic', return_value=106.0):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+
+    def test_invalidate(self):
+        cache = TTLCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+
+        self.assertIsNone(cache.get("a"))
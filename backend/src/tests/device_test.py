@@ -4,6 +4,7 @@ from unittest.mock import patch, MagicMock
 from bson import ObjectId
 
 from src.config.mongo import DEVICE_COLLECTION, USER_COLLECTION
+from src.service.device_meta_service import device_cache
 from src.service.device_service import handle_get_device_data, handle_update_device
 
 
@@ -15,11 +16,23 @@ class TestDeviceManagement(unittest.TestCase):
             DEVICE_COLLECTION: MagicMock()
         }
         self.mongo_patcher = patch('src.service.device_service.mongo_db', self.mongo_db_mock)
+        self.records_patcher = patch('src.service.device_service.iter_sensor_records')
+        self.count_patcher = patch('src.service.device_service.count_sensor_records')
+        self.positions_patcher = patch('src.service.device_service.iter_sensor_positions')
+        self.water_patcher = patch('src.service.device_service.get_water_usage', return_value=[])
         self.mongo_patcher.start()
+        self.records_mock = self.records_patcher.start()
+        self.count_mock = self.count_patcher.start()
+        self.positions_mock = self.positions_patcher.start()
+        self.water_mock = self.water_patcher.start()
 
     def tearDown(self):
         # Stop all patches
         self.mongo_patcher.stop()
+        self.records_patcher.stop()
+        self.count_patcher.stop()
+        self.positions_patcher.stop()
+        self.water_patcher.stop()
 
     def test_handle_get_device_data(self):
         # Test the handle_get_device_data function
@@ -60,14 +73,80 @@ class TestDeviceManagement(unittest.TestCase):
             ],
         }
 
-        # Mock the MongoDB find_one method
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = expected_device_data
+        # Mock the MongoDB find_one method, the sensor buckets and the water usage counters
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {'_id': ObjectId(device_id)}
+        self.water_mock.return_value = expected_device_data['water_usage']
+        self.records_mock.return_value = iter(expected_device_data['record'])
+        self.count_mock.return_value = 3
 
         # Call the function
         result = handle_get_device_data(device_id)
 
-        # Assert that the result matches the expected device data
-        self.assertEqual(result, expected_device_data)
+        # Assert that the result matches the expected device data, small histories are not downsampled
+        self.assertEqual(result, {**expected_device_data, 'next_cursor': None})
+        self.records_mock.assert_called_once_with(device_id, None, None)
+
+    def test_handle_get_device_data_downsampled(self):
+        # Test that a long history is downsampled to the requested number of points
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            {'sensor_data': {'temperature': 20, 'humidity': 50, 'moisture': i % 7},
+             'timestamp': f'2025/05/05 05:{i // 60:02d}:{i % 60:02d}'}
+            for i in range(3000)
+        ]
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {'_id': ObjectId(device_id)}
+        self.records_mock.return_value = iter(records)
+        self.count_mock.return_value = len(records)
+
+        result = handle_get_device_data(device_id, points=100)
+
+        self.assertEqual(len(result['record']), 100)
+        self.assertEqual(result['record'][0], records[0])
+        self.assertEqual(result['record'][-1], records[-1])
+        self.assertIsNone(result['next_cursor'])
+        self.count_mock.assert_called_once_with(device_id, None, None)
+
+    def test_handle_get_device_data_aggregated(self):
+        # Test that the records are streamed into the aggregation, which is sized from the bucket counters
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            {'sensor_data': {'moisture': i}, 'timestamp': f'2025/05/05 05:17:{i:02d}'}
+            for i in range(6)
+        ]
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {'_id': ObjectId(device_id)}
+        self.records_mock.return_value = (record for record in records)
+        self.count_mock.return_value = len(records)
+
+        result = handle_get_device_data(device_id, start='2025/05/05', downsample='max', points=2)
+
+        self.assertEqual([r['sensor_data']['moisture'] for r in result['record']], [2.0, 5.0])
+        self.count_mock.assert_called_once_with(device_id, '2025/05/05', None)
+
+    def test_handle_get_device_data_paginated(self):
+        # Test that pages resume after the position of the cursor, records sharing its timestamp are not dropped
+        device_id = "681785b2abcafa0ae18c75f9"
+        timestamps = ['05:17:00', '05:17:01', '05:17:01', '05:17:01', '05:17:02']
+        positions = [
+            ('2025/05/05', i, {'sensor_data': {'moisture': i}, 'timestamp': f'2025/05/05 {timestamp}'})
+            for i, timestamp in enumerate(timestamps)
+        ]
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {'_id': ObjectId(device_id)}
+        self.positions_mock.side_effect = lambda device, start, end, after: iter(
+            [position for position in positions if not after or position[:2] > after])
+        records = [record for _, _, record in positions]
+
+        first = handle_get_device_data(device_id, limit=2)
+        self.assertEqual(first['record'], records[:2])
+        self.assertEqual(first['next_cursor'], '2025/05/05:1')
+
+        second = handle_get_device_data(device_id, limit=2, cursor=first['next_cursor'])
+        self.assertEqual(second['record'], records[2:4])
+        self.assertEqual(second['next_cursor'], '2025/05/05:3')
+        self.positions_mock.assert_called_with(device_id, None, None, ('2025/05/05', 1))
+
+        third = handle_get_device_data(device_id, limit=2, cursor=second['next_cursor'])
+        self.assertEqual(third['record'], records[4:])
+        self.assertIsNone(third['next_cursor'])
 
     def test_handle_get_device_data_not_found(self):
         # Test the handle_get_device_data function when a device is not found
@@ -90,8 +169,11 @@ class TestDeviceManagement(unittest.TestCase):
         # Mock the MongoDB update_one method
         self.mongo_db_mock[DEVICE_COLLECTION].update_one.return_value.modified_count = 1
 
+        device_cache.set(device_id, {"id": device_id, "name": "Old Device Name"})
+
         # Call the function
         result = handle_update_device(device_id, new_device_name)
 
-        # Assert that the result is as expected
+        # Assert that the result is as expected and the cached name was dropped
         self.assertEqual(result, {"message": f"Device {device_id} updated to {new_device_name}"})
+        self.assertIsNone(device_cache.get(device_id))
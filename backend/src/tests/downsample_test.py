@@ -0,0 +1,92 @@
+import unittest
+
+from src.utils.downsample import lttb, aggregate
+
+
+def series(values: list) -> list[dict]:
+    return [
+        {'sensor_data': {'moisture': value}, 'timestamp': f'2025/05/05 {i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}'}
+        for i, value in enumerate(values)
+    ]
+
+
+class TestDownsample(unittest.TestCase):
+    def test_lttb_keeps_peaks(self):
+        # A flat series with a single spike keeps the spike and both ends
+        values = [0] * 100
+        values[42] = 10
+        records = series(values)
+
+        selected = lttb(records, 10, 'moisture')
+
+        self.assertEqual(len(selected), 10)
+        self.assertIs(selected[0], records[0])
+        self.assertIs(selected[-1], records[-1])
+        self.assertIn(records[42], selected)
+        self.assertEqual(selected, sorted(selected, key=lambda record: record['timestamp']))
+
+    def test_lttb_stream(self):
+        # A stream of known size gives the same selection as the list, records past the count are ignored
+        records = series([(i * 37) % 11 for i in range(500)])
+
+        self.assertEqual(lttb(iter(records), 20, 'moisture', count=500), lttb(records, 20, 'moisture'))
+        self.assertEqual(lttb(iter(records), 20, 'moisture', count=400), lttb(records[:400], 20, 'moisture'))
+
+    def test_lttb_stream_shrunk(self):
+        # Records removed since they were counted only shorten the selection
+        records = series([(i * 37) % 11 for i in range(300)])
+
+        selected = lttb(iter(records), 20, 'moisture', count=500)
+
+        self.assertLessEqual(len(selected), 20)
+        self.assertIs(selected[0], records[0])
+        self.assertIs(selected[-1], records[-1])
+
+    def test_lttb_short_series(self):
+        records = [{'sensor_data': {'moisture': 1}, 'timestamp': '2025/05/05 05:17:35'}]
+        self.assertEqual(lttb(records, 10, 'moisture'), records)
+
+    def test_aggregate(self):
+        records = [
+            {'sensor_data': {'moisture': i, 'temperature': 20}, 'timestamp': f'2025/05/05 05:17:{i:02d}'}
+            for i in range(6)
+        ]
+        # A missing reading is ignored by the reduction
+        records[5]['sensor_data'].pop('temperature')
+
+        avg = aggregate(records, 2, 'avg')
+        self.assertEqual(avg, [
+            {'timestamp': '2025/05/05 05:17:00', 'sensor_data': {'moisture': 1.0, 'temperature': 20.0}},
+            {'timestamp': '2025/05/05 05:17:03', 'sensor_data': {'moisture': 4.0, 'temperature': 20.0}},
+        ])
+        self.assertEqual([r['sensor_data']['moisture'] for r in aggregate(records, 2, 'min')], [0.0, 3.0])
+        self.assertEqual([r['sensor_data']['moisture'] for r in aggregate(records, 2, 'max')], [2.0, 5.0])
+
+    def test_aggregate_stream(self):
+        records = series(list(range(10)))
+
+        self.assertEqual(aggregate(iter(records), 3, 'avg', count=10), aggregate(records, 3, 'avg'))
+        self.assertEqual(aggregate(iter(records), 5, 'min', count=8), aggregate(records[:8], 5, 'min'))
+
+    def test_malformed_timestamps(self):
+        # Records whose timestamp cannot be read are skipped instead of failing the whole history
+        records = series(list(range(50)))
+        records[10]['timestamp'] = 'not a timestamp'
+        records[20]['timestamp'] = None
+        del records[30]['timestamp']
+        records[-1]['timestamp'] = '2025/13/45 99:00:00'
+        valid = [record for i, record in enumerate(records) if i not in (10, 20, 30, 49)]
+
+        selected = lttb(iter(records), 10, 'moisture', count=50)
+        self.assertLessEqual(len(selected), 10)
+        self.assertIs(selected[0], records[0])
+        self.assertIs(selected[-1], records[48])
+        self.assertTrue(all(record in valid for record in selected))
+        self.assertEqual(len(lttb(records, 2, 'moisture')), 2)
+
+        self.assertEqual(aggregate(records, 2, 'max'), aggregate(valid, 2, 'max', count=50))
+        self.assertEqual([r['sensor_data']['moisture'] for r in aggregate(records, 2, 'max')], [26.0, 48.0])
+
+    def test_aggregate_invalid(self):
+        with self.assertRaises(ValueError):
+            aggregate([], 2, 'median')
@@ -0,0 +1,87 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook, load_workbook
+
+from src.utils.excel_manager import write_sensor_records
+from src.utils.export_formats import save_export
+
+
+class TestExportFormats(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # Three days of records, one of them in the ISO format some devices send
+        self.records = [
+            {'sensor_data': {'temperature': 20 + i, 'humidity': 50, 'moisture': 30},
+             'timestamp': f'2025/05/0{1 + i // 4} 05:17:{i:02d}'}
+            for i in range(12)
+        ]
+        self.records[0]['timestamp'] = '2025-05-01T05:17:00Z'
+        self.water_usage = [{'date': '2025/05', 'water_used': 10}]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def export(self, export_format: str, **kwargs) -> zipfile.ZipFile:
+        path = os.path.join(self.tmp_dir.name, f'export.{export_format}.zip')
+        save_export({'record': iter(self.records), 'water_usage': self.water_usage}, path, export_format, **kwargs)
+        return zipfile.ZipFile(path)
+
+    def test_csv(self):
+        archive = self.export('csv')
+
+        rows = archive.read('sensor_records.csv').decode().splitlines()
+        self.assertEqual(rows[0], 'timestamp,temperature,humidity,moisture')
+        self.assertEqual(rows[2], '2025/05/01 05:17:01,21,50,30')
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(archive.read('water_usage.csv').decode().splitlines(), ['date,water_used', '2025/05,10'])
+
+    def test_parquet_row_group_per_day(self):
+        archive = self.export('parquet')
+
+        parquet = pq.ParquetFile(io.BytesIO(archive.read('sensor_records.parquet')))
+        self.assertEqual(parquet.num_row_groups, 3)
+        table = parquet.read()
+        self.assertEqual(table.num_rows, 12)
+        self.assertEqual(table.schema.field('timestamp').type, pa.timestamp('ms'))
+        self.assertEqual(table.column('timestamp')[0].as_py().isoformat(), '2025-05-01T05:17:00')
+        self.assertEqual(pq.read_table(io.BytesIO(archive.read('water_usage.parquet'))).num_rows, 1)
+
+    def test_parquet_row_group_per_month(self):
+        archive = self.export('parquet', row_group_period='month')
+
+        parquet = pq.ParquetFile(io.BytesIO(archive.read('sensor_records.parquet')))
+        self.assertEqual(parquet.num_row_groups, 1)
+
+    def test_arrow(self):
+        archive = self.export('arrow')
+
+        reader = pa.ipc.open_file(io.BytesIO(archive.read('sensor_records.arrow')))
+        self.assertEqual(reader.num_record_batches, 3)
+        self.assertEqual(reader.read_all().column('temperature').to_pylist()[-1], 31.0)
+
+    def test_xlsx_sheet_row_limit(self):
+        # Records beyond the row limit of a sheet continue on a new sheet with the same header
+        path = os.path.join(self.tmp_dir.name, 'export.xlsx')
+        wb = Workbook(write_only=True)
+
+        count = write_sensor_records(wb, ' Sensor Records', iter(self.records), max_rows=5)
+        wb.save(path)
+
+        workbook = load_workbook(path, read_only=True)
+        self.assertEqual(count, 12)
+        self.assertEqual(workbook.sheetnames, ['Sensor Records', 'Sensor Records (2)', 'Sensor Records (3)'])
+        sheets = [list(workbook[name].values) for name in workbook.sheetnames]
+        self.assertEqual([len(rows) for rows in sheets], [5, 5, 5])
+        for rows in sheets:
+            self.assertEqual(rows[0], ('temperature', 'humidity', 'moisture', 'Timestamp'))
+        self.assertEqual([row[0] for rows in sheets for row in rows[1:]], [20 + i for i in range(12)])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            save_export({'record': []}, os.path.join(self.tmp_dir.name, 'export'), 'json')
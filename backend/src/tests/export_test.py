@@ -0,0 +1,209 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from bson import ObjectId
+from gridfs import NoFile
+from openpyxl import load_workbook
+
+from src.config.mongo import DEVICE_COLLECTION
+from src.service.export_service import (
+    create_export,
+    get_export,
+    cleanup_exports,
+    submit_export,
+    run_export_job,
+    export_jobs,
+    export_results,
+)
+
+
+class TestExportService(unittest.TestCase):
+    def setUp(self):
+        # Mock MongoDB, GridFS, Redis and the sensor buckets, exports are written to a temporary directory
+        self.mongo_db_mock = {
+            DEVICE_COLLECTION: MagicMock()
+        }
+        self.redis_mock = MagicMock()
+        self.files_mock = MagicMock()
+        self.export_dir = tempfile.TemporaryDirectory()
+
+        self.mongo_patcher = patch('src.service.export_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.export_service.r', self.redis_mock)
+        self.files_patcher = patch('src.service.export_service.export_files', self.files_mock)
+        self.records_patcher = patch('src.service.export_service.iter_sensor_records')
+        self.dir_patcher = patch('src.service.export_service.EXPORT_DIR', self.export_dir.name)
+        self.socketio_patcher = patch('src.service.export_service.socketio')
+        self.pool_patcher = patch('src.service.export_service.export_pool')
+        self.count_patcher = patch('src.service.export_service.count_sensor_records', return_value=2000)
+        self.water_patcher = patch('src.service.export_service.get_water_usage',
+                                   return_value=[{'date': '2025/05', 'water_used': 10}])
+        self.totals_patcher = patch('src.service.export_service.get_monthly_water_totals',
+                                    return_value={'2025/05': 10})
+
+        self.mongo_patcher.start()
+        self.redis_patcher.start()
+        self.files_patcher.start()
+        self.records_mock = self.records_patcher.start()
+        self.dir_patcher.start()
+        self.socketio_mock = self.socketio_patcher.start()
+        self.pool_mock = self.pool_patcher.start()
+        self.count_patcher.start()
+        self.totals_patcher.start()
+        self.water_patcher.start()
+        export_jobs.clear()
+        export_results.clear()
+
+        self.device_id = "681785b2abcafa0ae18c75f9"
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {
+            '_id': ObjectId(self.device_id),
+        }
+        self.records_mock.side_effect = lambda device_id: (
+            {'sensor_data': {'temperature': 20 + i % 5, 'humidity': 50, 'moisture': 30},
+             'timestamp': f'2025/05/05 05:{i // 60 % 60:02d}:{i % 60:02d}'}
+            for i in range(2000)
+        )
+
+    def tearDown(self):
+        # Stop all patches
+        self.mongo_patcher.stop()
+        self.redis_patcher.stop()
+        self.files_patcher.stop()
+        self.records_patcher.stop()
+        self.dir_patcher.stop()
+        self.socketio_patcher.stop()
+        self.pool_patcher.stop()
+        self.count_patcher.stop()
+        self.totals_patcher.stop()
+        self.water_patcher.stop()
+        self.export_dir.cleanup()
+
+    def test_create_export_inline(self):
+        # Test that a small export is returned inline and not kept on disk
+        result = create_export(self.device_id)
+
+        self.assertIn('file', result)
+        self.assertEqual(result['filename'], "exported_data.xlsx")
+        self.assertEqual(os.listdir(self.export_dir.name), [])
+        self.redis_mock.set.assert_not_called()
+        self.files_mock.upload_from_stream_with_id.assert_not_called()
+
+    def test_create_export_download(self):
+        # Test that a large export is stored in GridFS, so any worker can serve it, and returned as a download URL
+        uploads = {}
+
+        def upload(file_id, filename, source, metadata):
+            uploads[file_id] = source.read()
+
+        self.files_mock.upload_from_stream_with_id.side_effect = upload
+        with patch('src.service.export_service.EXPORT_INLINE_MAX_BYTES', 0):
+            result = create_export(self.device_id)
+
+        self.assertNotIn('file', result)
+        export_id = result['url'].rsplit('/', 1)[1]
+        self.redis_mock.set.assert_called_once()
+        key, filename = self.redis_mock.set.call_args[0]
+        self.assertEqual(key, f"export:{export_id}")
+        self.assertEqual(filename, "exported_data.xlsx")
+        self.assertEqual(result['size'], len(uploads[export_id]))
+        self.assertEqual(os.listdir(self.export_dir.name), [])
+
+        sheet = load_workbook(io.BytesIO(uploads[export_id]), read_only=True)["Sensor Records"]
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], ('temperature', 'humidity', 'moisture', 'Timestamp'))
+        self.assertEqual(len(rows), 2001)
+
+        self.redis_mock.get.return_value = filename
+        self.files_mock.open_download_stream.return_value = io.BytesIO(uploads[export_id])
+        file, download_name = get_export(export_id)
+        self.files_mock.open_download_stream.assert_called_once_with(export_id)
+        self.assertEqual(file.read(), uploads[export_id])
+        self.assertEqual(download_name, "exported_data.xlsx")
+
+    def test_get_export_expired(self):
+        # The Redis entry expired, or the file was already cleaned up
+        self.redis_mock.get.return_value = None
+        self.assertIsNone(get_export('missing'))
+
+        self.redis_mock.get.return_value = "exported_data.xlsx"
+        self.files_mock.open_download_stream.side_effect = NoFile
+        self.assertIsNone(get_export('missing'))
+
+    def test_cleanup_exports(self):
+        self.files_mock.find.return_value = [MagicMock(_id='old'), MagicMock(_id='gone')]
+        self.files_mock.delete.side_effect = [None, NoFile]
+
+        cleanup_exports()
+
+        self.assertIn('$lt', self.files_mock.find.call_args[0][0]['uploadDate'])
+        self.assertEqual([c.args[0] for c in self.files_mock.delete.call_args_list], ['old', 'gone'])
+
+    def test_create_export_device_not_found(self):
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
+
+        self.assertIsNone(create_export(self.device_id))
+        self.records_mock.assert_not_called()
+
+    def test_submit_export(self):
+        # Test that the export is queued and the job ID returned right away
+        result = submit_export(self.device_id, "sid1")
+
+        self.assertEqual(result['status'], 'queued')
+        self.pool_mock.submit.assert_called_once_with(run_export_job, export_jobs[(self.device_id, 'xlsx')])
+        self.records_mock.assert_not_called()
+
+    def test_submit_export_deduplicates(self):
+        # Test that a second request for the same device joins the running job
+        first = submit_export(self.device_id, "sid1")
+        second = submit_export(self.device_id, "sid2")
+
+        self.assertEqual(second, {'job_id': first['job_id'], 'status': 'running'})
+        self.pool_mock.submit.assert_called_once()
+
+        # Both clients receive the result once the job is done
+        run_export_job(export_jobs[(self.device_id, 'xlsx')])
+
+        responses = [c for c in self.socketio_mock.emit.call_args_list if c[0][0] == 'export_response']
+        self.assertEqual(sorted(c[1]['room'] for c in responses), ["sid1", "sid2"])
+        self.assertIn('file', responses[0][0][1])
+        self.assertEqual(responses[0][0][1]['job_id'], first['job_id'])
+        self.assertEqual(export_jobs, {})
+
+        progress = [c[0][1] for c in self.socketio_mock.emit.call_args_list if c[0][0] == 'export_progress']
+        self.assertEqual(progress[-1]['percent'], 100.0)
+
+    def test_submit_export_cached(self):
+        # Test that a recent result is sent again without running a new job
+        export_results.set((self.device_id, 'xlsx'), {'job_id': 'job1', 'file': b'data'})
+
+        result = submit_export(self.device_id, "sid1")
+
+        self.assertEqual(result, {'job_id': 'job1', 'status': 'done'})
+        self.socketio_mock.emit.assert_called_once_with('export_response', {'job_id': 'job1', 'file': b'data'},
+                                                        room="sid1")
+        self.pool_mock.submit.assert_not_called()
+
+        # Another format of the same device is a separate export
+        self.assertEqual(submit_export(self.device_id, "sid1", 'csv')['status'], 'queued')
+
+    def test_run_export_job_failed(self):
+        # A failed export is logged and reported to the client without its details
+        self.records_mock.side_effect = RuntimeError("connection lost")
+        submit_export(self.device_id, "sid1")
+
+        with self.assertLogs('terraflow.exports', 'ERROR') as logs:
+            run_export_job(export_jobs[(self.device_id, 'xlsx')])
+
+        self.assertIn(f"Export of device {self.device_id} failed: connection lost", logs.output[0])
+        responses = [c[0][1] for c in self.socketio_mock.emit.call_args_list if c[0][0] == 'export_response']
+        self.assertEqual(responses[0]['error'], 'Export failed')
+        self.assertEqual(export_jobs, {})
+
+    def test_submit_export_too_many_jobs(self):
+        with patch('src.service.export_service.EXPORT_MAX_JOBS', 0):
+            result = submit_export(self.device_id, "sid1")
+
+        self.assertIn('error', result)
+        self.pool_mock.submit.assert_not_called()
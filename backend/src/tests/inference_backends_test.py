@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import cv2
+import numpy as np
+
+from src.utils.inference_backends import TFLiteModel, dequantize, quantize
+from src.utils.model.compare_disease_models import load_image_set, select_model
+from src.utils.predict import load_model
+
+
+def fake_interpreter(input_dtype, output, input_quantization=(0.0, 0), output_quantization=(0.0, 0)):
+    # Interpreter of a model exported with a batch size of 1, returning a fixed output
+    interpreter = MagicMock()
+    shape = {'value': np.array([1, 224, 224, 3])}
+
+    def resize(index, new_shape):
+        shape['value'] = np.array(new_shape)
+
+    interpreter.resize_tensor_input.side_effect = resize
+    interpreter.get_input_details.side_effect = lambda: [
+        {'index': 0, 'shape': shape['value'], 'dtype': input_dtype, 'quantization': input_quantization}]
+    interpreter.get_output_details.side_effect = lambda: [
+        {'index': 1, 'dtype': output.dtype, 'quantization': output_quantization}]
+    interpreter.get_tensor.return_value = output
+    return interpreter
+
+
+class TestTFLiteModel(unittest.TestCase):
+
+    def setUp(self):
+        self.file = tempfile.NamedTemporaryFile(suffix='.tflite', delete=False)
+        self.file.close()
+
+    def tearDown(self):
+        os.remove(self.file.name)
+
+    def test_quantize_round_trip(self):
+        # Values are rounded to the nearest step and clipped to the integer range
+        values = np.array([0.0, 0.25, 1.0, 2.0], dtype=np.float32)
+        quantized = quantize(values, np.int8, 1 / 255, -128)
+
+        self.assertEqual(quantized.dtype, np.int8)
+        self.assertEqual(quantized.tolist(), [-128, -64, 127, 127])
+        np.testing.assert_allclose(dequantize(quantized, 1 / 255, -128)[:3], [0.0, 64 / 255, 1.0], atol=1e-6)
+
+    @patch('src.utils.inference_backends._tflite_interpreter')
+    def test_float_model(self, interpreter_mock):
+        # A float model gets the batch as it is, the input is resized to the batch size once
+        output = np.full((4, 7), 1 / 7, dtype=np.float32)
+        interpreter = fake_interpreter(np.float32, output)
+        interpreter_mock.return_value.return_value = interpreter
+
+        model = TFLiteModel(self.file.name, num_threads=2)
+        batch = np.zeros((4, 224, 224, 3), dtype=np.float32)
+        result = model(batch, training=False)
+        model(batch, training=False)
+
+        interpreter_mock.return_value.assert_called_once_with(model_path=self.file.name, num_threads=2)
+        interpreter.resize_tensor_input.assert_called_once_with(0, (4, 224, 224, 3))
+        self.assertEqual(interpreter.set_tensor.call_args[0][1].dtype, np.float32)
+        np.testing.assert_array_equal(result, output)
+
+    @patch('src.utils.inference_backends._tflite_interpreter')
+    def test_int8_model(self, interpreter_mock):
+        # A fully quantized model is fed int8 inputs and its outputs are converted back to probabilities
+        output = np.array([[-128, 127, -128, -128, -128, -128, -128]], dtype=np.int8)
+        interpreter = fake_interpreter(np.int8, output, (1 / 255, -128), (1 / 256, -128))
+        interpreter_mock.return_value.return_value = interpreter
+
+        result = TFLiteModel(self.file.name)(np.ones((1, 224, 224, 3), dtype=np.float32))
+
+        interpreter.resize_tensor_input.assert_not_called()
+        fed = interpreter.set_tensor.call_args[0][1]
+        self.assertEqual(fed.dtype, np.int8)
+        self.assertTrue((fed == 127).all())
+        self.assertEqual(result.dtype, np.float32)
+        self.assertAlmostEqual(float(result[0, 1]), 255 / 256)
+        self.assertEqual(int(result.argmax()), 1)
+
+    def test_missing_file(self):
+        # A missing model is reported like the other formats
+        with self.assertRaises(FileNotFoundError):
+            load_model(self.file.name + '.missing.tflite')
+
+
+class TestLoadModel(unittest.TestCase):
+
+    @patch('src.utils.predict.OnnxModel')
+    @patch('src.utils.predict.TFLiteModel')
+    def test_dispatch_by_extension(self, tflite_mock, onnx_mock):
+        # The backend is picked from the file extension
+        self.assertIs(load_model('model_int8.tflite'), tflite_mock.return_value)
+        self.assertIs(load_model('model.onnx'), onnx_mock.return_value)
+        tflite_mock.assert_called_once()
+        self.assertEqual(tflite_mock.call_args[0][0], 'model_int8.tflite')
+        onnx_mock.assert_called_once()
+        self.assertEqual(onnx_mock.call_args[0][0], 'model.onnx')
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            load_model('model.bin')
+
+
+class TestCompareModels(unittest.TestCase):
+
+    def test_select_model(self):
+        # The fastest model above the accuracy floor is selected
+        results = [
+            {'model': 'model.keras', 'accuracy': 0.92, 'latency': {'1': {'p50_ms': 90.0}}},
+            {'model': 'model_float16.tflite', 'accuracy': 0.91, 'latency': {'1': {'p50_ms': 40.0}}},
+            {'model': 'model_int8.tflite', 'accuracy': 0.84, 'latency': {'1': {'p50_ms': 15.0}}},
+        ]
+
+        self.assertEqual(select_model(results, 0.9)['model'], 'model_float16.tflite')
+        self.assertEqual(select_model(results, 0.8)['model'], 'model_int8.tflite')
+        self.assertIsNone(select_model(results, 0.95))
+
+    def test_load_image_set(self):
+        # Images are read from the class folders, preprocessed and labelled with their class
+        with tempfile.TemporaryDirectory() as directory:
+            for label, count in ((0, 3), (5, 1)):
+                os.makedirs(os.path.join(directory, f'class_{label}'))
+                for index in range(count):
+                    cv2.imwrite(os.path.join(directory, f'class_{label}', f'{index}.png'),
+                                np.full((32, 32, 3), 10 * index, dtype=np.uint8))
+            os.makedirs(os.path.join(directory, 'other'))
+            with open(os.path.join(directory, 'class_5', 'notes.txt'), 'w') as file:
+                file.write('not an image')
+
+            images, labels = load_image_set(directory, max_per_class=2)
+
+        self.assertEqual(images.shape, (3, 224, 224, 3))
+        self.assertEqual(labels.tolist(), [0, 0, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
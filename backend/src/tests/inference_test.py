@@ -0,0 +1,161 @@
+import io
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import cv2
+import numpy as np
+
+from src.service.user_service import handle_predict_disease, handle_predict_disease_batch
+from src.utils.inference_pool import InferencePool, InferenceBusy, InferenceTimeout
+from src.utils.predict import predict_disease_image, predict_disease_images, prepare_images
+
+
+def encode_image(value: int) -> bytes:
+    # A plain photo-sized frame encoded as PNG
+    ok, encoded = cv2.imencode('.png', np.full((480, 640, 3), value, dtype=np.uint8))
+    return encoded.tobytes()
+
+
+class TestInferencePool(unittest.TestCase):
+
+    def test_inline(self):
+        # Without workers the inference runs in the calling thread
+        pool = InferencePool('test', workers=0)
+
+        self.assertEqual(pool.submit(os.getpid), os.getpid())
+        self.assertEqual(pool.stats()['completed'], 1)
+        self.assertEqual(pool.stats()['pending'], 0)
+
+    def test_inline_error(self):
+        # Errors of the inference reach the caller and free the slot
+        pool = InferencePool('test', workers=0, max_pending=1)
+
+        with self.assertRaises(ZeroDivisionError):
+            pool.submit(divmod, 1, 0)
+        self.assertEqual(pool.stats()['failed'], 1)
+        self.assertEqual(pool.submit(divmod, 7, 2), (3, 1))
+
+    def test_worker_process(self):
+        # The inference runs in another process
+        pool = InferencePool('test', workers=1)
+        try:
+            self.assertNotEqual(pool.submit(os.getpid), os.getpid())
+        finally:
+            pool.stop()
+
+    @patch('src.utils.inference_pool.multiprocessing.parent_process')
+    def test_start_in_child_process(self, parent_process_mock):
+        # A spawned worker importing the module that starts the pool does not start workers of its own
+        parent_process_mock.return_value = MagicMock()
+        pool = InferencePool('test', workers=1)
+
+        with self.assertLogs('terraflow.inference', 'WARNING') as logs:
+            pool.start()
+
+        self.assertIsNone(pool._executor)
+        self.assertIn("[test] Not starting the inference workers", logs.output[0])
+
+    def test_timeout(self):
+        # A caller waits at most the timeout, the slot stays taken until the worker is done
+        pool = InferencePool('test', workers=1, max_pending=1, timeout=0.5)
+        try:
+            pool.submit(os.getpid)
+            with self.assertRaises(InferenceTimeout):
+                pool.submit(time.sleep, 2)
+            self.assertEqual(pool.stats()['timed_out'], 1)
+            with self.assertRaises(InferenceBusy):
+                pool.submit(os.getpid)
+        finally:
+            pool.stop()
+
+    def test_busy(self):
+        # Requests beyond max_pending are rejected right away
+        pool = InferencePool('test', workers=0, max_pending=1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool.submit, args=(block,))
+        thread.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(InferenceBusy):
+                pool.submit(os.getpid)
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            release.set()
+            thread.join()
+
+
+class TestPredictDisease(unittest.TestCase):
+
+    @patch('src.service.user_service.disease_inference')
+    def test_handle_predict_disease_submits_bytes(self, pool_mock):
+        # Only the image bytes are handed to the inference workers
+        pool_mock.submit.return_value = {'prediction': 'Healthy', 'confidence': 0.9}
+
+        result = handle_predict_disease(io.BytesIO(b'image'))
+
+        pool_mock.submit.assert_called_once_with(predict_disease_image, b'image')
+        self.assertEqual(result, {'prediction': 'Healthy', 'confidence': 0.9})
+
+    def test_predict_disease_image_invalid(self):
+        # Bytes that are not an image are reported without running the model
+        self.assertEqual(predict_disease_image(b'not an image'), {'error': 'Invalid image file'})
+
+    @patch('src.service.user_service.disease_inference')
+    def test_handle_predict_disease_batch_submits_bytes(self, pool_mock):
+        # The images of a request are handed to a single inference
+        handle_predict_disease_batch([io.BytesIO(b'first'), io.BytesIO(b'second')])
+
+        pool_mock.submit.assert_called_once()
+        self.assertIs(pool_mock.submit.call_args[0][0], predict_disease_images)
+        self.assertEqual(pool_mock.submit.call_args[0][1], [b'first', b'second'])
+
+    def test_prepare_images(self):
+        # Images are resized to the model input in the order received, invalid ones are None
+        prepared = prepare_images([encode_image(0), b'not an image', encode_image(255)], threads=2)
+
+        self.assertEqual(prepared[0].shape, (224, 224, 3))
+        self.assertIsNone(prepared[1])
+        self.assertAlmostEqual(float(prepared[2].max()), 1.0)
+
+    @patch('src.utils.predict.models')
+    def test_predict_disease_images(self, models_mock):
+        # The valid images are classified in one forward pass, the plant by their mean probabilities
+        probabilities = np.array([
+            [0.6, 0.4, 0, 0, 0, 0, 0],
+            [0.3, 0.7, 0, 0, 0, 0, 0],
+            [0.7, 0.3, 0, 0, 0, 0, 0],
+        ], dtype=np.float32)
+        model = MagicMock(return_value=probabilities)
+        models_mock.get.return_value = model
+
+        result = predict_disease_images([encode_image(10), encode_image(20), b'not an image', encode_image(30)],
+                                        threads=2)
+
+        model.assert_called_once()
+        self.assertEqual(model.call_args[0][0].shape, (3, 224, 224, 3))
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['prediction'], 'Fungal')
+        self.assertAlmostEqual(result['confidence'], 1.6 / 3, places=5)
+        self.assertEqual([p.get('prediction') for p in result['predictions']], ['Fungal', 'Bacterial', None, 'Fungal'])
+        self.assertEqual(result['predictions'][2], {'error': 'Invalid image file'})
+
+    @patch('src.utils.predict.models')
+    def test_predict_disease_images_none_valid(self, models_mock):
+        # Without a valid image the model is not run
+        result = predict_disease_images([b'not an image'])
+
+        models_mock.get.assert_not_called()
+        self.assertEqual(result['error'], 'No valid image file')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,77 @@
+import itertools
 import json
+import os
 import random
 import string
-from locust import HttpUser, task, between
+import threading
+import time
+from datetime import datetime, timedelta
+
+import paho.mqtt.client as mqtt
+import socketio
+from locust import HttpUser, User, task, between, events
+from locust.exception import StopUser
+from locust.runners import WorkerRunner
 
 USER = {"email": "1@1.1", "password": "1"}
-DEVICE_ID = "d372fd8aa13bc0dc8e891b20"
 AUTH_BASE_URL = ""
 DEVICE_BASE_URL = "/device"
 USER_BASE_URL = "/user"
 
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+# Sensor records written per bulk write while seeding
+SEED_BATCH_SIZE = 10000
+
+# Time in seconds a socket call, an export or a prediction may take before it is counted as failed
+RESPONSE_TIMEOUT = 60
+
+# Maximum number of published sensor records waiting for their Socket.IO event
+MAX_PENDING_RECORDS = 100000
+
+# Index of the next user started by this process, used to hand out the seeded devices
+user_counter = itertools.count()
+
+# Devices watched by the Socket.IO users of this process
+watched_devices = set()
+
+# Publish time of the sensor records of watched devices, keyed by device ID and timestamp
+published_records = {}
+
+# Last timestamp published for each device, so every record of a device has a distinct timestamp
+device_clocks = {}
+device_clocks_lock = threading.Lock()
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    """
+    Adds the options of the scenario to the Locust command line, they can also be set in the environment.
+    """
+    parser.add_argument("--seed", type=int, env_var="LOCUST_SEED", default=1,
+                        help="Seed of the device IDs and of the simulated users, runs with the same seed use the "
+                             "same devices")
+    parser.add_argument("--seed-devices", type=int, env_var="LOCUST_SEED_DEVICES", default=20,
+                        help="Number of devices shared by the simulated users")
+    parser.add_argument("--seed-records", type=int, env_var="LOCUST_SEED_RECORDS", default=1000,
+                        help="Sensor records stored for each device before the test starts, 0 keeps the database "
+                             "as it is")
+    parser.add_argument("--seed-interval", type=int, env_var="LOCUST_SEED_INTERVAL", default=300,
+                        help="Seconds between two seeded sensor records")
+    parser.add_argument("--devices-per-user", type=int, env_var="LOCUST_DEVICES_PER_USER", default=3,
+                        help="Devices added to the account of each HTTP and Socket.IO user")
+    parser.add_argument("--export-format", env_var="LOCUST_EXPORT_FORMAT", default="csv",
+                        help="Format requested by the Socket.IO exports")
+    parser.add_argument("--mqtt-broker", env_var="MQTT_BROKER", default="localhost",
+                        help="Broker the MQTT device users publish to")
+    parser.add_argument("--mqtt-port", type=int, env_var="MQTT_PORT", default=1883,
+                        help="Port of the MQTT broker")
+    parser.add_argument("--slo-p95-ms", env_var="LOCUST_SLO_P95_MS", default="1000",
+                        help="Maximum p95 response time in ms of every request, followed by per request overrides, "
+                             "e.g. '1000,export=30000,predict=2000'. 0 disables the check")
+    parser.add_argument("--slo-error-rate", type=float, env_var="LOCUST_SLO_ERROR_RATE", default=0.01,
+                        help="Maximum ratio of failed requests")
+
 
 def random_email():
     letters = ''.join(random.choices(string.ascii_lowercase, k=8))
@@ -19,14 +82,204 @@ def random_password():
     return "password123"
 
 
-class AuthenticatedDeviceUser(HttpUser):
-    wait_time = between(1, 3)
+def seeded_device_ids(seed: int, count: int) -> list[str]:
+    """
+    Generates the IDs of the devices used by the test. They are valid ObjectIds derived from the seed,
+    the same scheme as the load generator of mock_raspberry.
+
+    :param seed: int: The seed of the run.
+    :param count: int: The number of devices.
+    :return: list[str]: The device IDs.
+    """
+    return [f"{seed:08x}{index:016x}" for index in range(count)]
+
+
+def next_timestamp(device_id: str) -> str:
+    """
+    Returns the timestamp of the next record of a device, one second after the previous one at least.
+
+    :param device_id: str: The ID of the device.
+    :return: str: The timestamp.
+    """
+    now = datetime.now().replace(microsecond=0)
+    with device_clocks_lock:
+        previous = device_clocks.get(device_id)
+        clock = now if previous is None or previous < now else previous + timedelta(seconds=1)
+        device_clocks[device_id] = clock
+    return clock.strftime(TIMESTAMP_FORMAT)
+
+
+def random_sensor_data(rng: random.Random) -> dict:
+    return {
+        "temperature": rng.uniform(20, 35),
+        "humidity": rng.uniform(40, 65),
+        "moisture": rng.uniform(15, 55),
+    }
+
+
+def seed_history(options) -> None:
+    """
+    Stores the devices of the test and a history of options.seed_records sensor records for each of them,
+    ending at midnight, with the matching rollups and monthly water usage.
+    The history is written through the backend services into the database configured for the backend, so Locust
+    must run from the backend directory with `python -m locust`. Devices already holding exactly the requested
+    history are kept, the others are rebuilt, so every run starts from the same state.
+
+    :param options: argparse.Namespace: The parsed Locust options.
+    :return: None
+    """
+    from bson import ObjectId
+    from src.config.mongo import mongo_db, DEVICE_COLLECTION, SENSOR_COLLECTION, ROLLUP_COLLECTION, WATER_COLLECTION
+    from src.service.record_service import append_sensor_records, count_sensor_records
+    from src.service.rollup_service import update_sensor_rollups, record_water_rollup
+    from src.service.water_service import add_water_usage
+
+    rng = random.Random(options.seed)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for device_id in seeded_device_ids(options.seed, options.seed_devices):
+        mongo_db[DEVICE_COLLECTION].update_one({'_id': ObjectId(device_id)},
+                                               {'$setOnInsert': {'name': f"Locust {device_id[-4:]}"}}, upsert=True)
+        if count_sensor_records(device_id) == options.seed_records:
+            continue
+
+        for collection in (SENSOR_COLLECTION, ROLLUP_COLLECTION, WATER_COLLECTION):
+            mongo_db[collection].delete_many({'device_id': device_id})
+
+        batch = []
+        months = set()
+        for index in range(options.seed_records, 0, -1):
+            timestamp = end - timedelta(seconds=index * options.seed_interval)
+            months.add(timestamp.strftime("%Y/%m"))
+            batch.append((device_id, {'sensor_data': random_sensor_data(rng),
+                                      'timestamp': timestamp.strftime(TIMESTAMP_FORMAT)}))
+            if len(batch) >= SEED_BATCH_SIZE:
+                append_sensor_records(batch)
+                update_sensor_rollups(batch)
+                batch = []
+        if batch:
+            append_sensor_records(batch)
+            update_sensor_rollups(batch)
+
+        for month in sorted(months):
+            water_used = rng.uniform(100, 500)
+            add_water_usage(device_id, month, water_used)
+            record_water_rollup(device_id, month, water_used)
+        print(f"Seeded device {device_id} with {options.seed_records} records")
+
+
+@events.test_start.add_listener
+def on_test_start(environment, **_kwargs):
+    """
+    Seeds the device history once per run, on the master or the standalone process.
+    """
+    options = environment.parsed_options
+    if isinstance(environment.runner, WorkerRunner) or options is None or options.seed_records <= 0:
+        return
+    seed_history(options)
+
+
+def parse_p95_thresholds(value: str) -> tuple[float, dict[str, float]]:
+    """
+    Parses the --slo-p95-ms option.
+
+    :param value: str: The default threshold followed by 'name=threshold' overrides, comma separated.
+    :return: tuple[float, dict[str, float]]: The default threshold and the thresholds by request name.
+    """
+    default = 0.0
+    by_name = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        name, separator, threshold = part.rpartition('=')
+        if separator:
+            by_name[name.strip()] = float(threshold)
+        else:
+            default = float(threshold)
+    return default, by_name
+
+
+def check_slo(stats, max_p95_ms: str, max_error_rate: float) -> list[str]:
+    """
+    Checks the results of a run against the service level objectives.
+
+    :param stats: locust.stats.RequestStats: The statistics of the run.
+    :param max_p95_ms: str: The p95 thresholds, in the format of --slo-p95-ms.
+    :param max_error_rate: float: The maximum ratio of failed requests.
+    :return: list[str]: The violated objectives, empty if the run passed.
+    """
+    violations = []
+    total = stats.total
+    if total.num_requests and total.fail_ratio > max_error_rate:
+        violations.append(f"error rate {total.fail_ratio:.2%} > {max_error_rate:.2%}")
+
+    default, by_name = parse_p95_thresholds(max_p95_ms)
+    for entry in stats.entries.values():
+        limit = by_name.get(entry.name, default)
+        if not limit or not entry.num_requests:
+            continue
+        p95 = entry.get_response_time_percentile(0.95)
+        if p95 > limit:
+            violations.append(f"{entry.method} {entry.name}: p95 {p95:.0f} ms > {limit:.0f} ms")
+    return violations
+
+
+@events.quitting.add_listener
+def on_quitting(environment, **_kwargs):
+    """
+    Sets the exit code of the run from the service level objectives: 1 when one is not met, 0 otherwise,
+    including when a few requests failed within the allowed error rate.
+    """
+    options = environment.parsed_options
+    if isinstance(environment.runner, WorkerRunner) or options is None:
+        return
+    violations = check_slo(environment.stats, options.slo_p95_ms, options.slo_error_rate)
+    for violation in violations:
+        print(f"SLO violated: {violation}")
+    environment.process_exit_code = 1 if violations else 0
+
+
+def report(environment, request_type: str, name: str, start: float, exception: Exception = None,
+           response_length: int = 0) -> None:
+    """
+    Records a request that is not made through the Locust HTTP client.
+
+    :param environment: locust.env.Environment: The environment of the user.
+    :param request_type: str: The kind of request, e.g. "socketio" or "mqtt".
+    :param name: str: The name of the request in the statistics.
+    :param start: float: The time.perf_counter() value at which the request started.
+    :param exception: Exception: The error of a failed request.
+    :param response_length: int: The size of the response.
+    :return: None
+    """
+    environment.events.request.fire(
+        request_type=request_type,
+        name=name,
+        response_time=(time.perf_counter() - start) * 1000,
+        response_length=response_length,
+        exception=exception,
+        context={},
+    )
+
+
+class DashboardUser(HttpUser):
+    """
+    Account of a mobile app user owning a few of the seeded devices.
+    """
+    abstract = True
     token = None
     email = None
     password = None
 
     def on_start(self):
-        """Each user registers and logs in independently."""
+        """Each user registers, logs in and adds its devices independently."""
+        options = self.environment.parsed_options
+        index = next(user_counter)
+        self.rng = random.Random(options.seed * 1000003 + index)
+        pool = seeded_device_ids(options.seed, options.seed_devices)
+        self.device_ids = list(dict.fromkeys(
+            pool[(index * options.devices_per_user + offset) % len(pool)]
+            for offset in range(options.devices_per_user)
+        ))
+
         self.email = random_email()
         self.password = random_password()
 
@@ -52,23 +305,19 @@ class AuthenticatedDeviceUser(HttpUser):
         else:
             print(f"Login failed: {login_response.text}")
             self.token = None
+            return
 
-        add_device_data = {
-            "device_id": DEVICE_ID
-        }
-
-        # Add device to user
-        add_device_response = self.client.patch(
-            f"{USER_BASE_URL}/",
-            json=add_device_data,
-            headers=self.get_auth_headers()
-        )
-
-        if add_device_response.status_code not in [200, 201]:
-            print(f"Failed to add device: {add_device_response.text}")
-            self.token = None
-        else:
-            print(f"Device added successfully: {add_device_response.text}")
+        # Add the devices to the user
+        for device_id in self.device_ids:
+            add_device_response = self.client.patch(
+                f"{USER_BASE_URL}/",
+                json={"device_id": device_id},
+                headers=self.get_auth_headers()
+            )
+            if add_device_response.status_code not in [200, 201]:
+                print(f"Failed to add device: {add_device_response.text}")
+                self.token = None
+                return
 
     def get_auth_headers(self):
         """Returns auth headers if token is valid"""
@@ -76,22 +325,27 @@ class AuthenticatedDeviceUser(HttpUser):
             return {}
         return {"Authorization": f"Bearer {self.token}"}
 
+
+class AuthenticatedDeviceUser(DashboardUser):
+    wait_time = between(1, 3)
+
     @task(5)
     def get_device_data(self):
-        """Fetch device data for a known device ID."""
+        """Fetch device data for one of the user's devices."""
         headers = self.get_auth_headers()
         if not headers:
             return
         with self.client.get(
-                f"{DEVICE_BASE_URL}/{DEVICE_ID}/data",
+                f"{DEVICE_BASE_URL}/{self.rng.choice(self.device_ids)}/data",
                 headers=headers,
+                name=f"{DEVICE_BASE_URL}/[id]/data",
         ) as response:
             if response.status_code != 200:
                 print(f"Error fetching device data: {response.text}")
 
     @task(3)
     def update_watering_type(self):
-        """Update watering type for a known device."""
+        """Update watering type for one of the user's devices."""
         headers = self.get_auth_headers()
         if not headers:
             return
@@ -103,9 +357,10 @@ class AuthenticatedDeviceUser(HttpUser):
             }
         }
         with self.client.put(
-                f"{DEVICE_BASE_URL}/{DEVICE_ID}/watering_type",
+                f"{DEVICE_BASE_URL}/{self.rng.choice(self.device_ids)}/watering_type",
                 json=payload,
                 headers=headers,
+                name=f"{DEVICE_BASE_URL}/[id]/watering_type",
         ) as response:
             if response.status_code not in [200, 204]:
                 print(f"Error updating watering type: {response.text}")
@@ -116,14 +371,15 @@ class AuthenticatedDeviceUser(HttpUser):
         headers = self.get_auth_headers()
         if not headers:
             return
-        new_name = f"Updated Name {random.randint(100, 999)}"
+        new_name = f"Updated Name {self.rng.randint(100, 999)}"
         payload = {
             "name": new_name
         }
         with self.client.patch(
-                f"{DEVICE_BASE_URL}/{DEVICE_ID}",
+                f"{DEVICE_BASE_URL}/{self.rng.choice(self.device_ids)}",
                 json=payload,
                 headers=headers,
+                name=f"{DEVICE_BASE_URL}/[id]",
         ) as response:
             if response.status_code not in [200, 204]:
                 print(f"Error renaming device: {response.text}")
@@ -140,3 +396,193 @@ class AuthenticatedDeviceUser(HttpUser):
         ) as response:
             if response.status_code != 200:
                 print(f"Error fetching user devices: {response.text}")
+
+
+class SocketIODashboardUser(DashboardUser):
+    """
+    Mobile app kept open on the dashboard: it watches its devices over Socket.IO, triggers irrigations and
+    exports. The delay between a sensor record published by a device user of the same process and its
+    Socket.IO event is reported as "record fan-out".
+    """
+    wait_time = between(2, 5)
+
+    def on_start(self):
+        super().on_start()
+        if not self.token:
+            raise StopUser()
+
+        self.export_responses = {}
+        self.export_received = threading.Event()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('*', self.on_event)
+
+        start = time.perf_counter()
+        try:
+            self.sio.connect(self.host, transports=['websocket'], wait_timeout=RESPONSE_TIMEOUT)
+        except Exception as e:
+            report(self.environment, "socketio", "connect", start, e)
+            raise StopUser()
+        report(self.environment, "socketio", "connect", start)
+
+        self.init()
+        watched_devices.update(self.device_ids)
+
+    def on_stop(self):
+        sio = getattr(self, 'sio', None)
+        if sio is not None and sio.connected:
+            sio.disconnect()
+
+    def on_event(self, event: str, data=None):
+        """Handles the events pushed by the backend."""
+        received = time.perf_counter()
+        if event == 'export_response' and isinstance(data, dict):
+            self.export_responses[data.get('job_id')] = data
+            self.export_received.set()
+            return
+
+        device_id, _, kind = event.partition('/')
+        if kind != 'record' or not isinstance(data, dict):
+            return
+        sent = published_records.pop((device_id, data.get('timestamp')), None)
+        if sent is not None:
+            self.environment.events.request.fire(
+                request_type="socketio",
+                name="record fan-out",
+                response_time=(received - sent) * 1000,
+                response_length=0,
+                exception=None,
+                context={},
+            )
+
+    def call(self, name: str, data: dict):
+        """
+        Emits an event and waits for its acknowledgement, recording the round trip.
+
+        :param name: str: The event name.
+        :param data: dict: The event payload.
+        :return: The acknowledgement, or None if the call failed.
+        """
+        start = time.perf_counter()
+        try:
+            ack = self.sio.call(name, data, timeout=RESPONSE_TIMEOUT)
+        except Exception as e:
+            report(self.environment, "socketio", name, start, e)
+            return None
+        report(self.environment, "socketio", name, start)
+        return ack
+
+    @task(1)
+    def init(self):
+        """Register the socket for the user's devices, as the app does when the dashboard opens."""
+        self.call('init', {'token': self.token, 'devices': self.device_ids})
+
+    @task(3)
+    def trigger_irrigation(self):
+        """Trigger a manual irrigation of one of the user's devices."""
+        self.call('trigger_irrigation', {'device_id': self.rng.choice(self.device_ids)})
+
+    @task(1)
+    def export(self):
+        """Export the history of a device and wait for the result."""
+        start = time.perf_counter()
+        ack = self.call('export', {'device_id': self.rng.choice(self.device_ids),
+                                   'format': self.environment.parsed_options.export_format})
+        if not isinstance(ack, dict) or 'job_id' not in ack:
+            report(self.environment, "socketio", "export", start, RuntimeError(f"Export rejected: {ack}"))
+            return
+
+        deadline = start + RESPONSE_TIMEOUT
+        while ack['job_id'] not in self.export_responses and time.perf_counter() < deadline:
+            self.export_received.wait(min(1.0, max(0.0, deadline - time.perf_counter())))
+            self.export_received.clear()
+
+        response = self.export_responses.pop(ack['job_id'], None)
+        if response is None:
+            report(self.environment, "socketio", "export", start, TimeoutError("No export response"))
+        elif 'error' in response:
+            report(self.environment, "socketio", "export", start, RuntimeError(response['error']))
+        else:
+            report(self.environment, "socketio", "export", start, response_length=response.get('size') or len(response.get('file') or b''))
+
+
+class MqttDeviceUser(User):
+    """
+    Irrigation controller publishing sensor data, water usage and prediction requests for one of the seeded
+    devices. Publishes are reported once the broker acknowledged them, predictions once the answer arrived.
+    """
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        options = self.environment.parsed_options
+        index = next(user_counter)
+        self.rng = random.Random(options.seed * 1000003 + index)
+        pool = seeded_device_ids(options.seed, options.seed_devices)
+        self.device_id = pool[index % len(pool)]
+        self.predictions = threading.Event()
+
+        self.client = mqtt.Client(client_id=f"locust-{options.seed}-{os.getpid()}-{index}", clean_session=True)
+        self.client.on_message = self.on_message
+        start = time.perf_counter()
+        try:
+            self.client.connect(options.mqtt_broker, options.mqtt_port)
+        except Exception as e:
+            report(self.environment, "mqtt", "connect", start, e)
+            raise StopUser()
+        report(self.environment, "mqtt", "connect", start)
+        self.client.loop_start()
+        self.client.subscribe(f"{self.device_id}/prediction", qos=1)
+
+    def on_stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def on_message(self, _client, _userdata, _msg):
+        """Signals the prediction answered for the device."""
+        self.predictions.set()
+
+    def publish(self, topic: str, payload: dict) -> None:
+        """
+        Publishes a message of the device with QoS 1 and records the time until the broker acknowledged it.
+
+        :param topic: str: The topic without the device ID.
+        :param payload: dict: The message.
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            info = self.client.publish(f"{self.device_id}/{topic}", json.dumps(payload), qos=1)
+            info.wait_for_publish(timeout=RESPONSE_TIMEOUT)
+            if not info.is_published():
+                raise TimeoutError(f"Publish not acknowledged, rc={info.rc}")
+        except Exception as e:
+            report(self.environment, "mqtt", topic, start, e)
+            return
+        report(self.environment, "mqtt", topic, start)
+
+    @task(10)
+    def publish_sensor_data(self):
+        """Publish a sensor record."""
+        timestamp = next_timestamp(self.device_id)
+        if self.device_id in watched_devices and len(published_records) < MAX_PENDING_RECORDS:
+            published_records[(self.device_id, timestamp)] = time.perf_counter()
+        self.publish("record/sensor_data", {'sensor_data': random_sensor_data(self.rng), 'timestamp': timestamp})
+
+    @task(1)
+    def publish_water_used(self):
+        """Publish the water used this month."""
+        self.publish("record/water_used", {'water_used': self.rng.uniform(0.5, 5.0),
+                                           'date': datetime.now().strftime("%Y/%m")})
+
+    @task(2)
+    def predict(self):
+        """Request a prediction and wait for the answer."""
+        self.predictions.clear()
+        start = time.perf_counter()
+        self.client.publish(f"{self.device_id}/predict", json.dumps({
+            'sensor_data': random_sensor_data(self.rng),
+            'timestamp': datetime.now().strftime(TIMESTAMP_FORMAT),
+        }), qos=1)
+        if self.predictions.wait(RESPONSE_TIMEOUT):
+            report(self.environment, "mqtt", "predict", start)
+        else:
+            report(self.environment, "mqtt", "predict", start, TimeoutError("No prediction received"))
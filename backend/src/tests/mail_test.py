@@ -0,0 +1,137 @@
+import io
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+
+from bson import ObjectId
+from openpyxl import load_workbook
+
+from src.service.mail_service import send_monthly_report, report_month, report_checkpoint_key, build_user_report
+
+
+class TestMailService(unittest.TestCase):
+    def setUp(self):
+        # Mock MongoDB, Redis and the SMTP connection, and build the reports in threads
+        self.mongo_db_mock = MagicMock()
+        self.redis_mock = MagicMock()
+        self.smtp_mock = MagicMock()
+        self.mongo_patcher = patch('src.service.mail_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.mail_service.r', self.redis_mock)
+        self.smtp_patcher = patch('src.utils.mailer.smtplib.SMTP', self.smtp_mock)
+        self.pool_patcher = patch('src.service.mail_service.ProcessPoolExecutor',
+                                  lambda max_workers, mp_context: ThreadPoolExecutor(max_workers))
+        self.report_patcher = patch('src.service.mail_service.build_user_report', return_value=b'report')
+
+        self.mongo_patcher.start()
+        self.redis_patcher.start()
+        self.smtp_patcher.start()
+        self.pool_patcher.start()
+        self.report_mock = self.report_patcher.start()
+
+        self.mongo_db_mock.__getitem__.return_value.find.return_value = [
+            {'_id': 'user1', 'email': 'first@terraflow.test', 'devices': ['device1']},
+            {'_id': 'user2', 'email': 'second@terraflow.test', 'devices': ['device2']},
+            {'_id': 'user3', 'email': 'third@example.com', 'devices': ['device3']},
+        ]
+
+    def tearDown(self):
+        # Stop all patches
+        self.mongo_patcher.stop()
+        self.redis_patcher.stop()
+        self.smtp_patcher.stop()
+        self.pool_patcher.stop()
+        self.report_patcher.stop()
+
+    def test_report_month(self):
+        # Test that a run on the first day covers the previous month
+        self.assertEqual(report_month(datetime(2024, 1, 1)), (2023, 12))
+        self.assertEqual(report_month(datetime(2024, 5, 1)), (2024, 4))
+        self.assertEqual(report_month(datetime(2024, 5, 17)), (2024, 5))
+
+    def test_send_monthly_report_reuses_session(self):
+        # Test that every report is sent through one SMTP connection and checkpointed
+        self.redis_mock.smembers.return_value = set()
+
+        send_monthly_report()
+
+        self.smtp_mock.assert_called_once()
+        server = self.smtp_mock.return_value
+        server.login.assert_called_once()
+        self.assertEqual(server.send_message.call_count, 2)
+        server.quit.assert_called_once()
+        checkpointed = {call.args[1] for call in self.redis_mock.sadd.call_args_list}
+        self.assertEqual(checkpointed, {'user1', 'user2'})
+
+    def test_send_monthly_report_resumes(self):
+        # Test that the users whose report was already sent are skipped
+        self.redis_mock.smembers.return_value = {'user1'}
+
+        send_monthly_report()
+
+        self.report_mock.assert_called_once()
+        self.assertEqual(self.report_mock.call_args[0][0], 'user2')
+        self.assertEqual(self.smtp_mock.return_value.send_message.call_count, 1)
+
+    def test_send_monthly_report_failed_send_not_checkpointed(self):
+        # Test that a report that could not be sent is retried on the next run
+        self.redis_mock.smembers.return_value = set()
+        self.smtp_mock.return_value.send_message.side_effect = [None, Exception("rejected")]
+
+        send_monthly_report()
+
+        self.assertEqual(self.redis_mock.sadd.call_count, 1)
+
+    def test_send_monthly_report_skips_empty_report(self):
+        # Test that users without records this month get no email
+        self.redis_mock.smembers.return_value = set()
+        self.report_mock.return_value = None
+
+        send_monthly_report()
+
+        self.smtp_mock.assert_not_called()
+        self.redis_mock.sadd.assert_not_called()
+
+    @patch('src.service.mail_service.get_monthly_water_totals')
+    @patch('src.service.mail_service.get_rollups')
+    def test_build_user_report_from_rollups(self, rollups_mock, totals_mock):
+        # The report is built from the monthly and daily rollups, without reading the raw records
+        device_id = str(ObjectId())
+        self.mongo_db_mock.__getitem__.return_value.find.return_value = [{'_id': ObjectId(device_id), 'name': 'Field'}]
+        stats = {'min': 20, 'max': 24, 'mean': 22.0, 'count': 2}
+        rollups = {
+            'month': [{'key': '2025/05', 'count': 2, 'water_used': 7, 'temperature': stats, 'humidity': None,
+                       'moisture': None}],
+            'day': [{'key': '2025/05/05', 'count': 2, 'water_used': 7, 'temperature': stats, 'humidity': None,
+                     'moisture': None}],
+        }
+        rollups_mock.side_effect = lambda _, period, start, end: rollups[period]
+        totals_mock.return_value = {'2024/12': 1, '2025/04': 3, '2025/05': 7, '2025/06': 9}
+
+        report = build_user_report('user1', [device_id], 2025, 5)
+
+        self.assertEqual(rollups_mock.call_args_list[1].args, (device_id, 'day', '2025/05/01 00:00:00', '2025/05/31'))
+        # The sheet pads the rows to its width, the empty cells are dropped
+        sheet = load_workbook(io.BytesIO(report))['Field 1']
+        rows = [tuple(value for value in row if value is not None) for row in sheet.values]
+        self.assertIn(('Temperature', 20, 24, 22, 2), rows)
+        self.assertIn(('2025/05/05', 2, 20, 22, 24, 7), rows)
+        self.assertIn(('April 2025', 3), rows)
+        self.assertIn(('May 2025', 7), rows)
+        self.assertNotIn(('June 2025', 9), rows)
+        self.assertNotIn(('December 2024', 1), rows)
+
+    @patch('src.service.mail_service.get_rollups', return_value=[])
+    def test_build_user_report_without_rollup(self, _):
+        # A device without data for the month is left out of the report
+        device_id = str(ObjectId())
+        self.mongo_db_mock.__getitem__.return_value.find.return_value = [{'_id': ObjectId(device_id), 'name': 'Field'}]
+
+        self.assertIsNone(build_user_report('user1', [device_id], 2025, 5))
+
+    def test_report_checkpoint_key(self):
+        self.assertEqual(report_checkpoint_key(2024, 3), 'report:2024/03:sent')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import logging
+import unittest
+from unittest.mock import patch, MagicMock
+
+from flask import Flask
+
+from src.api.metrics_api import metrics_blueprint
+from src.config.mongo import CommandMetrics, MONGO_COMMAND_SECONDS
+from src.service.device_meta_service import device_cache
+from src.service.mqtt_service import dispatch_message, MQTT_MESSAGES, MQTT_DISCARDED
+from src.utils.logger import SampleFilter
+from src.utils.metrics import MetricsRegistry
+
+
+def sample_value(metric, name, **labels):
+    """
+    Returns the value of a sample of a metric, or 0 if it was never recorded.
+    """
+    for sample_name, sample_labels, value in metric.samples():
+        if sample_name == name and dict(sample_labels) == {k: str(v) for k, v in labels.items()}:
+            return value
+    return 0
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_render(self):
+        # Counters are rendered with their help, type and one line per label combination
+        counter = self.registry.counter('test_messages_total', 'Messages', ('topic',))
+        counter.inc(topic='predict')
+        counter.inc(2, topic='predict')
+        counter.inc(topic='say "hi"\n')
+
+        output = self.registry.render()
+
+        self.assertIn('# HELP test_messages_total Messages\n', output)
+        self.assertIn('# TYPE test_messages_total counter\n', output)
+        self.assertIn('test_messages_total{topic="predict"} 3\n', output)
+        self.assertIn('test_messages_total{topic="say \\"hi\\"\\n"} 1\n', output)
+
+    def test_histogram_buckets(self):
+        # Histogram buckets are cumulative and end with +Inf
+        histogram = self.registry.histogram('test_seconds', 'Latency', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        output = self.registry.render()
+
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', output)
+        self.assertIn('test_seconds_bucket{le="1"} 3\n', output)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4\n', output)
+        self.assertIn('test_seconds_sum 6.05\n', output)
+        self.assertIn('test_seconds_count 4\n', output)
+
+    def test_histogram_time_on_error(self):
+        # A block that raises is still timed
+        histogram = self.registry.histogram('test_seconds', 'Latency')
+        with self.assertRaises(RuntimeError):
+            with histogram.time():
+                raise RuntimeError('boom')
+
+        self.assertEqual(sample_value(histogram, 'test_seconds_count'), 1)
+
+    def test_same_name_returns_registered_metric(self):
+        # Modules declaring the same metric share it, a conflicting declaration is rejected
+        first = self.registry.counter('test_total', 'Test', ('event',))
+        self.assertIs(self.registry.counter('test_total', 'Test', ('event',)), first)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('test_total', 'Test', ('event',))
+
+    def test_wrong_labels(self):
+        # Samples must set exactly the declared labels
+        counter = self.registry.counter('test_total', 'Test', ('event',))
+        with self.assertRaises(ValueError):
+            counter.inc(topic='predict')
+
+    def test_register_stats(self):
+        # Stats are rendered as gauges, nested stats are labelled with their key and failures are skipped
+        self.registry.register_stats('test_queue', 'Queue', lambda: {'submitted': 4, 'name': 'ingest'},
+                                     {'queue': 'ingest'})
+        self.registry.register_stats('test_model', 'Models', lambda: {'irrigation': {'loads': 2, 'loaded': True}})
+        self.registry.register_stats('test_broken', 'Broken', MagicMock(side_effect=RuntimeError('down')))
+
+        output = self.registry.render()
+
+        self.assertIn('# TYPE test_queue_submitted gauge\n', output)
+        self.assertIn('test_queue_submitted{queue="ingest"} 4\n', output)
+        self.assertNotIn('test_queue_name', output)
+        self.assertIn('test_model_loads{name="irrigation"} 2\n', output)
+        self.assertIn('test_model_loaded{name="irrigation"} 1\n', output)
+        self.assertNotIn('test_broken', output)
+
+
+class TestSampleFilter(unittest.TestCase):
+
+    def record(self, level):
+        return logging.LogRecord('test', level, __file__, 1, 'message', None, None)
+
+    def test_sampling(self):
+        # One record in every N is kept, errors are always kept
+        sample_filter = SampleFilter(3)
+
+        kept = [sample_filter.filter(self.record(logging.INFO)) for _ in range(6)]
+
+        self.assertEqual(kept, [True, False, False, True, False, False])
+        self.assertTrue(sample_filter.filter(self.record(logging.ERROR)))
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.mongo_patcher = patch('src.service.device_meta_service.mongo_db', MagicMock())
+        self.mongo_patcher.start()
+        device_cache.clear()
+
+    def tearDown(self):
+        self.mongo_patcher.stop()
+        device_cache.clear()
+
+    def test_dispatch_message_counts_topics(self):
+        # Messages are counted per topic type, discarded ones by reason
+        device_cache.set("507f1f77bcf86cd799439011", {"id": "507f1f77bcf86cd799439011", "name": "Garden"})
+        handled = sample_value(MQTT_MESSAGES, 'terraflow_mqtt_messages_total', topic='predict')
+        unknown = sample_value(MQTT_DISCARDED, 'terraflow_mqtt_discarded_total', reason='unknown_topic')
+
+        with patch.dict('src.service.mqtt_service.DEVICE_TOPIC_HANDLERS', {'predict': MagicMock()}):
+            dispatch_message("507f1f77bcf86cd799439011/predict", "{}")
+            dispatch_message("507f1f77bcf86cd799439011/unknown", "{}")
+
+        self.assertEqual(sample_value(MQTT_MESSAGES, 'terraflow_mqtt_messages_total', topic='predict'), handled + 1)
+        self.assertEqual(sample_value(MQTT_DISCARDED, 'terraflow_mqtt_discarded_total', reason='unknown_topic'),
+                         unknown + 1)
+
+    def test_mongo_command_listener(self):
+        # The driver reported duration of the commands is recorded
+        count = sample_value(MONGO_COMMAND_SECONDS, 'terraflow_mongo_command_seconds_count',
+                             command='find', status='ok')
+
+        CommandMetrics().succeeded(MagicMock(command_name='find', duration_micros=1500))
+
+        self.assertEqual(sample_value(MONGO_COMMAND_SECONDS, 'terraflow_mongo_command_seconds_count',
+                                      command='find', status='ok'), count + 1)
+
+    def test_metrics_endpoint(self):
+        # The endpoint serves the registry in the text exposition format
+        app = Flask(__name__)
+        app.register_blueprint(metrics_blueprint)
+
+        response = app.test_client().get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn(b'# TYPE terraflow_mqtt_messages_total counter', response.data)
+        self.assertIn(b'terraflow_batch_queue_submitted{queue="sensor_ingest"}', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import pickle as pkl
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.utils.model_registry import ModelRegistry, _rss_bytes
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'model.pkl')
+        self.write_model({'version': 1})
+        self.loads = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_model(self, model, mtime=None):
+        with open(self.path, 'wb') as f:
+            pkl.dump(model, f)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def loader(self, path):
+        self.loads += 1
+        with open(path, 'rb') as f:
+            return pkl.load(f)
+
+    def test_model_loaded_once(self):
+        # Concurrent requests share a single load
+        registry = ModelRegistry(check_interval=60)
+        registry.register('model', self.path, self.loader)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get('model'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.loads, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        stats = registry.stats()['model']
+        self.assertTrue(stats['loaded'])
+        self.assertEqual(stats['loads'], 1)
+        self.assertGreaterEqual(stats['load_seconds'], 0)
+
+    def test_model_reloaded_when_file_changes(self):
+        registry = ModelRegistry(check_interval=0)
+        registry.register('model', self.path, self.loader)
+        self.assertEqual(registry.get('model'), {'version': 1})
+
+        # Unchanged file is not reloaded
+        registry.get('model')
+        self.assertEqual(self.loads, 1)
+
+        self.write_model({'version': 2}, mtime=os.stat(self.path).st_mtime + 10)
+        self.assertEqual(registry.get('model'), {'version': 2})
+        self.assertEqual(self.loads, 2)
+
+    def test_hot_reload_disabled(self):
+        registry = ModelRegistry(check_interval=-1)
+        registry.register('model', self.path, self.loader)
+        registry.get('model')
+
+        self.write_model({'version': 2}, mtime=os.stat(self.path).st_mtime + 10)
+        self.assertEqual(registry.get('model'), {'version': 1})
+
+    @patch('builtins.open', side_effect=FileNotFoundError)
+    def test_rss_without_proc_or_resource(self, _):
+        # Windows has neither /proc nor the resource module
+        with patch.dict('sys.modules', {'resource': None, 'psutil': None}):
+            self.assertEqual(_rss_bytes(), 0)
@@ -5,11 +5,18 @@ from unittest.mock import patch, MagicMock
 from bson.objectid import ObjectId
 
 from src.config.mongo import DEVICE_COLLECTION, USER_COLLECTION
+from src.service.device_meta_service import device_cache
 from src.service.mqtt_service import (
     extract_device_id,
+    shared_topic,
+    subscribe_device_topics,
+    is_known_device,
+    dispatch_message,
     register_device,
     predict,
+    predict_batch,
     record_sensor_data,
+    flush_sensor_records,
     record_water_used,
 )
 
@@ -28,21 +35,46 @@ class TestMqtt(unittest.TestCase):
 
         # Patch the dependencies
         self.mongo_patcher = patch('src.service.mqtt_service.mongo_db', self.mongo_db_mock)
-        self.redis_patcher = patch('src.service.mqtt_service.r', self.redis_mock)
+        self.meta_mongo_patcher = patch('src.service.device_meta_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.subscription_service.r', self.redis_mock)
         self.mqtt_patcher = patch('src.service.mqtt_service.mqtt', self.mqtt_mock)
         self.socketio_patcher = patch('src.service.mqtt_service.socketio', self.socketio_mock)
+        self.append_patcher = patch('src.service.mqtt_service.append_sensor_records')
+        self.rollup_patcher = patch('src.service.mqtt_service.update_sensor_rollups')
+        self.water_rollup_patcher = patch('src.service.mqtt_service.record_water_rollup')
+        self.water_patcher = patch('src.service.mqtt_service.add_water_usage')
+        self.ingest_patcher = patch('src.service.mqtt_service.sensor_ingest')
+        self.batcher_patcher = patch('src.service.mqtt_service.prediction_batcher')
+        self.predict_water_patcher = patch('src.service.mqtt_service.predict_water')
 
         self.mongo_patcher.start()
+        self.meta_mongo_patcher.start()
         self.redis_patcher.start()
         self.mqtt_patcher.start()
         self.socketio_patcher.start()
+        self.append_mock = self.append_patcher.start()
+        self.rollup_mock = self.rollup_patcher.start()
+        self.water_rollup_mock = self.water_rollup_patcher.start()
+        self.water_mock = self.water_patcher.start()
+        self.ingest_mock = self.ingest_patcher.start()
+        self.batcher_mock = self.batcher_patcher.start()
+        self.predict_water_mock = self.predict_water_patcher.start()
+        device_cache.clear()
 
     def tearDown(self):
         # Stop all patches
         self.mongo_patcher.stop()
+        self.meta_mongo_patcher.stop()
         self.redis_patcher.stop()
         self.mqtt_patcher.stop()
         self.socketio_patcher.stop()
+        self.append_patcher.stop()
+        self.rollup_patcher.stop()
+        self.water_rollup_patcher.stop()
+        self.water_patcher.stop()
+        self.ingest_patcher.stop()
+        self.batcher_patcher.stop()
+        self.predict_water_patcher.stop()
 
     def test_extract_controller_id(self):
         # Test extracting controller ID from topic
@@ -50,14 +82,104 @@ class TestMqtt(unittest.TestCase):
         result = extract_device_id(topic)
         self.assertEqual(result, "controller_id")
 
+    def test_shared_topic(self):
+        # Test that device topics are prefixed with the shared group only when one is configured
+        with patch('src.service.mqtt_service.MQTT_SHARED_GROUP', ''):
+            self.assertEqual(shared_topic("id/predict"), "id/predict")
+        with patch('src.service.mqtt_service.MQTT_SHARED_GROUP', 'terraflow'):
+            self.assertEqual(shared_topic("id/predict"), "$share/terraflow/id/predict")
+
+    def test_subscribe_device_topics(self):
+        # Test that all devices are covered by one wildcard subscription per topic
+        subscribe_device_topics()
+
+        self.mqtt_mock.subscribe.assert_any_call("+/record/sensor_data")
+        self.mqtt_mock.subscribe.assert_any_call("+/record/water_used")
+        self.mqtt_mock.subscribe.assert_any_call("+/predict")
+        self.assertEqual(self.mqtt_mock.subscribe.call_count, 3)
+
+    def test_is_known_device(self):
+        # Test that the database is queried once per registered device
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {"_id": ObjectId("507f1f77bcf86cd799439011")}
+
+        self.assertTrue(is_known_device("507f1f77bcf86cd799439011"))
+        self.assertTrue(is_known_device("507f1f77bcf86cd799439011"))
+
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_called_once_with(
+            {"_id": ObjectId("507f1f77bcf86cd799439011")}, {"name": 1}
+        )
+
+    def test_is_known_device_unknown(self):
+        # Test that unregistered and malformed IDs are rejected, an unregistered ID is only looked up once
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
+
+        self.assertFalse(is_known_device("507f1f77bcf86cd799439011"))
+        self.assertFalse(is_known_device("507f1f77bcf86cd799439011"))
+        self.assertFalse(is_known_device("not-an-id"))
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_called_once()
+
+    def test_is_known_device_miss_expires(self):
+        # Test that an unregistered ID is looked up again once its miss expired
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
+        with patch('src.service.device_meta_service.DEVICE_MISS_TTL', 0):
+            self.assertFalse(is_known_device("507f1f77bcf86cd799439011"))
+
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {"_id": ObjectId("507f1f77bcf86cd799439011")}
+        self.assertTrue(is_known_device("507f1f77bcf86cd799439011"))
+
+    def test_is_known_device_registered_after_miss(self):
+        # Test that registering a device replaces its cached miss
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
+        self.assertFalse(is_known_device("507f1f77bcf86cd799439011"))
+
+        register_device(json.dumps({"device_id": "507f1f77bcf86cd799439011"}))
+
+        self.assertTrue(is_known_device("507f1f77bcf86cd799439011"))
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_called_once()
+
+    def test_dispatch_message(self):
+        # Test that messages of registered devices are routed by topic
+        device_cache.set("507f1f77bcf86cd799439011", {"id": "507f1f77bcf86cd799439011", "name": "Garden"})
+        handler = MagicMock()
+
+        with patch.dict('src.service.mqtt_service.DEVICE_TOPIC_HANDLERS', {'predict': handler}):
+            dispatch_message("507f1f77bcf86cd799439011/predict", "{}")
+
+        handler.assert_called_once_with("{}", "507f1f77bcf86cd799439011/predict")
+
+    def test_dispatch_message_unknown_device(self):
+        # Test that messages of unregistered devices are discarded
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
+        handler = MagicMock()
+
+        with patch.dict('src.service.mqtt_service.DEVICE_TOPIC_HANDLERS', {'predict': handler}):
+            dispatch_message("507f1f77bcf86cd799439011/predict", "{}")
+            dispatch_message("507f1f77bcf86cd799439011/unknown", "{}")
+
+        handler.assert_not_called()
+
+    def test_dispatch_message_lookup_error(self):
+        # Test that a failed device lookup discards the message instead of raising into the MQTT client
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.side_effect = ConnectionError("unreachable")
+        handler = MagicMock()
+
+        with patch.dict('src.service.mqtt_service.DEVICE_TOPIC_HANDLERS', {'predict': handler}):
+            dispatch_message("507f1f77bcf86cd799439011/predict", "{}")
+
+        handler.assert_not_called()
+        self.assertIsNone(device_cache.get("507f1f77bcf86cd799439011"))
+
     def test_register_controller_success(self):
         # Test successful registration of a controller
         payload = json.dumps({"device_id": "507f1f77bcf86cd799439011"})
         self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
         register_device(payload)
 
-        # Assert MongoDB insert was called
+        # Assert MongoDB insert was called, without subscribing per device
         self.mongo_db_mock[DEVICE_COLLECTION].insert_one.assert_called_once()
+        self.mqtt_mock.subscribe.assert_not_called()
+        self.assertEqual(device_cache.get("507f1f77bcf86cd799439011"),
+                         {"id": "507f1f77bcf86cd799439011", "name": "507f1f77bcf86cd799439011"})
 
     def test_register_controller_invalid_payload(self):
         # Test handling of invalid payload
@@ -68,61 +190,95 @@ class TestMqtt(unittest.TestCase):
         self.mqtt_mock.subscribe.assert_not_called()
 
     def test_predict(self):
-        # Test prediction of water usage
+        # Test that a prediction request is queued with its features
         payload = json.dumps({
             "sensor_data": {
                 "temperature": 10,
-                "humidity": 10,
-                "moisture": 10
+                "humidity": 20,
+                "moisture": 30
             },
             "timestamp": "2023-10-01T00:00:00Z"
         })
-        self.redis_mock.get.return_value = json.dumps([{"socket_id": "12345"}])
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {
-            "_id": ObjectId("507f1f77bcf86cd799439011"),
-            "record": [
-                {"temperature": 10, "humidity": 10, "moisture": 10}
-            ],
-        }
 
         predict(payload, "507f1f77bcf86cd799439011/predict")
 
-        # Assert MQTT publish was called
-        self.mqtt_mock.publish.assert_called_once_with(
+        self.batcher_mock.put.assert_called_once_with(("507f1f77bcf86cd799439011", (30, 10, 20)))
+        self.mqtt_mock.publish.assert_not_called()
+
+    def test_predict_invalid_sensor_data(self):
+        payload = json.dumps({"sensor_data": {"temperature": "hot", "humidity": 20, "moisture": 30}})
+
+        predict(payload, "507f1f77bcf86cd799439011/predict")
+
+        self.batcher_mock.put.assert_not_called()
+
+    def test_predict_batch(self):
+        # Test that one model call serves every queued device
+        self.predict_water_mock.return_value = [1, 0]
+
+        predict_batch([
+            ("507f1f77bcf86cd799439011", (30, 10, 20)),
+            ("507f1f77bcf86cd79943901a", (60, 15, 40)),
+        ])
+
+        self.predict_water_mock.assert_called_once()
+        features = self.predict_water_mock.call_args[0][0]
+        self.assertEqual(features.shape, (2, 3))
+        self.assertEqual(list(features.iloc[1]), [60, 15, 40])
+        self.mqtt_mock.publish.assert_any_call(
             "507f1f77bcf86cd799439011/prediction",
             json.dumps({"prediction": 1})
         )
+        self.mqtt_mock.publish.assert_any_call(
+            "507f1f77bcf86cd79943901a/prediction",
+            json.dumps({"prediction": 0})
+        )
 
     def test_record_sensor_data_success(self):
-        # Test successful recording of sensor data
+        # Test that valid sensor data is queued for ingestion
         payload = json.dumps({"sensor_data": {"temperature": 10, "humidity": 10, "moisture": 10},
                               "timestamp": "2023-10-01 00:00:00"
                               })
         topic = "507f1f77bcf86cd799439011/record/sensor_data"
 
-        device_id = extract_device_id(topic)
+        record_sensor_data(payload, topic)
 
-        # Mock MongoDB find and update
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {
-            "_id": ObjectId("507f1f77bcf86cd799439011"),
-            "record": [],
-        }
-        self.redis_mock.exists.return_value = True
-        self.redis_mock.get.return_value = json.dumps("12345")
+        self.ingest_mock.put.assert_called_once_with(("507f1f77bcf86cd799439011", json.loads(payload)))
+        # Nothing is written on the MQTT thread
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+        self.append_mock.assert_not_called()
 
-        record_sensor_data(payload, topic)
+    def test_flush_sensor_records(self):
+        # Test that a batch is persisted with one bulk write and forwarded to the users
+        json_data = {"sensor_data": {"temperature": 10, "humidity": 10, "moisture": 10},
+                     "timestamp": "2023-10-01 00:00:00"}
+        device_id = "507f1f77bcf86cd799439011"
+        self.append_mock.side_effect = lambda batch: batch
 
-        # Assert MongoDB update was called
-        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_called_once()
-        # Assert Redis and Socket.IO interactions
-        self.socketio_mock.emit.assert_called_with(
-            f"{device_id}/record",
-            {
-                "sensor_data": {"temperature": 10, "humidity": 10, "moisture": 10},
-                "timestamp": "2023-10-01 00:00:00",
-            },
-            room='"12345"'
-        )
+        flush_sensor_records([(device_id, json_data), (device_id, json_data)])
+
+        # Assert the records were appended to the device buckets, without reading or rewriting the device
+        self.append_mock.assert_called_once_with([(device_id, json_data), (device_id, json_data)])
+        # Assert the rollups are updated from the same batch
+        self.rollup_mock.assert_called_once_with([(device_id, json_data), (device_id, json_data)])
+        self.mongo_db_mock[DEVICE_COLLECTION].find.assert_not_called()
+        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_not_called()
+        # Assert each record is emitted once to the device room, without Redis lookups
+        self.socketio_mock.emit.assert_called_with(f"{device_id}/record", json_data, to=f"device:{device_id}")
+        self.assertEqual(self.socketio_mock.emit.call_count, 2)
+        self.redis_mock.assert_not_called()
+
+    def test_flush_sensor_records_skipped(self):
+        # Test that records the bucket write skipped are neither rolled up nor forwarded
+        valid = {"sensor_data": {"moisture": 10}, "timestamp": "2023-10-01 00:00:00"}
+        invalid = {"sensor_data": {"moisture": 10}, "timestamp": "yesterday"}
+        device_id = "507f1f77bcf86cd799439011"
+        self.append_mock.return_value = [(device_id, valid)]
+
+        flush_sensor_records([(device_id, invalid), (device_id, valid)])
+
+        self.rollup_mock.assert_called_once_with([(device_id, valid)])
+        self.socketio_mock.emit.assert_called_once_with(f"{device_id}/record", valid, to=f"device:{device_id}")
 
     def test_record_sensor_data_invalid_payload(self):
         # Test handling of invalid sensor data payload
@@ -131,8 +287,8 @@ class TestMqtt(unittest.TestCase):
 
         record_sensor_data(payload, topic)
 
-        # Assert no MongoDB or Redis calls were made
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+        # Assert nothing was queued and no Redis calls were made
+        self.ingest_mock.put.assert_not_called()
         self.redis_mock.exists.assert_not_called()
 
     def test_record_water_used_success(self):
@@ -140,16 +296,18 @@ class TestMqtt(unittest.TestCase):
         payload = json.dumps({"water_used": 100, "date": "2023-10-01T00:00:00Z"})
         topic = "507f1f77bcf86cd799439011/record/water_used"
 
-        # Mock MongoDB find and update
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {
-            "_id": ObjectId("507f1f77bcf86cd799439011"),
-            "water_used_month": [],
-        }
-
         record_water_used(payload, topic)
 
-        # Assert MongoDB update was called
-        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_called_once()
+        # Assert the counters were incremented without reading or rewriting the device
+        self.water_mock.assert_called_once_with("507f1f77bcf86cd799439011", "2023-10-01T00:00:00Z", 100)
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_not_called()
+        self.water_rollup_mock.assert_called_once_with("507f1f77bcf86cd799439011", "2023-10-01T00:00:00Z", 100)
+        self.socketio_mock.emit.assert_called_once_with(
+            "507f1f77bcf86cd799439011/water_usage",
+            json.loads(payload),
+            to="device:507f1f77bcf86cd799439011"
+        )
 
     def test_record_water_used_invalid_payload(self):
         # Test handling of invalid water used payload
@@ -158,5 +316,5 @@ class TestMqtt(unittest.TestCase):
 
         record_water_used(payload, topic)
 
-        # Assert no MongoDB calls were made
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+        # Assert nothing was recorded
+        self.water_mock.assert_not_called()
@@ -0,0 +1,213 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from bson import ObjectId
+
+from src.config.mongo import DEVICE_COLLECTION, SENSOR_COLLECTION
+from src.service.record_service import (
+    bucket_day,
+    month_bounds,
+    append_sensor_records,
+    count_sensor_records,
+    find_sensor_records,
+    iter_sensor_positions,
+    migrate_legacy_records,
+    parse_cursor,
+    format_cursor,
+)
+
+
+class TestRecordService(unittest.TestCase):
+    def setUp(self):
+        # Mock MongoDB
+        self.mongo_db_mock = {
+            DEVICE_COLLECTION: MagicMock(),
+            SENSOR_COLLECTION: MagicMock()
+        }
+        self.mongo_patcher = patch('src.service.record_service.mongo_db', self.mongo_db_mock)
+        self.mongo_patcher.start()
+
+    def tearDown(self):
+        # Stop all patches
+        self.mongo_patcher.stop()
+
+    def test_bucket_day(self):
+        # Both the device format and ISO timestamps map to the same bucket
+        self.assertEqual(bucket_day("2025/05/05 05:17:35"), "2025/05/05")
+        self.assertEqual(bucket_day("2025-05-05T05:17:35Z"), "2025/05/05")
+
+    def test_month_bounds(self):
+        self.assertEqual(month_bounds(2025, 5), ("2025/05/01 00:00:00", "2025/06/01 00:00:00"))
+        self.assertEqual(month_bounds(2024, 12), ("2024/12/01 00:00:00", "2025/01/01 00:00:00"))
+
+    def test_append_sensor_records(self):
+        # Test that records are pushed with one upsert per daily bucket and invalid records are skipped
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            {'sensor_data': {'moisture': 30}, 'timestamp': '2025/05/05 05:17:35'},
+            {'sensor_data': {'moisture': 31}, 'timestamp': '2025-05-05T06:17:35Z'},
+            {'sensor_data': {'moisture': 32}, 'timestamp': '2025/05/06 00:00:00'},
+        ]
+        invalid = [
+            {'sensor_data': {'moisture': 1}, 'timestamp': 'yesterday'},
+            {'sensor_data': {'moisture': 1}},
+            {'sensor_data': 'moisture', 'timestamp': '2025/05/05 05:17:35'},
+            {'sensor_data': {'$inc': 1}, 'timestamp': '2025/05/05 05:17:35'},
+            ['not', 'a', 'record'],
+        ]
+        batch = [(device_id, record) for record in records[:2] + invalid + records[2:]]
+
+        stored = append_sensor_records(batch)
+
+        # Timestamps are stored in the canonical form
+        canonical = [records[0], {**records[1], 'timestamp': '2025/05/05 06:17:35'}, records[2]]
+        self.assertEqual(stored, [(device_id, record) for record in canonical])
+        operations = self.mongo_db_mock[SENSOR_COLLECTION].bulk_write.call_args[0][0]
+        self.assertEqual([operation._filter for operation in operations], [
+            {'device_id': device_id, 'day': '2025/05/05'},
+            {'device_id': device_id, 'day': '2025/05/06'},
+        ])
+        self.assertEqual(operations[0]._doc, {
+            '$push': {'records': {'$each': canonical[:2]}},
+            '$inc': {'count': 2},
+            '$min': {'first': '2025/05/05 05:17:35'},
+            '$max': {'last': '2025/05/05 06:17:35'},
+        })
+        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_not_called()
+
+    def test_append_sensor_records_unpadded(self):
+        # Test that unpadded and fractional timestamps are stored padded, in the bucket of their day
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            {'sensor_data': {'moisture': 30}, 'timestamp': '2024/1/2 3:4:5'},
+            {'sensor_data': {'moisture': 31}, 'timestamp': '2024-01-02T03:04:06.250Z'},
+        ]
+
+        stored = append_sensor_records([(device_id, record) for record in records])
+
+        self.assertEqual([record['timestamp'] for _, record in stored], ['2024/01/02 03:04:05', '2024/01/02 03:04:06'])
+        self.assertEqual(records[0]['timestamp'], '2024/1/2 3:4:5')
+        operations = self.mongo_db_mock[SENSOR_COLLECTION].bulk_write.call_args[0][0]
+        self.assertEqual([operation._filter for operation in operations],
+                         [{'device_id': device_id, 'day': '2024/01/02'}])
+        self.assertEqual(operations[0]._doc['$min'], {'first': '2024/01/02 03:04:05'})
+
+    def test_append_sensor_records_all_invalid(self):
+        # Test that nothing is written when no record can be stored
+        self.assertEqual(append_sensor_records([("681785b2abcafa0ae18c75f9", {'timestamp': 'yesterday'})]), [])
+        self.mongo_db_mock[SENSOR_COLLECTION].bulk_write.assert_not_called()
+
+    def test_migrate_legacy_records(self):
+        # Test that valid records are copied into buckets and invalid ones are kept on the device
+        device_id = ObjectId("681785b2abcafa0ae18c75f9")
+        valid = {'sensor_data': {'moisture': 30}, 'timestamp': '2025/05/05 05:17:35'}
+        invalid = {'sensor_data': {'moisture': 31}, 'timestamp': 'yesterday'}
+        self.mongo_db_mock[DEVICE_COLLECTION].find.return_value = [{'_id': device_id, 'record': [valid, invalid]}]
+
+        migrate_legacy_records()
+
+        operations = self.mongo_db_mock[SENSOR_COLLECTION].bulk_write.call_args[0][0]
+        self.assertEqual(operations[0]._doc['$push'], {'records': {'$each': [valid]}})
+        self.assertEqual(self.mongo_db_mock[DEVICE_COLLECTION].update_one.call_args_list[0][0],
+                         ({'_id': device_id}, {'$set': {'legacy_migration': 'copying'}}))
+        self.assertEqual(self.mongo_db_mock[DEVICE_COLLECTION].update_one.call_args_list[1][0], (
+            {'_id': device_id},
+            {'$unset': {'record': '', 'legacy_migration': ''},
+             '$push': {'legacy_invalid_records': {'$each': [invalid]}}},
+        ))
+
+    def test_migrate_legacy_records_resumed(self):
+        # Test that a run resuming an interrupted copy skips the records already in the buckets, one to one
+        device_id = ObjectId("681785b2abcafa0ae18c75f9")
+        first = {'sensor_data': {'moisture': 30}, 'timestamp': '2025/05/05 05:17:35'}
+        second = {'sensor_data': {'moisture': 31}, 'timestamp': '2025/05/06 05:17:35'}
+        self.mongo_db_mock[DEVICE_COLLECTION].find.return_value = [
+            {'_id': device_id, 'record': [first, first, second], 'legacy_migration': 'copying'}]
+        self.mongo_db_mock[SENSOR_COLLECTION].find.return_value = [
+            {'day': '2025/05/05', 'records': [{'timestamp': '2025/05/05 05:17:35', 'sensor_data': {'moisture': 30}}]}]
+
+        migrate_legacy_records()
+
+        query = self.mongo_db_mock[SENSOR_COLLECTION].find.call_args[0][0]
+        self.assertEqual(query, {'device_id': str(device_id), 'day': {'$in': ['2025/05/05', '2025/05/06']}})
+        operations = self.mongo_db_mock[SENSOR_COLLECTION].bulk_write.call_args[0][0]
+        self.assertEqual([operation._doc['$push'] for operation in operations],
+                         [{'records': {'$each': [first]}}, {'records': {'$each': [second]}}])
+        self.mongo_db_mock[DEVICE_COLLECTION].update_one.assert_called_once_with(
+            {'_id': device_id}, {'$unset': {'record': '', 'legacy_migration': ''}})
+
+    def test_find_sensor_records_range(self):
+        # Test that records of the boundary buckets are filtered by timestamp
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            {'sensor_data': {'temperature': 20}, 'timestamp': '2025/04/30 23:59:59'},
+            {'sensor_data': {'temperature': 21}, 'timestamp': '2025/05/01 00:00:00'},
+            {'sensor_data': {'temperature': 22}, 'timestamp': '2025/05/31 23:59:59'},
+            {'sensor_data': {'temperature': 23}, 'timestamp': '2025/06/01 00:00:00'},
+        ]
+        buckets = [
+            {'first': r['timestamp'], 'last': r['timestamp'], 'records': [r]} for r in records
+        ]
+        self.mongo_db_mock[SENSOR_COLLECTION].find.return_value.sort.return_value = buckets
+
+        result = find_sensor_records(device_id, *month_bounds(2025, 5))
+
+        self.assertEqual(result, records[1:3])
+        query = self.mongo_db_mock[SENSOR_COLLECTION].find.call_args[0][0]
+        self.assertEqual(query, {
+            'device_id': device_id,
+            'day': {'$gte': '2025/05/01', '$lte': '2025/06/01'},
+        })
+
+    def test_iter_sensor_positions_after(self):
+        # Test that iteration resumes right after a position, records sharing its timestamp included
+        device_id = "681785b2abcafa0ae18c75f9"
+        buckets = [
+            {'day': '2025/05/05', 'first': '2025/05/05 05:17:01', 'last': '2025/05/05 05:17:02',
+             'records': [{'timestamp': '2025/05/05 05:17:01'}, {'timestamp': '2025/05/05 05:17:02'},
+                         {'timestamp': '2025/05/05 05:17:02'}]},
+            {'day': '2025/05/06', 'first': '2025/05/06 00:00:00', 'last': '2025/05/06 00:00:00',
+             'records': [{'timestamp': '2025/05/06 00:00:00'}]},
+        ]
+        self.mongo_db_mock[SENSOR_COLLECTION].find.return_value.sort.return_value = buckets
+
+        result = list(iter_sensor_positions(device_id, '2025/05/01', None, parse_cursor('2025/05/05:1')))
+
+        self.assertEqual(result, [
+            ('2025/05/05', 2, {'timestamp': '2025/05/05 05:17:02'}),
+            ('2025/05/06', 0, {'timestamp': '2025/05/06 00:00:00'}),
+        ])
+        query = self.mongo_db_mock[SENSOR_COLLECTION].find.call_args[0][0]
+        self.assertEqual(query, {'device_id': device_id, 'day': {'$gte': '2025/05/05'}})
+
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor(format_cursor('2025/05/05', 17)), ('2025/05/05', 17))
+        self.assertIsNone(parse_cursor('2025/05/05 05:17:01'))
+        self.assertIsNone(parse_cursor('2025/05/05:-1'))
+        self.assertIsNone(parse_cursor('garbage'))
+
+    def test_count_sensor_records(self):
+        # Test that the count is summed from the bucket counters
+        self.mongo_db_mock[SENSOR_COLLECTION].aggregate.return_value = iter([{'_id': None, 'total': 42}])
+        self.assertEqual(count_sensor_records("681785b2abcafa0ae18c75f9"), 42)
+
+        self.mongo_db_mock[SENSOR_COLLECTION].aggregate.return_value = iter([])
+        self.assertEqual(count_sensor_records("681785b2abcafa0ae18c75f9"), 0)
+
+    def test_count_sensor_records_range(self):
+        # Test that only the buckets at the edges of the range are read
+        device_id = "681785b2abcafa0ae18c75f9"
+        self.mongo_db_mock[SENSOR_COLLECTION].find.return_value = [
+            {'_id': 1, 'count': 3, 'first': '2025/05/01 10:00:00', 'last': '2025/05/01 14:00:00'},
+            {'_id': 2, 'count': 5, 'first': '2025/05/02 00:00:00', 'last': '2025/05/02 23:00:00'},
+            {'_id': 3, 'count': 2, 'first': '2025/05/03 01:00:00', 'last': '2025/05/03 09:00:00'},
+        ]
+        self.mongo_db_mock[SENSOR_COLLECTION].find_one.side_effect = lambda query, projection: {
+            1: {'records': [{'timestamp': '2025/05/01 10:00:00'}, {'timestamp': '2025/05/01 12:00:00'},
+                            {'timestamp': '2025/05/01 14:00:00'}]},
+            3: {'records': [{'timestamp': '2025/05/03 01:00:00'}, {'timestamp': '2025/05/03 09:00:00'}]},
+        }[query['_id']]
+
+        self.assertEqual(count_sensor_records(device_id, '2025-05-01T12:00:00Z', '2025/05/03 09:00:00'), 8)
+        self.assertEqual(self.mongo_db_mock[SENSOR_COLLECTION].find_one.call_count, 2)
+        self.mongo_db_mock[SENSOR_COLLECTION].aggregate.assert_not_called()
@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.config.mongo import ROLLUP_COLLECTION
+from src.service.rollup_service import rollup_updates, record_water_rollup, get_rollups
+from src.utils.excel_manager import water_totals_by_month
+
+
+class TestRollupService(unittest.TestCase):
+    def setUp(self):
+        # Mock MongoDB
+        self.mongo_db_mock = {
+            ROLLUP_COLLECTION: MagicMock()
+        }
+        self.mongo_patcher = patch('src.service.rollup_service.mongo_db', self.mongo_db_mock)
+        self.mongo_patcher.start()
+
+    def tearDown(self):
+        # Stop all patches
+        self.mongo_patcher.stop()
+
+    def test_rollup_updates(self):
+        # Test that a batch is folded into one upsert per device and period
+        device_id = "681785b2abcafa0ae18c75f9"
+        records = [
+            (device_id, {'sensor_data': {'temperature': 20, 'humidity': 50, 'moisture': 30},
+                         'timestamp': '2025/05/05 05:00:00'}),
+            (device_id, {'sensor_data': {'temperature': 24, 'humidity': 40, 'moisture': 'n/a'},
+                         'timestamp': '2025-05-05T06:00:00Z'}),
+            (device_id, {'sensor_data': {'temperature': 18, 'humidity': 45, 'moisture': 34},
+                         'timestamp': '2025/05/06 05:00:00'}),
+        ]
+
+        operations = {(op._filter['period'], op._filter['key']): op._doc for op in rollup_updates(records)}
+
+        self.assertEqual(set(operations), {('day', '2025/05/05'), ('day', '2025/05/06'), ('month', '2025/05')})
+        day = operations[('day', '2025/05/05')]
+        self.assertEqual(day['$inc']['count'], 2)
+        self.assertEqual(day['$inc']['stats.temperature.sum'], 44)
+        self.assertEqual(day['$min']['stats.temperature.min'], 20)
+        self.assertEqual(day['$max']['stats.temperature.max'], 24)
+        # Non numeric readings are left out of the aggregates
+        self.assertEqual(day['$inc']['stats.moisture.count'], 1)
+        month = operations[('month', '2025/05')]
+        self.assertEqual(month['$inc']['count'], 3)
+        self.assertEqual(month['$min']['stats.temperature.min'], 18)
+
+    def test_record_water_rollup_month(self):
+        # Test that a monthly water usage only touches the monthly rollup
+        record_water_rollup("681785b2abcafa0ae18c75f9", "2025/05", 2.5)
+
+        operations = self.mongo_db_mock[ROLLUP_COLLECTION].bulk_write.call_args[0][0]
+        self.assertEqual([op._filter['period'] for op in operations], ['month'])
+        self.assertEqual(operations[0]._doc, {'$inc': {'water_used': 2.5}})
+
+    def test_get_rollups(self):
+        # Test that the stored sums are returned as means
+        self.mongo_db_mock[ROLLUP_COLLECTION].find.return_value.sort.return_value = [
+            {'key': '2025/05', 'count': 2, 'water_used': 3.0,
+             'stats': {'temperature': {'min': 20, 'max': 24, 'sum': 44, 'count': 2}}},
+        ]
+
+        result = get_rollups("681785b2abcafa0ae18c75f9", 'month', '2025/01/01 00:00:00', '2025/06/01 00:00:00')
+
+        self.assertEqual(result[0]['temperature'], {'min': 20, 'max': 24, 'mean': 22, 'count': 2})
+        self.assertIsNone(result[0]['moisture'])
+        self.assertEqual(result[0]['water_used'], 3.0)
+        query = self.mongo_db_mock[ROLLUP_COLLECTION].find.call_args[0][0]
+        self.assertEqual(query['key'], {'$gte': '2025/01', '$lte': '2025/06'})
+
+    def test_water_totals_by_month(self):
+        # Test that water usage entries are summed per month
+        water_usage = [
+            {'date': '2025/05', 'water_used': 1.5},
+            {'date': '2025/05', 'water_used': 2},
+            {'date': '2025-06-01T00:00:00Z', 'water_used': 4},
+        ]
+
+        self.assertEqual(water_totals_by_month(water_usage), {'2025/05': 3.5, '2025/06': 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.config.scheduler import run_monthly_report
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        # Mock Redis and the report job
+        self.redis_mock = MagicMock()
+        self.redis_patcher = patch('src.config.scheduler.r', self.redis_mock)
+        self.report_patcher = patch('src.config.scheduler.send_monthly_report')
+
+        self.redis_patcher.start()
+        self.report_mock = self.report_patcher.start()
+
+    def tearDown(self):
+        # Stop all patches
+        self.redis_patcher.stop()
+        self.report_patcher.stop()
+
+    def test_run_monthly_report_claims_lock(self):
+        # Test that the instance claiming the month sends the reports
+        self.redis_mock.set.return_value = True
+
+        run_monthly_report()
+
+        key = self.redis_mock.set.call_args[0][0]
+        self.assertTrue(key.startswith("scheduler:lock:monthly_report:"))
+        self.assertTrue(self.redis_mock.set.call_args[1]['nx'])
+        self.report_mock.assert_called_once()
+
+    def test_run_monthly_report_already_claimed(self):
+        # Test that the other instances skip the run
+        self.redis_mock.set.return_value = None
+
+        run_monthly_report()
+
+        self.report_mock.assert_not_called()
@@ -2,21 +2,46 @@ import json
 import unittest
 from unittest.mock import patch, MagicMock
 
+import socketio
 from bson.objectid import ObjectId
 
-from src.config.mongo import USER_COLLECTION, DEVICE_COLLECTION
+from src.config.mongo import DEVICE_COLLECTION
+from src.service.device_meta_service import device_cache
+from src.utils.logger import SampleFilter
+
+from src.api.socket_api import init_event
 from src.service.socket_service import (
     remap_redis,
+    leave_device_rooms,
+    handle_disconnect,
     handle_irrigate,
 )
 
 
+class QueueManager(socketio.PubSubManager):
+    """
+    Client manager of one backend process, publishing to the managers of the other processes in memory
+    instead of through Redis.
+    """
+
+    def __init__(self, processes: list):
+        super().__init__(channel='test')
+        self.processes = processes
+
+    def initialize(self):
+        pass
+
+    def _publish(self, data):
+        for manager in self.processes:
+            if manager is not self:
+                getattr(manager, f"_handle_{data['method']}")(data)
+
+
 class TestDeviceManagement(unittest.TestCase):
 
     def setUp(self):
         # Mock MongoDB and Redis
         self.mongo_db_mock = {
-            USER_COLLECTION: MagicMock(),
             DEVICE_COLLECTION: MagicMock()
         }
         self.redis_mock = MagicMock()
@@ -24,15 +49,18 @@ class TestDeviceManagement(unittest.TestCase):
         self.mqtt_mock = MagicMock()
 
         # Patch the dependencies
-        self.mongo_patcher = patch('src.service.socket_service.mongo_db', self.mongo_db_mock)
-        self.redis_patcher = patch('src.service.socket_service.r', self.redis_mock)
+        self.mongo_patcher = patch('src.service.device_meta_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.subscription_service.r', self.redis_mock)
         self.socketio_patcher = patch('src.service.socket_service.socketio', self.socketio_mock)
         self.mqtt_patcher = patch('src.service.socket_service.mqtt', self.mqtt_mock)
+        self.join_room_patcher = patch('src.service.socket_service.join_room')
 
         self.mongo_patcher.start()
+        device_cache.clear()
         self.redis_patcher.start()
         self.socketio_patcher.start()
         self.mqtt_patcher.start()
+        self.join_room_mock = self.join_room_patcher.start()
 
     def tearDown(self):
         # Stop all patches
@@ -40,6 +68,7 @@ class TestDeviceManagement(unittest.TestCase):
         self.redis_patcher.stop()
         self.socketio_patcher.stop()
         self.mqtt_patcher.stop()
+        self.join_room_patcher.stop()
 
     def test_handle_irrigate(self):
         # Test the handle_irrigate function
@@ -54,36 +83,96 @@ class TestDeviceManagement(unittest.TestCase):
         self.mqtt_mock.publish.assert_called_once_with(expected_topic, json.dumps(expected_payload))
 
     def test_remap_redis(self):
-        # Test remapping the Redis cache
+        # Test joining the connection to the device and user rooms
         device_id = "681785b2abcafa0ae18c75f9"
         user_id = "d372fd8aa13bc0dc8e891b20"
         socket_id = "d372fd8aa13bc0dc8e891b20"
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {'_id': ObjectId(device_id), 'name': 'Device'}
 
-        # Mock the MongoDB find_one method
-        self.mongo_db_mock[USER_COLLECTION].find_one.return_value = {
-            '_id': ObjectId(user_id),
-            'devices': [ObjectId(device_id)]
-        }
-
-        # Mock the Redis set method
-        self.redis_mock.get.return_value = json.dumps([user_id])
-        # Call the function
         remap_redis(device_id, user_id, socket_id)
-        # Assert that the Redis set method was called with the correct parameters
-        # self.redis_mock.set.assert_called_with(f'device:{device_id}', json.dumps([user_id]))
-        self.redis_mock.set.assert_called_with(f'user:{user_id}', socket_id)
+        remap_redis(device_id, user_id, socket_id)
+
+        # The connection joined the rooms and was recorded for the user, the device was read once
+        self.join_room_mock.assert_any_call(f'device:{device_id}', sid=socket_id, namespace='/')
+        self.join_room_mock.assert_any_call(f'user:{user_id}', sid=socket_id, namespace='/')
+        self.redis_mock.pipeline.return_value.sadd.assert_called_with(f'user:{user_id}:sockets', socket_id)
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_called_once()
 
     def test_remap_redis_no_device(self):
         # Test remapping Redis when the device does not exist
-        device_id = "non_existent_device"
+        device_id = "681785b2abcafa0ae18c75f9"
         user_id = "d372fd8aa13bc0dc8e891b20"
         socket_id = "d372fd8aa13bc0dc8e891b20"
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = None
 
-        # Mock the Redis get method to return None
-        self.redis_mock.get.return_value = None
-
-        # Call the function
         remap_redis(device_id, user_id, socket_id)
 
-        # Assert that the Redis set method was not called
-        self.redis_mock.set.assert_not_called()
+        # Assert that nothing was written to Redis and no room was joined
+        self.redis_mock.pipeline.assert_not_called()
+        self.join_room_mock.assert_not_called()
+
+    def test_leave_device_rooms(self):
+        # Test that every connection of the user leaves the device room
+        device_id = "681785b2abcafa0ae18c75f9"
+        user_id = "d372fd8aa13bc0dc8e891b20"
+        server = self.socketio_mock.server
+        self.redis_mock.smembers.return_value = {"sid1", "sid2"}
+
+        leave_device_rooms(user_id, [device_id])
+
+        self.redis_mock.smembers.assert_called_once_with(f'user:{user_id}:sockets')
+        server.leave_room.assert_any_call("sid1", f'device:{device_id}', namespace='/')
+        server.leave_room.assert_any_call("sid2", f'device:{device_id}', namespace='/')
+
+    def test_leave_device_rooms_other_process(self):
+        # A connection handled by another process leaves the room through the message queue
+        device_id = "681785b2abcafa0ae18c75f9"
+        user_id = "d372fd8aa13bc0dc8e891b20"
+        processes = []
+        local, remote = QueueManager(processes), QueueManager(processes)
+        processes.extend([local, remote])
+        local_server = socketio.Server(client_manager=local)
+        remote_server = socketio.Server(client_manager=remote)
+        local_sid = local.connect('eio1', '/')
+        remote_sid = remote.connect('eio2', '/')
+        local_server.enter_room(local_sid, f'device:{device_id}')
+        remote_server.enter_room(remote_sid, f'device:{device_id}')
+        self.socketio_mock.server = local_server
+        self.redis_mock.smembers.return_value = {local_sid, remote_sid}
+
+        leave_device_rooms(user_id, [device_id])
+
+        self.assertEqual(list(local.get_participants('/', f'device:{device_id}')), [])
+        self.assertEqual(list(remote.get_participants('/', f'device:{device_id}')), [])
+
+    def test_handle_disconnect(self):
+        # The closed connection is removed from the connections of its user
+        user_id = "d372fd8aa13bc0dc8e891b20"
+        self.socketio_mock.server.manager.get_rooms.return_value = ['sid1', f'user:{user_id}', 'device:1']
+
+        handle_disconnect('sid1')
+
+        self.socketio_mock.server.manager.get_rooms.assert_called_once_with('sid1', '/')
+        self.redis_mock.srem.assert_called_once_with(f'user:{user_id}:sockets', 'sid1')
+
+
+class TestSocketEvents(unittest.TestCase):
+
+    @patch.object(SampleFilter, 'filter', return_value=True)
+    @patch('src.api.socket_api.remap_redis')
+    @patch('src.api.socket_api.decode_token')
+    @patch('src.api.socket_api.request', MagicMock(sid='sid'))
+    def test_init_event_does_not_log_token(self, decode_mock, remap_mock, filter_mock):
+        # The events are logged at debug level, without the token of the init payload
+        token = 'header.payload.signature'
+
+        with self.assertLogs('terraflow.socket', level='DEBUG') as logs:
+            decode_mock.return_value = {'error': 'Token expired'}
+            init_event({'token': token, 'devices': ['681785b2abcafa0ae18c75f9']})
+            decode_mock.return_value = {'user_id': 'user'}
+            init_event({'token': token, 'devices': ['681785b2abcafa0ae18c75f9']})
+            init_event({'token': token})
+
+        self.assertEqual(len(logs.output), 3)
+        self.assertFalse(any(token in line for line in logs.output))
+        remap_mock.assert_called_once_with('681785b2abcafa0ae18c75f9', 'user', 'sid')
@@ -0,0 +1,30 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.service.subscription_service import (
+    add_user_socket,
+    remove_user_socket,
+    USER_SOCKETS_TTL,
+)
+
+
+class TestSubscriptionService(unittest.TestCase):
+    def setUp(self):
+        # Mock Redis
+        self.redis_mock = MagicMock()
+        self.redis_patcher = patch('src.service.subscription_service.r', self.redis_mock)
+        self.redis_patcher.start()
+
+    def tearDown(self):
+        # Stop all patches
+        self.redis_patcher.stop()
+
+    def test_user_sockets(self):
+        # The connections of a user are kept in a set that expires when the user stops connecting
+        add_user_socket("d372fd8aa13bc0dc8e891b20", "sid1")
+        remove_user_socket("d372fd8aa13bc0dc8e891b20", "sid1")
+
+        pipe = self.redis_mock.pipeline.return_value
+        pipe.sadd.assert_called_once_with("user:d372fd8aa13bc0dc8e891b20:sockets", "sid1")
+        pipe.expire.assert_called_once_with("user:d372fd8aa13bc0dc8e891b20:sockets", USER_SOCKETS_TTL)
+        self.redis_mock.srem.assert_called_once_with("user:d372fd8aa13bc0dc8e891b20:sockets", "sid1")
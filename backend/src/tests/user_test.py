@@ -9,6 +9,7 @@ from src.service.user_service import (
     handle_predict_disease
 )
 from src.config.mongo import USER_COLLECTION, DEVICE_COLLECTION
+from src.service.device_meta_service import device_cache
 
 
 class TestUserManagement(unittest.TestCase):
@@ -22,14 +23,18 @@ class TestUserManagement(unittest.TestCase):
 
         # Patch the dependencies
         self.mongo_patcher = patch('src.service.user_service.mongo_db', self.mongo_db_mock)
-        self.redis_patcher = patch('src.service.user_service.r', self.redis_mock)
+        self.meta_mongo_patcher = patch('src.service.device_meta_service.mongo_db', self.mongo_db_mock)
+        self.redis_patcher = patch('src.service.subscription_service.r', self.redis_mock)
 
         self.mongo_patcher.start()
+        self.meta_mongo_patcher.start()
+        device_cache.clear()
         self.redis_patcher.start()
 
     def tearDown(self):
         # Stop all patches
         self.mongo_patcher.stop()
+        self.meta_mongo_patcher.stop()
         self.redis_patcher.stop()
 
     def test_handle_get_user_devices(self):
@@ -46,10 +51,10 @@ class TestUserManagement(unittest.TestCase):
 
         self.mongo_db_mock[USER_COLLECTION].find_one.return_value = user_data
 
-        self.mongo_db_mock[DEVICE_COLLECTION].find_one.return_value = {
+        self.mongo_db_mock[DEVICE_COLLECTION].find.return_value = [{
             '_id': ObjectId(expected_devices[0]),
             'name': f'Device {expected_devices[0]}'
-        }
+        }]
 
         expected_device_data = [
             {'id': '681785b2abcafa0ae18c75f1', 'name': 'Device 681785b2abcafa0ae18c75f1'}
@@ -58,6 +63,13 @@ class TestUserManagement(unittest.TestCase):
         devices = handle_get_user_devices(user_id)
 
         self.assertEqual(devices, expected_device_data)
+        # Assert the devices were fetched with one projected query and are then served from the cache
+        self.mongo_db_mock[DEVICE_COLLECTION].find.assert_called_once_with(
+            {'_id': {'$in': [ObjectId(expected_devices[0])]}}, {'name': 1}
+        )
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+        self.assertEqual(handle_get_user_devices(user_id), expected_device_data)
+        self.mongo_db_mock[DEVICE_COLLECTION].find.assert_called_once()
 
     def test_handle_get_user_devices_user_not_found(self):
         # Test fetching devices for a user that does not exist
@@ -87,8 +99,6 @@ class TestUserManagement(unittest.TestCase):
             '_id': ObjectId(device_id)
         }
 
-        self.redis_mock.exists.return_value = False
-
         result = handle_add_device(device_id, user_id)
 
         # Assert that the device was added to the user's list of devices
@@ -97,11 +107,6 @@ class TestUserManagement(unittest.TestCase):
             {'$set': {'devices': [device_id]}}
         )
 
-        self.redis_mock.set.assert_called_with(
-            f'device:{device_id}',
-            '["681785b2abcafa0ae18c75f9"]'
-        )
-
         # Assert that the function returned True
         self.assertTrue(result)
 
@@ -137,7 +142,8 @@ class TestUserManagement(unittest.TestCase):
         # Assert that the function returned False
         self.assertEqual(result, {'error': 'Device not found'})
 
-    def test_handle_delete_device(self):
+    @patch('src.service.user_service.leave_device_rooms')
+    def test_handle_delete_device(self, leave_mock):
         # Test deleting a device from a user
         user_id = "681785b2abcafa0ae18c75f9"
         device_id = "d372fd8aa13bc0dc8e891b20"
@@ -148,9 +154,6 @@ class TestUserManagement(unittest.TestCase):
             'devices': [device_id]
         }
 
-        self.redis_mock.exists.return_value = True
-        self.redis_mock.get.return_value = '["681785b2abcafa0ae18c75f9"]'
-
         result = handle_delete_device(device_id, user_id)
 
         # Assert that the device was removed from the user's list of devices
@@ -159,11 +162,8 @@ class TestUserManagement(unittest.TestCase):
             {'$set': {'devices': []}}
         )
 
-        # Assert that the device was removed from Redis
-        self.redis_mock.set.assert_called_with(
-            f'device:{device_id}',
-            '[]'
-        )
+        # Assert that the connections of the user left the device room
+        leave_mock.assert_called_once_with(user_id, [device_id])
 
         # Assert that the function returned True
         self.assertTrue(result)
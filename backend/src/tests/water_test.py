@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.config.mongo import DEVICE_COLLECTION, WATER_COLLECTION
+from src.service.water_service import add_water_usage, get_water_usage
+
+
+class TestWaterService(unittest.TestCase):
+    def setUp(self):
+        # Mock MongoDB
+        self.mongo_db_mock = {
+            DEVICE_COLLECTION: MagicMock(),
+            WATER_COLLECTION: MagicMock()
+        }
+        self.mongo_patcher = patch('src.service.water_service.mongo_db', self.mongo_db_mock)
+        self.mongo_patcher.start()
+
+    def tearDown(self):
+        # Stop all patches
+        self.mongo_patcher.stop()
+
+    def test_add_water_usage(self):
+        # Test that usage is added with a single upsert, without reading the device
+        device_id = "681785b2abcafa0ae18c75f9"
+
+        add_water_usage(device_id, "2025-05", 2.5)
+
+        self.mongo_db_mock[WATER_COLLECTION].update_one.assert_called_once_with(
+            {'device_id': device_id, 'date': '2025/05'},
+            {'$inc': {'water_used': 2.5}},
+            upsert=True,
+        )
+        self.mongo_db_mock[WATER_COLLECTION].find_one.assert_not_called()
+        self.mongo_db_mock[DEVICE_COLLECTION].find_one.assert_not_called()
+
+    def test_get_water_usage_range(self):
+        # Test that a month range matches both monthly and daily counters
+        device_id = "681785b2abcafa0ae18c75f9"
+        usage = [{'date': '2025/05', 'water_used': 2.5}]
+        self.mongo_db_mock[WATER_COLLECTION].find.return_value.sort.return_value = iter(usage)
+
+        result = get_water_usage(device_id, '2025/05', '2025/06')
+
+        self.assertEqual(result, usage)
+        query = self.mongo_db_mock[WATER_COLLECTION].find.call_args[0][0]
+        self.assertEqual(query, {'device_id': device_id, 'date': {'$gte': '2025/05', '$lt': '2025/06'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import atexit
+import queue
+import threading
+import time
+import typing
+
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics, SIZE_BUCKETS
+
+_STOP = object()
+
+# Logs written for items, sampled so a full queue does not flood the output
+log = get_logger('batch_queue', sampled=True)
+
+BATCH_SIZE = metrics.histogram('terraflow_batch_size', 'Number of items flushed at once, by queue', ('queue',),
+                               buckets=SIZE_BUCKETS)
+BATCH_FLUSH_SECONDS = metrics.histogram('terraflow_batch_flush_seconds', 'Time spent flushing a batch, by queue',
+                                        ('queue',))
+
+
+class BatchQueue:
+    """
+    Bounded queue drained by a background thread that hands items to a handler in batches.
+    A batch is flushed when it reaches max_batch_size items or when its oldest item waited max_latency seconds.
+    """
+
+    def __init__(self, name: str, handler: typing.Callable[[list], None], max_batch_size: int = 100,
+                 max_latency: float = 0.5, max_queue_size: int = 10000, put_timeout: float = 1.0):
+        """
+        Initializes the queue. The worker thread is started on the first put.
+
+        :param name: str: Name of the queue, used for the worker thread and logs.
+        :param handler: Callable[[list], None]: Function called with each batch of items.
+        :param max_batch_size: int: Maximum number of items handed to the handler at once.
+        :param max_latency: float: Maximum time in seconds an item waits for its batch to fill up.
+        :param max_queue_size: int: Maximum number of pending items, producers block when it is reached.
+        :param put_timeout: float: Maximum time in seconds a producer blocks before the item is dropped.
+        """
+        self.name = name
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self.submitted = 0
+        self.dropped = 0
+        self.batches = 0
+        self.flushed = 0
+        self.failed = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+        self.last_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def put(self, item: typing.Any) -> bool:
+        """
+        Enqueues an item, blocking up to put_timeout seconds while the queue is full.
+
+        :param item: Any: The item to enqueue.
+        :return: bool: True if the item was enqueued, False if it was dropped.
+        """
+        if self._closed:
+            log.warning("[%s] Queue is closed, dropping item.", self.name)
+            self.dropped += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            log.warning("[%s] Queue is full, dropping item.", self.name)
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Stops the worker thread after flushing every pending item.
+
+        :param timeout: float: Maximum time in seconds to wait for the worker to finish.
+        :return: None
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the queue.
+
+        :return: dict: Queue depth, item and batch counters and flush latencies.
+        """
+        return {
+            'queue_depth': self._queue.qsize(),
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'flushed': self.flushed,
+            'failed': self.failed,
+            'last_batch_size': self.last_batch_size,
+            'max_batch_size': self.max_batch_seen,
+            'last_flush_seconds': self.last_flush_seconds,
+            'avg_flush_seconds': self.total_flush_seconds / self.batches if self.batches else 0.0,
+        }
+
+    def _ensure_started(self) -> None:
+        """
+        Starts the worker thread if it is not running yet.
+
+        :return: None
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self) -> None:
+        """
+        Worker loop collecting items into batches and flushing them.
+
+        :return: None
+        """
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+        # Drain whatever is left so shutdown does not lose items
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for i in range(0, len(batch), self.max_batch_size):
+            self._flush(batch[i:i + self.max_batch_size])
+
+    def _flush(self, batch: list) -> None:
+        """
+        Hands a batch to the handler and updates the counters.
+
+        :param batch: list: The items to flush.
+        :return: None
+        """
+        start = time.perf_counter()
+        try:
+            self.handler(batch)
+            self.flushed += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            log.error("[%s] Failed to flush batch of %d items: %s", self.name, len(batch), e)
+        elapsed = time.perf_counter() - start
+
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.last_flush_seconds = elapsed
+        self.total_flush_seconds += elapsed
+        BATCH_SIZE.observe(len(batch), queue=self.name)
+        BATCH_FLUSH_SECONDS.observe(elapsed, queue=self.name)
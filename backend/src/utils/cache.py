@@ -0,0 +1,100 @@
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with least recently used eviction and a time to live per entry.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        """
+        Initializes an empty cache.
+
+        :param max_size: int: Maximum number of entries, the least recently used entry is evicted beyond it.
+        :param ttl: float: Time in seconds an entry stays valid after it was stored.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: typing.Hashable) -> typing.Any:
+        """
+        Returns the value stored for a key.
+
+        :param key: Hashable: The key to look up.
+        :return: Any: The cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: typing.Hashable, value: typing.Any, ttl: float = None) -> None:
+        """
+        Stores a value, replacing the previous one and restarting its time to live.
+
+        :param key: Hashable: The key to store the value under.
+        :param value: Any: The value to store.
+        :param ttl: float: Time in seconds the entry stays valid, the TTL of the cache if None.
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: typing.Hashable) -> None:
+        """
+        Removes a key from the cache.
+
+        :param key: Hashable: The key to remove.
+        :return: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Removes every entry from the cache.
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        :return: dict: Size, hit, miss and eviction counters and the hit ratio.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
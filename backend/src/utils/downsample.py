@@ -0,0 +1,183 @@
+import numbers
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
+AGGREGATIONS = ('avg', 'min', 'max')
+
+
+def record_seconds(record: dict) -> float or None:
+    """
+    Converts the timestamp of a sensor record to seconds since the epoch.
+
+    :param record: dict: Sensor record with a 'timestamp' key (e.g., "2025/05/05 05:17:35").
+    :return: float or None: The seconds, None if the timestamp is missing or malformed.
+    """
+    try:
+        timestamp = np.datetime64(str(record['timestamp']).replace('/', '-').rstrip('Z'), 's')
+    except (KeyError, TypeError, ValueError):
+        return None
+    return None if np.isnat(timestamp) else float(timestamp.astype(np.int64))
+
+
+def field_value(record: dict, field: str) -> float:
+    """
+    Extracts one sensor reading from a record.
+
+    :param record: dict: Sensor record with a 'sensor_data' dictionary.
+    :param field: str: The sensor reading to extract (e.g., "moisture").
+    :return: float: The reading, NaN if it is missing or non-numeric.
+    """
+    value = record.get('sensor_data', {}).get(field)
+    return float(value) if isinstance(value, numbers.Real) else np.nan
+
+
+def _valid_records(records: Iterable[dict]) -> Iterator[tuple[float, dict]]:
+    # Records whose timestamp cannot be read are skipped rather than failing the whole history
+    for record in records:
+        seconds = record_seconds(record)
+        if seconds is not None:
+            yield seconds, record
+
+
+def _points(bucket: list[tuple[float, dict]], field: str) -> tuple[np.ndarray, np.ndarray, list[dict]]:
+    # The coordinates of a bucket of records, missing readings count as 0
+    records = [record for _, record in bucket]
+    x = np.fromiter((seconds for seconds, _ in bucket), dtype=np.float64, count=len(bucket))
+    y = np.nan_to_num(np.fromiter((field_value(record, field) for record in records), dtype=np.float64,
+                                  count=len(bucket)))
+    return x, y, records
+
+
+def _largest_triangle(bucket: tuple, previous: tuple, next_x: float, next_y: float) -> tuple[float, float, dict]:
+    # Twice the area of the triangles formed by the previous point, each candidate and the next bucket average
+    x, y, records = bucket
+    areas = np.abs((previous[0] - next_x) * (y - previous[1]) - (previous[0] - x) * (next_y - previous[1]))
+    i = int(np.argmax(areas))
+    return x[i], y[i], records[i]
+
+
+def lttb(records: Iterable[dict], threshold: int, field: str, count: int = None) -> list[dict]:
+    """
+    Downsamples sensor records for charting with the Largest-Triangle-Three-Buckets algorithm, keeping the
+    records that best preserve the shape of one reading.
+    The records are read once and only two buckets are held at a time, so a history can be streamed from the
+    database when its size is known beforehand. Records whose timestamp cannot be read are skipped.
+
+    :param records: Iterable[dict]: Sensor records in chronological order.
+    :param threshold: int: The maximum number of records to return.
+    :param field: str: The sensor reading the selection is based on.
+    :param count: int: The number of records, records past it are ignored. Counted from the records if None.
+    :return: list[dict]: The selected records, unchanged.
+    """
+    if count is None:
+        records = list(records)
+        count = len(records)
+    records = islice(records, count)
+    if count <= threshold or count <= 2:
+        return list(records)
+    points = _valid_records(records)
+    if threshold <= 2:
+        ends = list(islice(points, 1))
+        for last in points:
+            ends[1:] = [last]
+        return [record for _, record in ends][:max(threshold, 0)]
+
+    # The first and last points are always kept, the others are split into threshold - 2 buckets
+    edges = (np.arange(threshold - 1) * ((count - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = count - 1
+
+    first = next(points, None)
+    if first is None:
+        return []
+    selected = [first[1]]
+    previous = first[0], np.nan_to_num(field_value(first[1], field)), first[1]
+
+    # A bucket is reduced once the next one is complete, its average being part of the selection
+    pending, current, bucket = [], [], 0
+    for index, point in enumerate(points, start=1):
+        if index == edges[bucket + 1]:
+            pending.append(_points(current, field))
+            current = []
+            bucket += 1
+            if len(pending) == 2:
+                previous = _largest_triangle(pending.pop(0), previous, pending[0][0].mean(), pending[0][1].mean())
+                selected.append(previous[2])
+        current.append(point)
+
+    # The last record read is the last point, even if the history shrank since it was counted
+    # or some of its records were skipped
+    tail = [list(zip(x, bucket_records)) for x, _, bucket_records in pending] + [current]
+    tail = [bucket_points for bucket_points in tail if bucket_points]
+    if not tail:
+        return selected
+    last_x, last = tail[-1].pop()
+    last_y = np.nan_to_num(field_value(last, field))
+    tail = [_points(bucket_points, field) for bucket_points in tail if bucket_points]
+    for i, bucket_arrays in enumerate(tail):
+        if i + 1 < len(tail):
+            next_x, next_y = tail[i + 1][0].mean(), tail[i + 1][1].mean()
+        else:
+            next_x, next_y = last_x, last_y
+        previous = _largest_triangle(bucket_arrays, previous, next_x, next_y)
+        selected.append(previous[2])
+    selected.append(last)
+    return selected
+
+
+def aggregate(records: Iterable[dict], buckets: int, how: str = 'avg', count: int = None) -> list[dict]:
+    """
+    Downsamples sensor records by splitting them into consecutive buckets of equal size and
+    reducing every reading of a bucket to its average, minimum or maximum.
+    The records are read once and only the running reduction of a bucket is held. Records whose timestamp cannot
+    be read are skipped.
+
+    :param records: Iterable[dict]: Sensor records in chronological order.
+    :param buckets: int: The maximum number of records to return.
+    :param how: str: The reduction applied to each bucket, one of 'avg', 'min' or 'max'.
+    :param count: int: The number of records, records past it are ignored. Counted from the records if None.
+    :return: list[dict]: One record per bucket, stamped with the timestamp of the bucket's first record.
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation: {how}")
+    if count is None:
+        records = list(records)
+        count = len(records)
+    records = islice(records, count)
+    if count <= buckets:
+        return list(records)
+
+    starts = np.linspace(0, count, buckets, endpoint=False).astype(np.int64)
+    reduce = min if how == 'min' else max
+    result = []
+    reduced, bucket = None, 0
+    for index, (_, record) in enumerate(_valid_records(records)):
+        if bucket < len(starts) and index == starts[bucket]:
+            if reduced is not None:
+                result.append(_reduced_record(reduced, how))
+            reduced = {'timestamp': record['timestamp'], 'fields': {}}
+            bucket += 1
+        fields = reduced['fields']
+        for name, value in record.get('sensor_data', {}).items():
+            if not isinstance(value, numbers.Real) or np.isnan(value):
+                continue
+            if how == 'avg':
+                total = fields.setdefault(name, [0.0, 0])
+                total[0] += value
+                total[1] += 1
+            else:
+                fields[name] = value if name not in fields else reduce(fields[name], value)
+    if reduced is not None:
+        result.append(_reduced_record(reduced, how))
+    return result
+
+
+def _reduced_record(reduced: dict, how: str) -> dict:
+    fields = reduced['fields']
+    return {
+        'timestamp': reduced['timestamp'],
+        'sensor_data': {
+            name: float(fields[name][0] / fields[name][1] if how == 'avg' else fields[name]) for name in sorted(fields)
+        },
+    }
@@ -1,10 +1,26 @@
 from io import BytesIO
+from typing import BinaryIO, Iterable
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.chart import BarChart, Reference, LineChart
 from openpyxl.utils.dataframe import dataframe_to_rows
 import regex as re
 
+MONTH_MAP = {
+    "01": "January", "02": "February", "03": "March", "04": "April",
+    "05": "May", "06": "June", "07": "July", "08": "August",
+    "09": "September", "10": "October", "11": "November", "12": "December"
+}
+
+# Readings listed in the summary table of a device sheet
+SUMMARY_FIELDS = ("temperature", "humidity", "moisture")
+
+# Maximum number of rows of an Excel sheet, Excel cannot open a workbook with a larger sheet
+MAX_SHEET_ROWS = 1048576
+
+# Maximum length of an Excel sheet name
+MAX_SHEET_TITLE = 31
+
 
 def sanitize_sheet_title(title: str) -> str:
     """
@@ -87,20 +103,68 @@ def export_to_excel(_data: dict) -> BytesIO:
     :param _data: The data containing sensor records and water usage.
     :return: BytesIO buffer containing the Excel file.
     """
-    wb = Workbook()
+    buff = BytesIO()
     try:
-        build_excel_sheet(wb, _data)
+        save_excel(_data, buff)
     except ValueError as e:
         print(f"Error building Excel sheet: {e}")
         return BytesIO()
 
-    # Save workbook to BytesIO buffer
-    buff = BytesIO()
-    wb.save(buff)
     buff.seek(0)
     return buff
 
 
+def save_excel(_data: dict, target: str or BinaryIO) -> None:
+    """
+    Writes data to an Excel file in write-only mode. Rows are flushed to disk as they are appended,
+    so 'record' may be an iterator over any number of records without holding them in memory.
+    Records beyond the row limit of a sheet are continued on further "Sensor Records (n)" sheets.
+
+    :param _data: The data containing sensor records and water usage.
+    :param target: Path or binary file object the workbook is saved to.
+    :return: None
+    """
+    wb = Workbook(write_only=True)
+    build_excel_sheet(wb, _data)
+    wb.save(target)
+
+
+def write_sensor_records(wb: Workbook, title: str, records: Iterable[dict],
+                         max_rows: int = MAX_SHEET_ROWS) -> int:
+    """
+    Appends sensor records to worksheets, one row per record.
+    The columns are the readings of the first record followed by the timestamp. When a sheet reaches max_rows,
+    the next records go to a new sheet, "<title> (2)", "<title> (3)" and so on, each with the column header.
+
+    :param wb: Workbook: The workbook the sheets are added to.
+    :param title: str: The name of the first sheet.
+    :param records: Iterable[dict]: The sensor records, containing 'sensor_data' and 'timestamp'.
+    :param max_rows: int: Maximum number of rows of a sheet, header included.
+    :return: int: The number of records written.
+    """
+    ws = wb.create_sheet(sanitize_sheet_title(title))
+    columns = None
+    rows = 0
+    sheets = 1
+    count = 0
+    for record in records:
+        sensor_data = record["sensor_data"]
+        if columns is None:
+            columns = list(sensor_data)
+            ws.append(columns + ["Timestamp"])
+            rows = 1
+        elif rows >= max_rows:
+            sheets += 1
+            suffix = f" ({sheets})"
+            ws = wb.create_sheet(sanitize_sheet_title(title)[:MAX_SHEET_TITLE - len(suffix)] + suffix)
+            ws.append(columns + ["Timestamp"])
+            rows = 1
+        ws.append([sensor_data.get(column) for column in columns] + [record["timestamp"]])
+        rows += 1
+        count += 1
+    return count
+
+
 def build_excel_sheet(wb: Workbook, data: dict, prefix: str = '') -> None:
     """
     Builds an Excel sheet from the provided data, creating separate sheets for sensor records and water usage.
@@ -110,32 +174,11 @@ def build_excel_sheet(wb: Workbook, data: dict, prefix: str = '') -> None:
     :param prefix: A prefix for the sheet names.
     :return: None
     """
-    MONTH_MAP = {
-        "01": "January", "02": "February", "03": "March", "04": "April",
-        "05": "May", "06": "June", "07": "July", "08": "August",
-        "09": "September", "10": "October", "11": "November", "12": "December"
-    }
-
-    # Convert records to DataFrame
-
     if "record" not in data:
         raise ValueError("Data must contain 'record'.")
 
-    records_df = pd.DataFrame(
-        [{**record["sensor_data"], "Timestamp": record["timestamp"]} for record in data["record"]]
-    )
-
-    # Convert water usage to DataFrame
-
-
-    # Create Excel workbook
-    ws_records = wb.active
-    title = sanitize_sheet_title(f"{prefix} Sensor Records")
-    ws_records.title = title
-
     # Write records data to Excel
-    for row in dataframe_to_rows(records_df, index=False, header=True):
-        ws_records.append(row)
+    write_sensor_records(wb, f"{prefix} Sensor Records", data["record"])
 
     if "water_usage" not in data:
         return
@@ -149,68 +192,92 @@ def build_excel_sheet(wb: Workbook, data: dict, prefix: str = '') -> None:
         return
 
     water_usage_df = pd.DataFrame(data["water_usage"])
-    water_usage_df["Year"] = water_usage_df["date"].str[:4]
     water_usage_df["Month"] = water_usage_df["date"].str[5:7].map(MONTH_MAP)
 
     # Write water usage data to Excel
     title = sanitize_sheet_title(f"{prefix} Water Usage")
 
     ws_water = wb.create_sheet(title)
-    for row in dataframe_to_rows(water_usage_df.drop(columns=["Year"]), index=False, header=True):
+    for row in dataframe_to_rows(water_usage_df, index=False, header=True):
         ws_water.append(row)
 
-    # Ensure all months are included with zero values if missing
-    all_months = pd.DataFrame({"Month": list(MONTH_MAP.values())})
-    water_usage_df = (
-        all_months.merge(water_usage_df, on="Month", how="left")
-        .fillna({"water_used": 0}))
-
-    # Pivot data to get yearly structure
-    water_usage_pivot = water_usage_df.pivot(index="Month", columns="Year", values="water_used").fillna(
-        0).reset_index()
-    water_usage_pivot["MonthOrder"] = water_usage_pivot["Month"].map({v: k for k, v in MONTH_MAP.items()})
-    water_usage_pivot = water_usage_pivot.sort_values("MonthOrder").drop(columns=["MonthOrder"])
+    # Monthly totals come from the rollups when the caller has them, otherwise they are summed here
+    totals = data.get("water_totals") or water_totals_by_month(data["water_usage"])
 
     # Write yearly water usage data and create charts
-    for year in water_usage_df["Year"].dropna().unique():
+    for year in sorted({month[:4] for month in totals}):
         ws_year = wb.create_sheet(f"{prefix} {year}")
-        year_data = water_usage_pivot[["Month", year]].fillna(0)
-
-        for row in dataframe_to_rows(year_data, index=False, header=True):
-            ws_year.append(row)
+        ws_year.append(["Month", year])
+        for number, name in MONTH_MAP.items():
+            ws_year.append([name, totals.get(f"{year}/{number}", 0)])
 
         create_bar_chart(ws_year, f"Monthly Water Usage for {year}", "Water Used", "Month", "D", 2)
         create_line_chart(ws_year, f"Monthly Trend for {year}", "Water Used", "Month", "H", 2)
 
 
-def build_device_excel_sheet(ws, records_df: pd.DataFrame, water_usage_df: pd.DataFrame, device_name: str) -> None:
+def water_totals_by_month(water_usage: list[dict]) -> dict[str, float]:
+    """
+    Sums water usage entries per month.
+
+    :param water_usage: list[dict]: The water usage entries, containing 'date' and 'water_used'.
+    :return: dict[str, float]: The water used, keyed by "YYYY/MM".
+    """
+    totals = {}
+    for usage in water_usage:
+        month = str(usage.get("date", ""))[:7].replace("-", "/")
+        if len(month) == 7:
+            totals[month] = totals.get(month, 0) + (usage.get("water_used") or 0)
+    return totals
+
+
+def build_device_excel_sheet(ws, device_name: str, summary: dict, daily: list[dict], water_totals: dict) -> None:
     """
-    Writes sensor records and water usage to a single worksheet.
+    Writes the report of a device to a single worksheet, from its rollups.
     Adds headers for separation.
 
     :param ws: The worksheet to write data to.
-    :param records_df: DataFrame containing sensor records.
-    :param water_usage_df: DataFrame containing water usage data.
     :param device_name: Name of the device to be included in the header.
+    :param summary: Rollup of the month, written as a summary table.
+    :param daily: Daily rollups of the month, one row per day.
+    :param water_totals: Water used per month, keyed by "YYYY/MM".
     :return: None
     """
     ws.append([f"Device: {device_name}"])
-    ws.append(["Sensor Records"])
-    for row in dataframe_to_rows(records_df, index=False, header=True):
-        ws.append(row)
+    ws.append(["Summary"])
+    ws.append(["Reading", "Min", "Max", "Mean", "Samples"])
+    for field in SUMMARY_FIELDS:
+        stats = summary.get(field)
+        if stats:
+            ws.append([field.capitalize(), stats["min"], stats["max"], round(stats["mean"], 2), stats["count"]])
+    ws.append(["Water Used", summary.get("water_used", 0)])
+
+    ws.append([])  # Blank line
+    ws.append(["Daily Readings"])
+    header = ["Date", "Samples"]
+    for field in SUMMARY_FIELDS:
+        header += [f"{field.capitalize()} Min", f"{field.capitalize()} Mean", f"{field.capitalize()} Max"]
+    ws.append(header + ["Water Used"])
+    for day in daily:
+        row = [day["key"], day["count"]]
+        for field in SUMMARY_FIELDS:
+            stats = day.get(field)
+            row += [stats["min"], round(stats["mean"], 2), stats["max"]] if stats else [None, None, None]
+        ws.append(row + [day.get("water_used", 0)])
 
     ws.append([])  # Blank line
     ws.append(["Water Usage"])
-    for row in dataframe_to_rows(water_usage_df, index=False, header=True):
-        ws.append(row)
+    ws.append(["Month", "Water Used"])
+    for month in sorted(water_totals):
+        ws.append([f"{MONTH_MAP.get(month[5:7], month[5:7])} {month[:4]}", water_totals[month]])
 
 
 def export_to_excel_devices(_data: list) -> BytesIO:
     """
     Exports a list of devices into an Excel file where each device has its own sheet,
-    containing sensor records and water usage data.
+    containing the monthly summary, the daily readings and the water usage, all read from the rollups.
 
-    :param _data: List of device data, each containing sensor records and water usage.
+    :param _data: List of device data, each containing its 'name', monthly 'summary', 'daily' rollups
+        and 'water_totals'.
     :return: BytesIO buffer containing the Excel file.
     """
     wb = Workbook()
@@ -219,32 +286,19 @@ def export_to_excel_devices(_data: list) -> BytesIO:
         del wb['Sheet']
 
     for idx, device in enumerate(_data):
-        if 'record' not in device or 'water_usage' not in device:
+        if not device.get('summary'):
             continue
 
         device_name = device.get("name", "Device")
         device_name = f"{device_name} {idx + 1}"
         print(f"Processing {device_name}")
 
-        # Convert sensor records to DataFrame
-        if not device["record"]:
-            print(f"No records found for device {device_name}")
-            continue
-        try:
-            records_df = pd.DataFrame([{**r["sensor_data"], "Timestamp": r["timestamp"]} for r in device["record"]])
-
-            # Convert water usage to DataFrame
-            water_usage_df = pd.DataFrame(device["water_usage"])
-        except Exception as e:
-            print(f"Error processing device {device_name}: {e}")
-            continue
-
         # Create new sheet
         sheet_title = sanitize_sheet_title(device_name)
         ws = wb.create_sheet(sheet_title)
 
-        # Write both datasets to this sheet
-        build_device_excel_sheet(ws, records_df, water_usage_df, device_name)
+        build_device_excel_sheet(ws, device_name, device["summary"], device.get("daily", []),
+                                 device.get("water_totals", {}))
 
     # Save workbook to buffer
     buff = BytesIO()
@@ -0,0 +1,178 @@
+import csv
+import io
+import itertools
+import numbers
+import typing
+import zipfile
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet', 'arrow')
+
+# Suffix of the exported file for each format, the columnar formats bundle the sensor records and
+# the water usage as two files of one archive
+FILE_SUFFIXES = {
+    'xlsx': 'xlsx',
+    'csv': 'csv.zip',
+    'parquet': 'parquet.zip',
+    'arrow': 'arrow.zip',
+}
+
+# Length of the timestamp prefix identifying a row group period
+ROW_GROUP_PERIODS = {
+    'day': len('YYYY/MM/DD'),
+    'month': len('YYYY/MM'),
+}
+
+TIMESTAMP_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+
+def save_export(_data: dict, target: str, export_format: str, row_group_period: str = 'day') -> None:
+    """
+    Writes sensor records and water usage to a file in the requested format.
+    'record' may be an iterator, every format streams it without holding the whole history in memory.
+
+    :param _data: dict: The data containing sensor records and water usage.
+    :param target: str: Path the file is written to.
+    :param export_format: str: One of 'xlsx', 'csv', 'parquet' or 'arrow'.
+    :param row_group_period: str: 'day' or 'month', the records of one period form one Parquet row group
+        or Arrow record batch.
+    :return: None
+    """
+    if export_format == 'xlsx':
+        # pandas and openpyxl are only loaded by the first spreadsheet export
+        from src.utils.excel_manager import save_excel
+        save_excel(_data, target)
+    elif export_format == 'csv':
+        save_csv_archive(_data, target)
+    elif export_format in ('parquet', 'arrow'):
+        save_columnar_archive(_data, target, export_format, ROW_GROUP_PERIODS[row_group_period])
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+
+def save_csv_archive(_data: dict, target: str) -> None:
+    """
+    Writes the sensor records and the water usage as two CSV files of a zip archive.
+
+    :param _data: dict: The data containing sensor records and water usage.
+    :param target: str: Path of the archive.
+    :return: None
+    """
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('sensor_records.csv', 'w') as member:
+            out = io.TextIOWrapper(member, encoding='utf-8', newline='')
+            writer = csv.writer(out)
+            columns = None
+            for record in _data['record']:
+                sensor_data = record['sensor_data']
+                if columns is None:
+                    columns = list(sensor_data)
+                    writer.writerow(['timestamp'] + columns)
+                writer.writerow([record['timestamp']] + [sensor_data.get(column) for column in columns])
+            out.flush()
+            out.detach()
+
+        with archive.open('water_usage.csv', 'w') as member:
+            out = io.TextIOWrapper(member, encoding='utf-8', newline='')
+            writer = csv.writer(out)
+            writer.writerow(['date', 'water_used'])
+            for usage in _data.get('water_usage') or []:
+                writer.writerow([usage.get('date'), usage.get('water_used')])
+            out.flush()
+            out.detach()
+
+
+def save_columnar_archive(_data: dict, target: str, export_format: str, period_length: int) -> None:
+    """
+    Writes the sensor records and the water usage as two Parquet or Arrow IPC files of a zip archive.
+    The sensor records are written one period at a time, each period becoming a Parquet row group or an
+    Arrow record batch, so readers can skip the periods they do not need. The archive members are stored
+    uncompressed, the columnar files are compressed already.
+
+    :param _data: dict: The data containing sensor records and water usage.
+    :param target: str: Path of the archive.
+    :param export_format: str: 'parquet' or 'arrow'.
+    :param period_length: int: Length of the timestamp prefix identifying a period.
+    :return: None
+    """
+    # pyarrow is only needed by these formats, it is not loaded until one is requested
+    import pyarrow as pa
+
+    records = iter(_data['record'])
+    first = next(records, None)
+    columns = list(first['sensor_data']) if first else []
+    schema = pa.schema(
+        [pa.field('timestamp', pa.timestamp('ms'))] + [pa.field(column, pa.float64()) for column in columns]
+    )
+
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as archive:
+        with archive.open(f'sensor_records.{export_format}', 'w') as member:
+            writer = _columnar_writer(member, schema, export_format)
+            if first is not None:
+                periods = itertools.groupby(
+                    itertools.chain([first], records),
+                    key=lambda record: str(record['timestamp'])[:period_length].replace('-', '/'),
+                )
+                for _, period in periods:
+                    writer.write_table(_sensor_table(list(period), schema))
+            writer.close()
+
+        with archive.open(f'water_usage.{export_format}', 'w') as member:
+            water_usage = _data.get('water_usage') or []
+            table = pa.table({
+                'date': pa.array([usage.get('date') for usage in water_usage], type=pa.string()),
+                'water_used': pa.array([_number(usage.get('water_used')) for usage in water_usage],
+                                       type=pa.float64()),
+            })
+            writer = _columnar_writer(member, table.schema, export_format)
+            writer.write_table(table)
+            writer.close()
+
+
+def _columnar_writer(sink: typing.BinaryIO, schema, export_format: str):
+    """
+    Opens a Parquet or Arrow IPC file writer on a binary stream.
+
+    :param sink: BinaryIO: The stream to write to.
+    :param schema: pyarrow.Schema: The schema of the written tables.
+    :param export_format: str: 'parquet' or 'arrow'.
+    :return: The writer, exposing write_table and close.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if export_format == 'parquet':
+        return pq.ParquetWriter(sink, schema, compression='zstd')
+    return pa.ipc.new_file(sink, schema)
+
+
+def _sensor_table(records: list[dict], schema):
+    """
+    Converts sensor records to a table, timestamps are parsed and readings stored as floats.
+
+    :param records: list[dict]: The sensor records.
+    :param schema: pyarrow.Schema: The schema of the table.
+    :return: pyarrow.Table: The records as a table.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    timestamps = pa.array([str(record['timestamp']) for record in records], type=pa.string())
+    timestamps = pc.replace_substring(timestamps, '-', '/')
+    timestamps = pc.replace_substring(timestamps, 'T', ' ')
+    timestamps = pc.replace_substring(timestamps, 'Z', '')
+
+    arrays = [pc.strptime(timestamps, format=TIMESTAMP_FORMAT, unit='ms', error_is_null=True)]
+    for field in schema.names[1:]:
+        arrays.append(pa.array([_number(record['sensor_data'].get(field)) for record in records],
+                               type=pa.float64()))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _number(value: typing.Any) -> float or None:
+    """
+    Returns a reading as a float, or None when it is missing or not numeric.
+
+    :param value: Any: The reading.
+    :return: float or None: The reading as a float.
+    """
+    return float(value) if isinstance(value, numbers.Real) else None
@@ -0,0 +1,154 @@
+import threading
+import typing
+
+# NumPy is only imported for type checking here and on first use, like the runtimes themselves
+if typing.TYPE_CHECKING:
+    import numpy as np
+
+
+def _tflite_interpreter() -> type:
+    """
+    Returns the TensorFlow Lite interpreter class of the first runtime installed: LiteRT, the standalone
+    tflite-runtime, or the interpreter bundled with TensorFlow.
+
+    :return: type: The interpreter class.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def quantize(values: 'np.ndarray', dtype: type, scale: float, zero_point: int) -> 'np.ndarray':
+    """
+    Quantizes float values to the integer type of a quantized tensor.
+
+    :param values: np.ndarray: The float values.
+    :param dtype: type: The integer type of the tensor, e.g. np.int8.
+    :param scale: float: The quantization scale of the tensor.
+    :param zero_point: int: The quantization zero point of the tensor.
+    :return: np.ndarray: The quantized values.
+    """
+    import numpy as np
+
+    info = np.iinfo(dtype)
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def dequantize(values: 'np.ndarray', scale: float, zero_point: int) -> 'np.ndarray':
+    """
+    Converts the values of a quantized tensor back to floats.
+
+    :param values: np.ndarray: The quantized values.
+    :param scale: float: The quantization scale of the tensor.
+    :param zero_point: int: The quantization zero point of the tensor.
+    :return: np.ndarray: The float values.
+    """
+    import numpy as np
+
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+class TFLiteModel:
+    """
+    Classifier exported to TensorFlow Lite, called like a Keras model: model(batch, training=False).
+    Float16 and dynamic range models take float inputs as they are, a fully quantized int8 model is fed
+    quantized inputs and its outputs are converted back to probabilities.
+    """
+
+    def __init__(self, path: str, num_threads: int = None):
+        """
+        Loads the model.
+
+        :param path: str: Path to the .tflite file.
+        :param num_threads: int: Threads used by the interpreter, None lets the runtime decide.
+        :raises FileNotFoundError: If the file does not exist.
+        """
+        import os
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self._interpreter = _tflite_interpreter()(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        # The interpreter owns its tensors, one batch is run at a time
+        self._lock = threading.Lock()
+        self._read_details()
+
+    def _read_details(self) -> None:
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+
+    def __call__(self, batch: 'np.ndarray', training: bool = False) -> 'np.ndarray':
+        """
+        Runs the model on a batch of preprocessed images.
+
+        :param batch: np.ndarray: The images, with the batch axis first.
+        :param training: bool: Ignored, accepted for compatibility with Keras models.
+        :return: np.ndarray: The class probabilities of every image.
+        """
+        import numpy as np
+
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if tuple(self._input['shape']) != batch.shape:
+                self._interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self._interpreter.allocate_tensors()
+                self._read_details()
+
+            dtype = self._input['dtype']
+            if np.issubdtype(dtype, np.integer):
+                batch = quantize(batch, dtype, *self._input['quantization'])
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output['index']).copy()
+
+        if np.issubdtype(output.dtype, np.integer):
+            output = dequantize(output, *self._output['quantization'])
+        return output
+
+
+class OnnxModel:
+    """
+    Classifier exported to ONNX and run by ONNX Runtime on the CPU, called like a Keras model:
+    model(batch, training=False). ONNX Runtime sessions can be run from several threads at once.
+    """
+
+    def __init__(self, path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        """
+        Loads the model.
+
+        :param path: str: Path to the .onnx file.
+        :param intra_op_threads: int: Threads used within an operation, 0 lets ONNX Runtime decide.
+        :param inter_op_threads: int: Operations run in parallel, 0 lets ONNX Runtime decide.
+        :raises FileNotFoundError: If the file does not exist.
+        """
+        import os
+
+        import onnxruntime as ort
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self._session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self._input_name = self._session.get_inputs()[0].name
+
+    def __call__(self, batch: 'np.ndarray', training: bool = False) -> 'np.ndarray':
+        """
+        Runs the model on a batch of preprocessed images.
+
+        :param batch: np.ndarray: The images, with the batch axis first.
+        :param training: bool: Ignored, accepted for compatibility with Keras models.
+        :return: np.ndarray: The class probabilities of every image.
+        """
+        import numpy as np
+
+        return self._session.run(None, {self._input_name: np.asarray(batch, dtype=np.float32)})[0]
@@ -0,0 +1,220 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from src.utils.logger import get_logger
+from src.utils.metrics import metrics
+
+log = get_logger('inference')
+
+INFERENCE_SECONDS = metrics.histogram('terraflow_inference_seconds',
+                                      'Time from submitting an inference to its result, by pool and outcome',
+                                      ('pool', 'status'))
+
+
+class InferenceBusy(Exception):
+    """
+    Raised when an inference is submitted while the pool already holds max_pending requests.
+    """
+
+
+class InferenceTimeout(Exception):
+    """
+    Raised when an inference did not complete within the timeout of the pool.
+    """
+
+
+def _worker_ready() -> int:
+    """
+    Task run once per worker on start, so the worker initializer runs before the first request.
+
+    :return: int: The process ID of the worker.
+    """
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    Pool of worker processes running CPU-bound inference outside of the API process, so a prediction does not
+    hold the GIL of the threads serving the other HTTP and Socket.IO clients.
+    The calling thread only submits the request and waits for its result. The number of pending requests is
+    bounded and every request has a deadline.
+    """
+
+    def __init__(self, name: str, workers: int, initializer: typing.Callable = None, initargs: tuple = (),
+                 max_pending: int = 16, timeout: float = 30.0):
+        """
+        Initializes the pool. The worker processes are started on the first submit or by start.
+
+        :param name: str: Name of the pool, used for the logs and metrics.
+        :param workers: int: Number of worker processes, 0 runs the inference in the calling thread.
+        :param initializer: Callable: Function run once by each worker when it starts, e.g. to load the model.
+        :param initargs: tuple: Arguments of the initializer.
+        :param max_pending: int: Maximum number of requests queued or running at once, further ones are rejected.
+        :param timeout: float: Maximum time in seconds a caller waits for a result.
+        """
+        self.name = name
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def start(self) -> None:
+        """
+        Starts the worker processes ahead of the first request, each one runs the initializer right away.
+        Does nothing in a process started by multiprocessing, such as a worker of another pool.
+
+        :return: None
+        """
+        if self.workers <= 0:
+            return
+        if multiprocessing.parent_process() is not None:
+            # A spawned worker re-importing the module that starts the pool must not start a pool of its own
+            log.warning("[%s] Not starting the inference workers from a child process", self.name)
+            return
+        executor = self._ensure_started()
+        for _ in range(self.workers):
+            executor.submit(_worker_ready)
+
+    def submit(self, fn: typing.Callable, *args) -> typing.Any:
+        """
+        Runs a function in a worker process and waits for its result.
+
+        :param fn: Callable: Function to run, it must be importable by the workers.
+        :param args: Arguments of the function, they are pickled to the worker.
+        :return: Any: The result of the function.
+        :raises InferenceBusy: If max_pending requests are already queued or running.
+        :raises InferenceTimeout: If the result is not available within the timeout.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            INFERENCE_SECONDS.observe(0.0, pool=self.name, status='rejected')
+            raise InferenceBusy(f"Inference pool '{self.name}' is full")
+
+        start = time.perf_counter()
+        self.submitted += 1
+        self.pending += 1
+        if self.workers <= 0:
+            try:
+                return self._finish(start, fn(*args))
+            except Exception:
+                self._fail(start)
+                raise
+            finally:
+                self._release()
+
+        executor = self._ensure_started()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            self._fail(start)
+            raise
+        # The slot is freed when the worker is done, a request that timed out still counts until then
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            return self._finish(start, future.result(timeout=max(0.0, self.timeout - (time.perf_counter() - start))))
+        except FutureTimeoutError:
+            future.cancel()
+            self.timed_out += 1
+            INFERENCE_SECONDS.observe(time.perf_counter() - start, pool=self.name, status='timeout')
+            raise InferenceTimeout(f"Inference pool '{self.name}' did not answer within {self.timeout} seconds")
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for using too much memory, the next request starts a new pool
+            self._reset(executor)
+            self._fail(start)
+            raise
+        except Exception:
+            self._fail(start)
+            raise
+
+    def stop(self) -> None:
+        """
+        Stops the worker processes, pending requests are cancelled.
+
+        :return: None
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the pool.
+
+        :return: dict: Pending, submitted, completed, rejected, timed out and failed requests, and worker restarts.
+        """
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'failed': self.failed,
+            'restarts': self.restarts,
+        }
+
+    def _ensure_started(self) -> ProcessPoolExecutor:
+        """
+        Returns the executor, creating it if it is not running.
+
+        :return: ProcessPoolExecutor: The executor.
+        """
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the sockets and threads of the API process
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=self.initializer, initargs=self.initargs)
+                atexit.register(self.stop)
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Drops a broken executor so the next request starts new workers.
+
+        :param executor: ProcessPoolExecutor: The broken executor.
+        :return: None
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        log.error("[%s] Inference worker died, restarting the pool", self.name)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, start: float, result: typing.Any) -> typing.Any:
+        self.completed += 1
+        INFERENCE_SECONDS.observe(time.perf_counter() - start, pool=self.name, status='ok')
+        return result
+
+    def _fail(self, start: float) -> None:
+        self.failed += 1
+        INFERENCE_SECONDS.observe(time.perf_counter() - start, pool=self.name, status='error')
+
+    def _release(self) -> None:
+        self.pending -= 1
+        self._slots.release()
@@ -0,0 +1,45 @@
+import itertools
+import logging
+
+from src.utils.secrets import LOG_LEVEL, LOG_SAMPLE_EVERY
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_configured = False
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets one record out of every `every` through, so per-message logs stay cheap under load.
+    Errors are never dropped.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        return next(self._seen) % self.every == 0
+
+
+def get_logger(name: str, sampled: bool = False) -> logging.Logger:
+    """
+    Returns a logger of the backend, configuring the log output on first use.
+
+    :param name: str: Name of the logger, e.g. "mqtt".
+    :param sampled: bool: Whether records below ERROR are sampled, one in LOG_SAMPLE_EVERY is kept.
+        Meant for the logs written for every message.
+    :return: logging.Logger: The logger.
+    """
+    global _configured
+    if not _configured:
+        logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+        _configured = True
+
+    logger = logging.getLogger(f'terraflow.{name}')
+    if sampled and not any(isinstance(f, SampleFilter) for f in logger.filters):
+        logger.addFilter(SampleFilter(LOG_SAMPLE_EVERY))
+    return logger
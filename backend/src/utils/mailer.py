@@ -0,0 +1,74 @@
+import smtplib
+from email.message import Message
+
+
+class SMTPSession:
+    """
+    SMTP connection reused for every message sent through it.
+    The connection is opened on the first message and reopened once if the server dropped it.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str):
+        """
+        Initializes the session without connecting.
+
+        :param host: str: The SMTP server.
+        :param port: int: The SMTP port, STARTTLS is used on it.
+        :param username: str: The login of the sender.
+        :param password: str: The password of the sender.
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self._server = None
+        self.sent = 0
+        self.connects = 0
+
+    def send(self, msg: Message) -> None:
+        """
+        Sends a message, connecting or reconnecting as needed.
+
+        :param msg: Message: The message to send.
+        :return: None
+        """
+        try:
+            self._connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._server = None
+            self._connection().send_message(msg)
+        self.sent += 1
+
+    def close(self) -> None:
+        """
+        Closes the connection if it is open.
+
+        :return: None
+        """
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            pass
+        self._server = None
+
+    def _connection(self) -> smtplib.SMTP:
+        """
+        Returns the open connection, opening and authenticating it if needed.
+
+        :return: smtplib.SMTP: The connection.
+        """
+        if self._server is None:
+            server = smtplib.SMTP(self.host, self.port)
+            server.starttls()  # Secure the connection
+            server.login(self.username, self.password)  # Log in with sender's credentials
+            self._server = server
+            self.connects += 1
+        return self._server
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
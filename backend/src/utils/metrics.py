@@ -0,0 +1,303 @@
+import bisect
+import math
+import threading
+import time
+import typing
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Upper bounds of the batch size histogram buckets
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _format_value(value: float) -> str:
+    """
+    Formats a sample value in the Prometheus text format.
+
+    :param value: float: The value.
+    :return: str: The formatted value.
+    """
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: typing.Iterable[tuple[str, typing.Any]]) -> str:
+    """
+    Formats label pairs in the Prometheus text format.
+
+    :param labels: Iterable[tuple[str, Any]]: The label names and values.
+    :return: str: The labels between braces, or an empty string without labels.
+    """
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    ]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """
+    Metric with a value per combination of label values. Safe to update from any thread.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        """
+        Returns the label values of a sample, in the declared order.
+
+        :param labels: dict: The label values by name.
+        :return: tuple: The label values.
+        """
+        if len(labels) != len(self.label_names) or not all(name in labels for name in self.label_names):
+            raise ValueError(f"Metric {self.name} expects the labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> typing.Iterator[tuple[str, tuple, float]]:
+        """
+        Iterates over the samples of the metric.
+
+        :return: Iterator[tuple[str, tuple, float]]: The sample name, its label pairs and its value.
+        """
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.label_names, key)), value
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count of events.
+    """
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increments the counter.
+
+        :param amount: float: The increment.
+        :param labels: The label values of the sample to increment.
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down.
+    """
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Sets the gauge.
+
+        :param value: float: The new value.
+        :param labels: The label values of the sample to set.
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, counted in cumulative buckets.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Records an observation.
+
+        :param value: float: The observed value.
+        :param labels: The label values of the sample to update.
+        :return: None
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the time spent in a block, whether it succeeds or raises.
+
+        :param labels: The label values of the sample to update.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> typing.Iterator[tuple[str, tuple, float]]:
+        with self._lock:
+            values = [(key, list(state['counts']), state['sum'], state['count']) for key, state in self._values.items()]
+        for key, counts, total, count in values:
+            labels = tuple(zip(self.label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of metrics rendered in the Prometheus text exposition format.
+    Besides the metrics updated by the code, collectors turn the stats() of components such as the batch
+    queues and caches into gauges at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> typing.Any:
+        """
+        Registers a metric, returning the one already registered under its name if any.
+
+        :param metric: _Metric: The metric.
+        :return: _Metric: The registered metric.
+        """
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} is already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Counter:
+        """
+        Returns the counter registered under a name, creating it if needed.
+
+        :param name: str: The metric name.
+        :param documentation: str: The help text.
+        :param labels: tuple[str, ...]: The label names.
+        :return: Counter: The counter.
+        """
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> Gauge:
+        """
+        Returns the gauge registered under a name, creating it if needed.
+
+        :param name: str: The metric name.
+        :param documentation: str: The help text.
+        :param labels: tuple[str, ...]: The label names.
+        :return: Gauge: The gauge.
+        """
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        """
+        Returns the histogram registered under a name, creating it if needed.
+
+        :param name: str: The metric name.
+        :param documentation: str: The help text.
+        :param labels: tuple[str, ...]: The label names.
+        :param buckets: tuple[float, ...]: The upper bounds of the buckets.
+        :return: Histogram: The histogram.
+        """
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def register_stats(self, prefix: str, documentation: str, stats: typing.Callable[[], dict],
+                       labels: dict = None) -> None:
+        """
+        Exposes the numeric entries of a stats() dictionary as gauges named "<prefix>_<key>".
+        Nested dictionaries, such as the per model stats of the model registry, are labelled with their key.
+
+        :param prefix: str: The prefix of the gauge names.
+        :param documentation: str: The help text shared by the gauges.
+        :param stats: Callable[[], dict]: Returns the current stats.
+        :param labels: dict: Labels added to every sample, e.g. the name of the queue.
+        :return: None
+        """
+        with self._lock:
+            self._collectors.append((prefix, documentation, stats, dict(labels or {})))
+
+    def _collect(self) -> dict[str, tuple[str, list[tuple[tuple, float]]]]:
+        """
+        Reads the registered stats.
+
+        :return: dict: The samples of each collected gauge, with its help text.
+        """
+        collected = {}
+        with self._lock:
+            collectors = list(self._collectors)
+        for prefix, documentation, stats, labels in collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Failed to collect {prefix} metrics: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for name, nested in value.items():
+                        if isinstance(nested, (int, float)):
+                            samples = collected.setdefault(f'{prefix}_{name}', (documentation, []))[1]
+                            samples.append((tuple(labels.items()) + (('name', key),), nested))
+                elif isinstance(value, (int, float)):
+                    samples = collected.setdefault(f'{prefix}_{key}', (documentation, []))[1]
+                    samples.append((tuple(labels.items()), value))
+        return collected
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+
+        :return: str: The exposition.
+        """
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for name, (documentation, samples) in sorted(self._collect().items()):
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
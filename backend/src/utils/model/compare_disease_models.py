@@ -0,0 +1,173 @@
+"""
+Compares the accuracy and CPU latency of disease classifiers, e.g. the Keras model and its TensorFlow Lite and
+ONNX conversions, on a held-out set of images, and picks the fastest one that meets an accuracy floor.
+
+The held-out set is a directory of class_<n> folders, laid out like the processed_images directory written by
+disease_dataset, holding images the models were not trained on. The images are decoded and preprocessed the way
+the backend does, so the accuracy is the one the users get.
+
+Usage, from the backend directory:
+    python -m src.utils.model.compare_disease_models --test-dir held_out \
+        --models src/utils/model/128_resnetv50_1000_224_7.keras src/utils/model/128_resnetv50_1000_224_7_int8.tflite \
+        --min-accuracy 0.85 --output comparison.json
+
+Run it on the kind of machine that serves the backend, with the same TF_INTRA_OP_THREADS and TF_INTER_OP_THREADS.
+The exit code is 1 if no model meets the floor.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from src.utils.predict import DISEASE_MODEL_PATH, INT_TO_CLASS, configure_tf_threads, decode_and_prepare, load_model
+from src.utils.secrets import TF_INTER_OP_THREADS, TF_INTRA_OP_THREADS
+
+CLASS_DIR_PREFIX = 'class_'
+
+
+def load_image_set(directory: str, max_per_class: int = 100, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Loads labelled images from class_<n> folders and preprocesses them like the backend does.
+    Classes with more images are sampled, always the same ones for a given seed.
+
+    :param directory: str: Directory of the class folders.
+    :param max_per_class: int: Maximum number of images per class.
+    :param seed: int: Seed of the sampling.
+    :return: tuple[np.ndarray, np.ndarray]: The preprocessed images and their class.
+    """
+    images, labels = [], []
+    for folder in sorted(os.listdir(directory)):
+        suffix = folder[len(CLASS_DIR_PREFIX):]
+        if not folder.startswith(CLASS_DIR_PREFIX) or not suffix.isdigit() or int(suffix) not in INT_TO_CLASS:
+            continue
+        folder_path = os.path.join(directory, folder)
+        files = sorted(f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f)))
+        if len(files) > max_per_class:
+            files = random.Random(seed).sample(files, max_per_class)
+        for filename in files:
+            with open(os.path.join(folder_path, filename), 'rb') as file:
+                image = decode_and_prepare(file.read())
+            if image is None:
+                print(f"Skipping {filename}, not an image")
+                continue
+            images.append(image)
+            labels.append(int(suffix))
+
+    if not images:
+        raise ValueError(f"No images found in the class folders of {directory}")
+    return np.stack(images), np.array(labels)
+
+
+def measure_latency(model, images: np.ndarray, batch_size: int, repeats: int) -> dict[str, float]:
+    """
+    Measures the time the model takes to classify a batch.
+
+    :param model: The model, called like a Keras model.
+    :param images: np.ndarray: Preprocessed images the batches are taken from.
+    :param batch_size: int: Number of images per batch.
+    :param repeats: int: Number of timed batches.
+    :return: dict[str, float]: The median and 95th percentile time of a batch and the median time per image,
+        in milliseconds.
+    """
+    batch = images[np.arange(batch_size) % len(images)]
+    model(batch, training=False)  # Warm up, e.g. resizes the input of a TensorFlow Lite model
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        np.asarray(model(batch, training=False))
+        timings.append((time.perf_counter() - start) * 1000)
+    p50 = float(np.percentile(timings, 50))
+    return {'p50_ms': p50, 'p95_ms': float(np.percentile(timings, 95)), 'per_image_ms': p50 / batch_size}
+
+
+def evaluate(path: str, images: np.ndarray, labels: np.ndarray, batch_sizes: list[int] = (1, 8),
+             repeats: int = 20, eval_batch_size: int = 32) -> dict:
+    """
+    Measures the accuracy, latency, size and load time of a model.
+
+    :param path: str: Path to the model file, in any format load_model supports.
+    :param images: np.ndarray: Preprocessed held-out images.
+    :param labels: np.ndarray: Their class.
+    :param batch_sizes: list[int]: Batch sizes the latency is measured for.
+    :param repeats: int: Number of timed batches per batch size.
+    :param eval_batch_size: int: Batch size used to compute the accuracy.
+    :return: dict: The results of the model.
+    """
+    start = time.perf_counter()
+    model = load_model(path)
+    load_seconds = time.perf_counter() - start
+
+    predictions = np.concatenate([
+        np.asarray(model(images[index:index + eval_batch_size], training=False)).argmax(axis=1)
+        for index in range(0, len(images), eval_batch_size)
+    ])
+    return {
+        'model': os.path.basename(path),
+        'path': path,
+        'size_mb': os.path.getsize(path) / 1e6,
+        'load_seconds': load_seconds,
+        'accuracy': float((predictions == labels).mean()),
+        'latency': {str(batch_size): measure_latency(model, images, batch_size, repeats) for batch_size in batch_sizes},
+    }
+
+
+def select_model(results: list[dict], min_accuracy: float, batch_size: int = 1) -> dict or None:
+    """
+    Picks the model with the lowest median latency among the ones that meet the accuracy floor.
+
+    :param results: list[dict]: The results of evaluate.
+    :param min_accuracy: float: The accuracy floor, between 0 and 1.
+    :param batch_size: int: The batch size whose latency is compared.
+    :return: dict or None: The results of the selected model, None if no model meets the floor.
+    """
+    eligible = [result for result in results if result['accuracy'] >= min_accuracy]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda result: result['latency'][str(batch_size)]['p50_ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the accuracy and latency of disease classifiers")
+    parser.add_argument('--models', nargs='+', default=[DISEASE_MODEL_PATH], help="Model files to compare")
+    parser.add_argument('--test-dir', required=True, help="Held-out images in class_<n> folders")
+    parser.add_argument('--max-images', type=int, default=100, help="Maximum number of images per class")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8],
+                        help="Batch sizes the latency is measured for, the first one is used to pick the model")
+    parser.add_argument('--repeats', type=int, default=20, help="Number of timed batches per batch size")
+    parser.add_argument('--min-accuracy', type=float, default=0.0, help="Accuracy floor, between 0 and 1")
+    parser.add_argument('--output', help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    # Same threading as the inference workers, before TensorFlow runs anything
+    configure_tf_threads(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
+
+    images, labels = load_image_set(args.test_dir, max_per_class=args.max_images)
+    print(f"Loaded {len(images)} held-out images from {args.test_dir}")
+
+    results = []
+    for path in args.models:
+        result = evaluate(path, images, labels, args.batch_sizes, args.repeats)
+        results.append(result)
+        latency = ', '.join(f"batch {size}: {values['p50_ms']:.1f} ms p50 / {values['p95_ms']:.1f} ms p95"
+                            for size, values in result['latency'].items())
+        print(f"{result['model']}: accuracy {result['accuracy']:.4f}, {result['size_mb']:.1f} MB, "
+              f"loaded in {result['load_seconds']:.1f} s, {latency}")
+
+    selected = select_model(results, args.min_accuracy, args.batch_sizes[0])
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'images': len(images), 'min_accuracy': args.min_accuracy, 'results': results,
+                       'selected': selected and selected['model']}, file, indent=2)
+
+    if selected is None:
+        print(f"No model reaches an accuracy of {args.min_accuracy}")
+        sys.exit(1)
+    print(f"Selected {selected['model']}, serve it with DISEASE_MODEL={selected['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Converts the trained disease classifier to the lightweight formats the backend can serve on CPUs:
+
+- tflite-dynamic: TensorFlow Lite with int8 weights and float activations, no calibration data needed.
+- tflite-float16: TensorFlow Lite with float16 weights, about half the size of the Keras model.
+- tflite-int8: TensorFlow Lite with int8 weights and activations, calibrated on --calibration-dir.
+- onnx: ONNX, run by ONNX Runtime.
+
+Usage, from the backend directory:
+    python -m src.utils.model.convert_disease_model --formats tflite-dynamic tflite-float16 onnx
+    python -m src.utils.model.convert_disease_model --formats tflite-int8 --calibration-dir processed_images
+
+Serve a converted model by setting DISEASE_MODEL to its file name, after checking its accuracy with
+compare_disease_models.
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from src.utils.model.compare_disease_models import load_image_set
+from src.utils.predict import DISEASE_MODEL_PATH, MODEL_DIR
+
+FORMATS = {
+    'tflite-dynamic': '_dynamic.tflite',
+    'tflite-float16': '_float16.tflite',
+    'tflite-int8': '_int8.tflite',
+    'onnx': '.onnx',
+}
+
+
+def convert_tflite(model: tf.keras.Model, quantization: str, calibration: np.ndarray = None) -> bytes:
+    """
+    Converts a Keras model to TensorFlow Lite. The batch size of the converted model can be changed at run time.
+
+    :param model: tf.keras.Model: The trained model.
+    :param quantization: str: 'dynamic', 'float16' or 'int8'.
+    :param calibration: np.ndarray: Preprocessed images used to calibrate the int8 activations.
+    :return: bytes: The TensorFlow Lite model.
+    """
+    if quantization == 'int8' and (calibration is None or len(calibration) == 0):
+        raise ValueError("Int8 quantization needs calibration images")
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir, format='tf_saved_model', verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if quantization == 'float16':
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantization == 'int8':
+            def representative_dataset():
+                for image in calibration:
+                    yield [image[np.newaxis].astype(np.float32)]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.int8
+            converter.inference_output_type = tf.int8
+        elif quantization != 'dynamic':
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        return converter.convert()
+
+
+def convert_onnx(model: tf.keras.Model, path: str) -> None:
+    """
+    Exports a Keras model to ONNX, with a variable batch size. Needs tf2onnx.
+
+    :param model: tf.keras.Model: The trained model.
+    :param path: str: Path of the .onnx file.
+    :return: None
+    """
+    model.export(path, format='onnx', verbose=False)
+
+
+def convert(model_path: str, formats: list[str], output_dir: str, calibration_dir: str = None,
+            calibration_images: int = 200) -> list[str]:
+    """
+    Converts the model to every requested format, next to each other in the output directory.
+
+    :param model_path: str: Path to the Keras model.
+    :param formats: list[str]: The formats, keys of FORMATS.
+    :param output_dir: str: Directory of the converted models.
+    :param calibration_dir: str: Directory of images, in class_<n> folders, used to calibrate int8 models.
+    :param calibration_images: int: Maximum number of calibration images per class.
+    :return: list[str]: Paths of the converted models.
+    """
+    model = tf.keras.models.load_model(model_path)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    os.makedirs(output_dir, exist_ok=True)
+
+    calibration = None
+    if 'tflite-int8' in formats:
+        if calibration_dir is None:
+            raise ValueError("--calibration-dir is required for tflite-int8")
+        calibration, _ = load_image_set(calibration_dir, max_per_class=calibration_images)
+        print(f"Calibrating on {len(calibration)} images from {calibration_dir}")
+
+    paths = []
+    for output_format in formats:
+        path = os.path.join(output_dir, name + FORMATS[output_format])
+        if output_format == 'onnx':
+            convert_onnx(model, path)
+        else:
+            with open(path, 'wb') as file:
+                file.write(convert_tflite(model, output_format.split('-', 1)[1], calibration))
+        print(f"Saved {output_format} model to {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the disease classifier for CPU serving")
+    parser.add_argument('--model', default=DISEASE_MODEL_PATH, help="Keras model to convert")
+    parser.add_argument('--formats', nargs='+', choices=sorted(FORMATS), default=['tflite-dynamic', 'tflite-float16'],
+                        help="Formats to convert to")
+    parser.add_argument('--output-dir', default=MODEL_DIR, help="Directory of the converted models")
+    parser.add_argument('--calibration-dir', help="Images in class_<n> folders, used to calibrate tflite-int8")
+    parser.add_argument('--calibration-images', type=int, default=200,
+                        help="Maximum number of calibration images per class")
+    args = parser.parse_args()
+
+    convert(args.model, args.formats, args.output_dir, args.calibration_dir, args.calibration_images)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,10 @@ from tensorflow.keras import layers, models
 from tensorflow.keras.applications import MobileNetV2, ResNet50V2
 
 from src.utils.model.disease_dataset import preprocess_dataset, reclass_and_save_images
+from src.utils.predict import configure_tf_threads
+from src.utils.secrets import TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS
 
-tf.config.threading.set_intra_op_parallelism_threads(4)
-tf.config.threading.set_inter_op_parallelism_threads(4)
+configure_tf_threads(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
 
 
 def train_model(model, X_train, y_train, X_val, y_val, batch_size=128, epochs=100, callbacks=None, shuffle=True,
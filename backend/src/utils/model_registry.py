@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+import typing
+
+from src.utils.logger import get_logger
+
+log = get_logger('models')
+
+
+def _rss_bytes() -> int:
+    """
+    Returns the resident memory of the current process.
+
+    :return: int: Resident set size in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        # Peak RSS is the best approximation available on other Unix systems
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # Load statistics report no memory rather than failing the load
+        return 0
+
+
+class _Entry:
+    """
+    State of a single registered model.
+    """
+
+    def __init__(self, path: str, loader: typing.Callable[[str], typing.Any]):
+        self.path = path
+        self.loader = loader
+        self.model = None
+        self.mtime = None
+        self.lock = threading.Lock()
+        self.last_check = 0.0
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.memory_bytes = 0
+
+
+class ModelRegistry:
+    """
+    Process-wide registry that loads each model artifact once and shares it between threads.
+    Artifacts are reloaded when their file changes on disk, readers keep using the previous model until
+    the new one is ready.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        """
+        Initializes an empty registry.
+
+        :param check_interval: float: Minimum time in seconds between two checks of a model file for changes,
+            a negative value disables hot reloading.
+        """
+        self.check_interval = check_interval
+        self._entries = {}
+
+    def register(self, name: str, path: str, loader: typing.Callable[[str], typing.Any]) -> None:
+        """
+        Registers a model artifact. The file is not read until the model is first requested.
+
+        :param name: str: Name the model is requested by.
+        :param path: str: Path to the model file.
+        :param loader: Callable[[str], Any]: Function loading the model from its path.
+        :return: None
+        """
+        self._entries[name] = _Entry(path, loader)
+
+    def get(self, name: str) -> typing.Any:
+        """
+        Returns a loaded model, loading it on first use and reloading it if its file changed.
+
+        :param name: str: Name of the registered model.
+        :return: Any: The loaded model.
+        """
+        entry = self._entries[name]
+        if entry.model is None:
+            with entry.lock:
+                if entry.model is None:
+                    self._load(entry)
+            return entry.model
+
+        now = time.monotonic()
+        if 0 <= self.check_interval <= now - entry.last_check:
+            entry.last_check = now
+            try:
+                changed = os.stat(entry.path).st_mtime != entry.mtime
+            except FileNotFoundError:
+                changed = False
+            # Only one thread reloads, the others keep serving the current model
+            if changed and entry.lock.acquire(blocking=False):
+                try:
+                    log.info("Model file %s changed, reloading '%s'", entry.path, name)
+                    self._load(entry)
+                except Exception as e:
+                    log.error("Failed to reload model '%s': %s", name, e)
+                finally:
+                    entry.lock.release()
+
+        return entry.model
+
+    def preload(self, names: list[str] = None) -> None:
+        """
+        Loads the given models ahead of their first use.
+
+        :param names: list[str]: Names of the models to load, all registered models by default.
+        :return: None
+        """
+        for name in names or list(self._entries):
+            try:
+                self.get(name)
+            except Exception as e:
+                log.error("Failed to preload model '%s': %s", name, e)
+
+    def stats(self) -> dict:
+        """
+        Returns load statistics for every registered model.
+
+        :return: dict: Per model path, load count, last load time and memory used by the last load.
+        """
+        return {
+            name: {
+                'path': entry.path,
+                'loaded': entry.model is not None,
+                'loads': entry.loads,
+                'load_seconds': entry.load_seconds,
+                'memory_bytes': entry.memory_bytes,
+            }
+            for name, entry in self._entries.items()
+        }
+
+    @staticmethod
+    def _load(entry: _Entry) -> None:
+        """
+        Loads a model from disk and records how long it took and how much memory it added.
+
+        :param entry: _Entry: The model entry to load.
+        :return: None
+        """
+        mtime = os.stat(entry.path).st_mtime if os.path.exists(entry.path) else None
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+
+        model = entry.loader(entry.path)
+
+        entry.load_seconds = time.perf_counter() - start
+        entry.memory_bytes = max(_rss_bytes() - rss_before, 0)
+        entry.model = model
+        entry.mtime = mtime
+        entry.last_check = time.monotonic()
+        entry.loads += 1
+        log.info("Model loaded from %s in %.2fs (+%.1f MiB)", entry.path, entry.load_seconds,
+                 entry.memory_bytes / 2 ** 20)
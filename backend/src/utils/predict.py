@@ -1,9 +1,18 @@
 import os
 import pickle as pkl
-import numpy as np
-import pandas as pd
-import cv2
-from tensorflow.keras.models import load_model as load_keras_model
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.inference_backends import OnnxModel, TFLiteModel
+from src.utils.metrics import metrics
+from src.utils.model_registry import ModelRegistry
+from src.utils.secrets import DISEASE_MODEL, MODEL_RELOAD_INTERVAL, TF_INTER_OP_THREADS, TF_INTRA_OP_THREADS
+
+# NumPy, pandas, OpenCV and TensorFlow take seconds to import, they are only imported for type checking here
+# and on first use in the functions, so the workers that never predict do not load them
+if typing.TYPE_CHECKING:
+    import cv2
+    import numpy as np
+    import pandas as pd
 
 INT_TO_CLASS = {
     0: 'Fungal',
@@ -15,43 +24,86 @@ INT_TO_CLASS = {
     6: 'Unknown'
 }
 
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+IRRIGATION_MODEL_PATH = os.path.join(MODEL_DIR, 'lgbm_model_Amritpal.pkl')
+# A file name is looked up in the model directory, an absolute path is used as it is
+DISEASE_MODEL_PATH = os.path.join(MODEL_DIR, DISEASE_MODEL)
+
 
 def load_model(path: str):
     """
-    Load the model from the file.
+    Load the model from the file, in the format given by its extension: Keras (.keras, .h5), TensorFlow Lite
+    (.tflite), ONNX (.onnx) or pickle (.pkl). The runtime of a format is only imported when a model uses it.
+    TensorFlow Lite and ONNX models are called like Keras models and use the TF_INTRA_OP_THREADS and
+    TF_INTER_OP_THREADS settings.
 
     :param path: str: Path to the model file.
     :return: Loaded model.
     """
     try:
         if path.endswith('.h5') or path.endswith('.keras'):
+            from tensorflow.keras.models import load_model as load_keras_model
             model = load_keras_model(path)
+        elif path.endswith('.tflite'):
+            model = TFLiteModel(path, num_threads=TF_INTRA_OP_THREADS)
+        elif path.endswith('.onnx'):
+            model = OnnxModel(path, intra_op_threads=TF_INTRA_OP_THREADS, inter_op_threads=TF_INTER_OP_THREADS)
         elif path.endswith('.pkl'):
             with open(path, 'rb') as file:
                 model = pkl.load(file)
+        else:
+            raise ValueError(f"Unsupported model file format: {path}")
     except FileNotFoundError:
         raise FileNotFoundError(f"Model file not found at {path}. Please check the path.")
     return model
 
 
-def predict_water(data: pd.DataFrame) -> list[int]:
+models = ModelRegistry(check_interval=MODEL_RELOAD_INTERVAL)
+models.register('irrigation', IRRIGATION_MODEL_PATH, load_model)
+models.register('disease', DISEASE_MODEL_PATH, load_model)
+metrics.register_stats('terraflow_model', 'Load statistics of the models', models.stats)
+
+
+def predict_water(data: 'pd.DataFrame') -> list[int]:
     """
     predict the output using the model.
 
     :param data: pd.DataFrame: DataFrame containing the input data.
     :return: list[int]: List of predictions.
     """
-    # Base directory of your project (e.g., where src/ lives)
-    PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-    # Now build the correct path
-    path = os.path.join(PROJECT_ROOT, 'utils', 'model', 'lgbm_model_Amritpal.pkl')
-    model = load_model(path)
+    model = models.get('irrigation')
     prediction = model.predict(data)
     return prediction
 
 
-def prepare_image(image: cv2.Mat, img_size=(224, 224)) -> np.ndarray:
+def configure_tf_threads(intra_op_threads: int, inter_op_threads: int) -> None:
+    """
+    Sets the number of threads TensorFlow uses. It must run before TensorFlow executes anything in the process.
+
+    :param intra_op_threads: int: Threads used within an operation, 0 lets TensorFlow decide.
+    :param inter_op_threads: int: Operations run in parallel, 0 lets TensorFlow decide.
+    :return: None
+    """
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def init_inference_worker(intra_op_threads: int, inter_op_threads: int) -> None:
+    """
+    Initializer of the inference worker processes: applies the threading config of the worker and loads
+    the disease model before the first request.
+
+    :param intra_op_threads: int: Threads used within an operation.
+    :param inter_op_threads: int: Operations run in parallel.
+    :return: None
+    """
+    configure_tf_threads(intra_op_threads, inter_op_threads)
+    models.preload(['disease'])
+
+
+def prepare_image(image: 'cv2.Mat', img_size=(224, 224)) -> 'np.ndarray':
     """
     Preprocess the image for prediction.
     This function should be customized based on the model's requirements.
@@ -60,6 +112,8 @@ def prepare_image(image: cv2.Mat, img_size=(224, 224)) -> np.ndarray:
     :param img_size: tuple: Desired size for the image (default is (224, 224)).
     :return: np.ndarray: Preprocessed image ready for prediction.
     """
+    import cv2
+    import numpy as np
 
     # Ensure correct resizing to the specified size
     resized_image = cv2.resize(image, img_size, interpolation=cv2.INTER_AREA)
@@ -72,27 +126,117 @@ def prepare_image(image: cv2.Mat, img_size=(224, 224)) -> np.ndarray:
     return normalized_image
 
 
-def predict_disease(img: cv2.Mat) -> dict[str, str | float]:
+def disease_result(probabilities: 'np.ndarray') -> dict[str, str | float]:
+    """
+    Converts the class probabilities of the disease model to a prediction.
+
+    :param probabilities: np.ndarray: The probability of each class for one image.
+    :return: dict[str, str | float]: Dictionary containing the prediction and confidence score.
+    """
+    max_index = int(probabilities.argmax())
+    return {
+        "prediction": INT_TO_CLASS.get(max_index, "Unknown"),
+        "confidence": float(probabilities[max_index])
+    }
+
+
+def predict_disease(img: 'cv2.Mat') -> dict[str, str | float]:
     """
     predict the disease from the image using the model.
 
     :param img: cv2.Mat: Input image in OpenCV format.
     :return: dict[str, str | float]: Dictionary containing the prediction and confidence score.
     """
-    PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    import numpy as np
+    model = models.get('disease')
 
-    print(f"Project root directory: {PROJECT_ROOT}")
+    processed_img = prepare_image(img, img_size=(224, 224))
+    # Calling the model directly avoids the per-call setup of model.predict on single images
+    prediction = np.asarray(model(processed_img, training=False))
+    return disease_result(prediction[0])
 
-    path = os.path.join(PROJECT_ROOT, 'utils', 'model', '128_resnetv50_1000_224_7.keras')
-    model = load_keras_model(path)
 
-    print(f"Model loaded from {path}")
+def decode_image(image_bytes: bytes) -> 'cv2.Mat' or None:
+    """
+    Decodes an encoded image (JPEG, PNG, ...) to RGB.
 
-    processed_img = prepare_image(img, img_size=(224, 224))
-    prediction = model.predict(processed_img)
-    max_index = np.argmax(prediction, axis=1)[0]
-    res = {
-        "prediction": INT_TO_CLASS[max_index] if max_index in INT_TO_CLASS else "Unknown",
-        "confidence": float(prediction[0][max_index])
-    }
-    return res
+    :param image_bytes: bytes: The encoded image.
+    :return: cv2.Mat or None: The decoded image, None if the bytes are not an image.
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
+
+
+def decode_and_prepare(image_bytes: bytes) -> 'np.ndarray' or None:
+    """
+    Decodes an encoded image and preprocesses it for the disease model.
+
+    :param image_bytes: bytes: The encoded image.
+    :return: np.ndarray or None: The preprocessed image, without the batch axis, None if the bytes are not an image.
+    """
+    image = decode_image(image_bytes)
+    if image is None:
+        return None
+    return prepare_image(image, img_size=(224, 224))[0]
+
+
+def predict_disease_image(image_bytes: bytes) -> dict[str, str | float]:
+    """
+    Decodes an encoded image (JPEG, PNG, ...) and predicts the disease it shows.
+    Runs in the inference workers, only the image bytes and the result cross the process boundary.
+
+    :param image_bytes: bytes: The encoded image.
+    :return: dict[str, str | float]: The prediction and confidence score, or an 'error' if the image is invalid.
+    """
+    image = decode_image(image_bytes)
+    if image is None:
+        return {"error": "Invalid image file"}
+    return predict_disease(image)
+
+
+def prepare_images(images: list[bytes], threads: int = 1) -> list['np.ndarray' or None]:
+    """
+    Decodes and preprocesses several images with a pool of threads, OpenCV releases the GIL while it works.
+
+    :param images: list[bytes]: The encoded images.
+    :param threads: int: Number of threads decoding the images.
+    :return: list[np.ndarray or None]: The preprocessed images in the same order, None for the invalid ones.
+    """
+    if threads <= 1 or len(images) <= 1:
+        return [decode_and_prepare(image) for image in images]
+    with ThreadPoolExecutor(max_workers=min(threads, len(images))) as pool:
+        return list(pool.map(decode_and_prepare, images))
+
+
+def predict_disease_images(images: list[bytes], threads: int = 1) -> dict:
+    """
+    Predicts the disease shown by several photos of the same plant.
+    The images are decoded and resized in parallel, then classified by a single forward pass of the model
+    over the whole batch.
+    The plant is classified by averaging the class probabilities of its valid images.
+
+    :param images: list[bytes]: The encoded images.
+    :param threads: int: Number of threads decoding the images.
+    :return: dict: The aggregate 'prediction' and 'confidence', the 'count' of valid images and the 'predictions'
+        of every image in the order received, an image that could not be decoded has an 'error' instead.
+        The 'error' of the whole request if no image is valid.
+    """
+    import numpy as np
+
+    prepared = prepare_images(images, threads)
+    predictions = [{"error": "Invalid image file"} for _ in images]
+    valid = [index for index, image in enumerate(prepared) if image is not None]
+    if not valid:
+        return {"error": "No valid image file", "count": 0, "predictions": predictions}
+
+    model = models.get('disease')
+    probabilities = np.asarray(model(np.stack([prepared[index] for index in valid]), training=False))
+    for index, image_probabilities in zip(valid, probabilities):
+        predictions[index] = disease_result(image_probabilities)
+
+    return {**disease_result(probabilities.mean(axis=0)), "count": len(valid), "predictions": predictions}
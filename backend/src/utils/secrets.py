@@ -1,15 +1,20 @@
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
 HOST = os.getenv("HOST")
 PORT = int(os.getenv("PORT", 5000))
+DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+USE_RELOADER = os.getenv("USE_RELOADER", "true").lower() == "true"
 ENCRYPT_KEY = os.getenv("ENCRYPT_KEY").encode()
 MQTT_BROKER = os.getenv("MQTT_BROKER", "broker.hivemq.com")
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", '')
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", '')
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", '')
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", '')
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -20,3 +25,40 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 500))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", 0.5))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 20000))
+INGEST_PUT_TIMEOUT = float(os.getenv("INGEST_PUT_TIMEOUT", 1.0))
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", 5.0))
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() == "true"
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", 256))
+PREDICT_MAX_LATENCY_MS = float(os.getenv("PREDICT_MAX_LATENCY_MS", 5))
+PREDICT_QUEUE_SIZE = int(os.getenv("PREDICT_QUEUE_SIZE", 10000))
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", 50000))
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", 300.0))
+DEVICE_MISS_TTL = float(os.getenv("DEVICE_MISS_TTL", 10.0))
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", 1000))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 1000))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 10000))
+EXPORT_DIR = os.getenv("EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "terraflow_exports")
+EXPORT_INLINE_MAX_BYTES = int(os.getenv("EXPORT_INLINE_MAX_BYTES", 5 * 1024 * 1024))
+EXPORT_TTL = int(os.getenv("EXPORT_TTL", 3600))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 2))
+EXPORT_MAX_JOBS = int(os.getenv("EXPORT_MAX_JOBS", 16))
+EXPORT_PROGRESS_EVERY = int(os.getenv("EXPORT_PROGRESS_EVERY", 10000))
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", 8))
+EXPORT_CACHE_TTL = float(os.getenv("EXPORT_CACHE_TTL", 60.0))
+EXPORT_ROW_GROUP_PERIOD = os.getenv("EXPORT_ROW_GROUP_PERIOD", "day")
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS") or os.cpu_count() or 1)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", 100))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 1))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 16))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", 30.0))
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS") or max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS)))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS") or 1)
+PREDICT_MAX_IMAGES = int(os.getenv("PREDICT_MAX_IMAGES", 16))
+DISEASE_MODEL = os.getenv("DISEASE_MODEL", "128_resnetv50_1000_224_7.keras")
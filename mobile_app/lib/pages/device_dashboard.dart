@@ -121,6 +121,13 @@ class _DeviceDashBoardState extends State<DeviceDashBoard> {
       if (data.containsKey('file')) {
         final fileData = Uint8List.fromList(data['file']);
         await saveToStorage(context, fileData, "exported_data.xlsx");
+      } else if (data.containsKey('url')) {
+        // Large exports are downloaded over HTTP instead of being sent through the socket
+        String baseUrl = kIsWeb ? Server.WEB_BASE_URL : Server.MOBILE_BASE_URL;
+        final response = await http.get(Uri.parse(baseUrl + data['url']));
+        if (response.statusCode == 200) {
+          await saveToStorage(context, response.bodyBytes, data['filename'] ?? "exported_data.xlsx");
+        }
       }
     });
 
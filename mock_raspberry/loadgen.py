@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import paho.mqtt.client as mqtt
+import socketio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5000")
+LOADGEN_TOKEN = os.getenv("LOADGEN_TOKEN")
+
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S"
+
+
+class LatencyRecorder:
+    """
+    Thread-safe collection of latency samples, fed from the MQTT network threads and the Socket.IO client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = []
+
+    def add(self, seconds: float) -> None:
+        """
+        Records one latency sample.
+
+        :param seconds: float: The latency in seconds.
+        :return: None
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def summary(self) -> dict:
+        """
+        Summarizes the recorded samples.
+
+        :return: dict: The 'count' of samples and the 'mean', 'p50', 'p90', 'p99' and 'max' latency in milliseconds.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': len(samples),
+            'mean': round(1000 * sum(samples) / len(samples), 3),
+            'p50': round(1000 * percentile(samples, 50), 3),
+            'p90': round(1000 * percentile(samples, 90), 3),
+            'p99': round(1000 * percentile(samples, 99), 3),
+            'max': round(1000 * samples[-1], 3),
+        }
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """
+    Returns a percentile of sorted samples using the nearest-rank method.
+
+    :param samples: list[float]: The samples, sorted in ascending order.
+    :param pct: float: The percentile (0-100).
+    :return: float: The sample at the percentile.
+    """
+    rank = max(1, -(-len(samples) * pct // 100))
+    return samples[int(rank) - 1]
+
+
+class SimulatedDevice:
+    """
+    State of one simulated device: its topics, its synthetic clock and the messages awaiting a response.
+    The device clock advances by one second per sensor record, so every record of a device has a unique
+    timestamp the Socket.IO emit can be matched with.
+    """
+
+    def __init__(self, device_id: str, client: mqtt.Client, start: datetime):
+        self.device_id = device_id
+        self.client = client
+        self.clock = start
+        self.pending_records = {}
+        self.pending_predictions = deque()
+
+    def next_timestamp(self) -> str:
+        """
+        Advances the device clock and returns the new timestamp.
+
+        :return: str: The timestamp in the "YYYY/MM/DD HH:MM:SS" format.
+        """
+        self.clock += timedelta(seconds=1)
+        return self.clock.strftime(TIMESTAMP_FORMAT)
+
+
+class LoadGenerator:
+    """
+    Simulates many devices in one process. The devices are spread over a few MQTT connections and each one
+    publishes sensor data, water usage and prediction requests at its own configured rate.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.clients = []
+        self.devices = []
+        self.by_id = {}
+        self.published = {'sensor_data': 0, 'water_used': 0, 'predict': 0}
+        self.errors = 0
+        self.record_latency = LatencyRecorder()
+        self.prediction_latency = LatencyRecorder()
+        self.watched = set()
+
+    def device_ids(self) -> list[str]:
+        """
+        Generates the IDs of the simulated devices. They are valid ObjectIds derived from the seed,
+        so repeated runs with the same seed reuse the devices registered by the previous run.
+
+        :return: list[str]: The device IDs.
+        """
+        return [f"{self.args.seed:08x}{index:016x}" for index in range(self.args.devices)]
+
+    def connect(self) -> None:
+        """
+        Opens the MQTT connections and assigns the devices to them round-robin.
+
+        :return: None
+        """
+        for index in range(min(self.args.clients, self.args.devices)):
+            client = mqtt.Client(
+                client_id=f"loadgen-{self.args.seed}-{index}",
+                clean_session=True,
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2
+            )
+            client.on_message = self.on_message
+            client.connect(self.args.broker, self.args.port)
+            client.loop_start()
+            self.clients.append(client)
+
+        start = datetime.now().replace(microsecond=0)
+        for index, device_id in enumerate(self.device_ids()):
+            device = SimulatedDevice(device_id, self.clients[index % len(self.clients)], start)
+            self.devices.append(device)
+            self.by_id[device_id] = device
+            if self.args.predict_rate > 0:
+                device.client.subscribe(f"{device_id}/prediction")
+
+    def register(self) -> None:
+        """
+        Publishes the registration of every device.
+
+        :return: None
+        """
+        for device in self.devices:
+            device.client.publish("register", json.dumps({'device_id': device.device_id}), qos=1)
+
+    def on_message(self, _client, _userdata, msg) -> None:
+        """
+        Matches a prediction with the oldest pending request of its device.
+
+        :param _client: paho.mqtt.client.Client: The MQTT client instance.
+        :param _userdata: Any: Unused user data.
+        :param msg: paho.mqtt.client.MQTTMessage: The received message.
+        :return: None
+        """
+        received = time.perf_counter()
+        device = self.by_id.get(msg.topic.split('/')[0])
+        if device is None:
+            return
+        try:
+            sent = device.pending_predictions.popleft()
+        except IndexError:
+            return
+        self.prediction_latency.add(received - sent)
+
+    def on_record(self, event: str, data: dict) -> None:
+        """
+        Matches a sensor record emitted by the backend over Socket.IO with its publish time.
+
+        :param event: str: The Socket.IO event name, "<device_id>/record" for sensor records.
+        :param data: dict: The emitted sensor record.
+        :return: None
+        """
+        received = time.perf_counter()
+        device_id, _, kind = event.partition('/')
+        device = self.by_id.get(device_id)
+        if kind != 'record' or device is None or not isinstance(data, dict):
+            return
+        sent = device.pending_records.pop(data.get('timestamp'), None)
+        if sent is None:
+            return
+        self.record_latency.add(received - sent)
+
+    def publish_sensor_data(self, device: SimulatedDevice) -> None:
+        """
+        Publishes one sensor record of a device.
+
+        :param device: SimulatedDevice: The device.
+        :return: None
+        """
+        timestamp = device.next_timestamp()
+        payload = json.dumps({
+            'sensor_data': {
+                "temperature": self.rng.uniform(20, 35),
+                "humidity": self.rng.uniform(40, 65),
+                "moisture": self.rng.uniform(15, 55),
+            },
+            'timestamp': timestamp
+        })
+        if device.device_id in self.watched:
+            device.pending_records[timestamp] = time.perf_counter()
+        self.count(device.client.publish(f"{device.device_id}/record/sensor_data", payload), 'sensor_data')
+
+    def publish_water_used(self, device: SimulatedDevice) -> None:
+        """
+        Publishes one water usage report of a device.
+
+        :param device: SimulatedDevice: The device.
+        :return: None
+        """
+        payload = json.dumps({
+            'water_used': self.rng.uniform(0.5, 5.0),
+            'date': device.clock.strftime("%Y/%m")
+        })
+        self.count(device.client.publish(f"{device.device_id}/record/water_used", payload), 'water_used')
+
+    def publish_predict(self, device: SimulatedDevice) -> None:
+        """
+        Publishes one prediction request of a device.
+
+        :param device: SimulatedDevice: The device.
+        :return: None
+        """
+        payload = json.dumps({
+            'sensor_data': {
+                "temperature": self.rng.uniform(15, 35),
+                "humidity": self.rng.uniform(30, 90),
+                "moisture": self.rng.uniform(0, 100),
+            },
+            'timestamp': device.clock.strftime(TIMESTAMP_FORMAT)
+        })
+        device.pending_predictions.append(time.perf_counter())
+        self.count(device.client.publish(f"{device.device_id}/predict", payload), 'predict')
+
+    def count(self, info: mqtt.MQTTMessageInfo, topic: str) -> None:
+        """
+        Counts a publish, or an error if the client refused it.
+
+        :param info: paho.mqtt.client.MQTTMessageInfo: The result of the publish.
+        :param topic: str: The kind of message published.
+        :return: None
+        """
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published[topic] += 1
+        else:
+            self.errors += 1
+
+    async def run_device(self, device: SimulatedDevice, deadline: float) -> None:
+        """
+        Publishes the messages of a device until the deadline. Each kind of message follows a Poisson process
+        with the configured rate, so the devices do not publish in lockstep.
+
+        :param device: SimulatedDevice: The device.
+        :param deadline: float: The event loop time the device stops at.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        schedule = [
+            (rate, publish, loop.time() + self.rng.expovariate(rate))
+            for rate, publish in ((self.args.sensor_rate, self.publish_sensor_data),
+                                  (self.args.water_rate, self.publish_water_used),
+                                  (self.args.predict_rate, self.publish_predict))
+            if rate > 0
+        ]
+        while schedule:
+            schedule.sort(key=lambda entry: entry[2])
+            rate, publish, due = schedule[0]
+            if due >= deadline:
+                return
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            publish(device)
+            schedule[0] = (rate, publish, due + self.rng.expovariate(rate))
+
+    async def subscribe_socketio(self) -> socketio.AsyncClient or None:
+        """
+        Connects the simulated user to the backend and watches a sample of the devices.
+
+        :return: socketio.AsyncClient or None: The connected client, or None without a token.
+        """
+        if not self.args.token:
+            print("No token given, the Socket.IO latency is not measured")
+            return None
+
+        sample = self.devices[:self.args.watch]
+        self.watched = {device.device_id for device in sample}
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.on('*', self.on_record)
+        await sio.connect(self.args.backend_url, transports=['websocket'])
+        await sio.emit('init', {'token': self.args.token, 'devices': sorted(self.watched)})
+        return sio
+
+    async def run(self) -> dict:
+        """
+        Runs the load test and returns its results.
+
+        :return: dict: The configuration, the message counts, the throughput and the latency percentiles.
+        """
+        self.connect()
+        if self.args.register:
+            self.register()
+            await asyncio.sleep(self.args.register_wait)
+
+        sio = await self.subscribe_socketio()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(self.run_device(device, deadline) for device in self.devices))
+        elapsed = loop.time() - started
+
+        # Let the responses of the last messages arrive
+        await asyncio.sleep(self.args.drain)
+
+        if sio is not None:
+            await sio.disconnect()
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+        total = sum(self.published.values())
+        return {
+            'config': {
+                'devices': self.args.devices,
+                'clients': len(self.clients),
+                'sensor_rate': self.args.sensor_rate,
+                'water_rate': self.args.water_rate,
+                'predict_rate': self.args.predict_rate,
+                'duration': self.args.duration,
+                'watched': len(self.watched),
+            },
+            'elapsed_s': round(elapsed, 3),
+            'published': self.published,
+            'errors': self.errors,
+            'throughput_msgs_per_s': round(total / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {
+                'sensor_data_to_socketio': self.record_latency.summary(),
+                'predict_to_prediction': self.prediction_latency.summary(),
+            },
+            'unanswered': {
+                'record': sum(len(device.pending_records) for device in self.devices),
+                'prediction': sum(len(device.pending_predictions) for device in self.devices),
+            },
+        }
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses the command line, the connection settings default to the environment.
+
+    :return: argparse.Namespace: The load test settings.
+    """
+    parser = argparse.ArgumentParser(description="Simulate many devices against a local broker and backend.")
+    parser.add_argument('--devices', type=int, default=1000, help="number of simulated devices")
+    parser.add_argument('--clients', type=int, default=10, help="MQTT connections the devices are spread over")
+    parser.add_argument('--sensor-rate', type=float, default=0.1, help="sensor records per second per device")
+    parser.add_argument('--water-rate', type=float, default=0.01, help="water usage reports per second per device")
+    parser.add_argument('--predict-rate', type=float, default=0.01, help="predictions per second per device")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds to publish for")
+    parser.add_argument('--drain', type=float, default=5.0, help="seconds to wait for responses at the end")
+    parser.add_argument('--register', action='store_true', help="register the devices before publishing")
+    parser.add_argument('--register-wait', type=float, default=5.0, help="seconds to wait after registering")
+    parser.add_argument('--watch', type=int, default=100, help="devices the Socket.IO subscriber watches")
+    parser.add_argument('--broker', default=MQTT_BROKER)
+    parser.add_argument('--port', type=int, default=MQTT_PORT)
+    parser.add_argument('--backend-url', default=BACKEND_URL)
+    parser.add_argument('--token', default=LOADGEN_TOKEN, help="JWT of the simulated user")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="file the JSON results are written to, stdout by default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(LoadGenerator(args).run())
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()